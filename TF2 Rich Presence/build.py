@@ -100,6 +100,11 @@ def main(version_num='v2.2.4'):
         print("Copied", shutil.copy('configs.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('gamemodes.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('processes.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
+        print("Copied", shutil.copy('discord_ipc.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
+        print("Copied", shutil.copy('file_watch.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
+        print("Copied", shutil.copy('process_events.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
+        print("Copied", shutil.copy('scheduler.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
+        print("Copied", shutil.copy('session_log.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('updater.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('settings.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('settings_gui.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
@@ -112,6 +117,9 @@ def main(version_num='v2.2.4'):
         print("Copied", shutil.copy('generate_deleted_pycs.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('webp_converter.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('changelog_generator.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
+        print("Copied", shutil.copy('console_log_benchmark.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
+        print("Copied", shutil.copy('logger_benchmark.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
+        print("Copied", shutil.copy('session_log_query.py', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('Changelogs_source.html', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('maps.json', Path(f'{github_repo_path}/TF2 Rich Presence')))
         print("Copied", shutil.copy('main menu.png', Path(f'{github_repo_path}/TF2 Rich Presence')))
@@ -240,6 +248,11 @@ def main(version_num='v2.2.4'):
     copy_dir('gui_images', Path(f'{new_build_folder_name}/resources/gui_images/'))
     copy_dir('locales', Path(f'{new_build_folder_name}/locales/'))
 
+    # so that launching never needs to compile it (or read the JSON files)
+    import localization
+    localization.compile_catalog(str(Path(f'{new_build_folder_name}/locales/catalog.bin')))
+    print("Compiled localization catalog")
+
     # build PYDs using Cython and copy them in
     if not nocython:
         compile_command = f'{sys.executable} cython_compile.py build_ext --inplace'
@@ -309,7 +322,7 @@ def main(version_num='v2.2.4'):
     os.mkdir(new_packages_dir)
     venv_packages_dir = site.getsitepackages()[1]
     assert 'site-packages' in venv_packages_dir.lower()
-    needed_packages = ('PIL', 'pillow', 'certifi', 'charset_normalizer', 'idna', 'psutil', 'python-a2s', 'requests', 'requests_futures', 'sentry_sdk', 'urllib3', 'vdf', 'discoIPC')
+    needed_packages = ('PIL', 'pillow', 'certifi', 'charset_normalizer', 'idna', 'psutil', 'python-a2s', 'requests', 'requests_futures', 'sentry_sdk', 'urllib3', 'vdf')
     for site_package in os.listdir(venv_packages_dir):
         for needed_package in needed_packages:
             if needed_package in site_package and 'requests_cache' not in site_package:
@@ -318,7 +331,7 @@ def main(version_num='v2.2.4'):
                 shutil.copytree(site_package_path, new_package_dir)
                 break
     shutil.copy(Path(f'{venv_packages_dir}/ujson.{interpreter_prefix}-win_amd64.pyd'), new_packages_dir)
-    print(f"Copied {len(needed_packages) + 1} packages from {venv_packages_dir} to {new_packages_dir}")
+    print(f"Copied {len(os.listdir(new_packages_dir))} packages (and their dist-infos) from {venv_packages_dir} to {new_packages_dir}")
     list(Path(f'{new_packages_dir}\\PIL').glob('_avif.*.pyd'))[0].unlink()
     print("Deleted PIL avif")
 
@@ -344,9 +357,10 @@ def main(version_num='v2.2.4'):
     # ensure everything exists that needs to
     assert os.listdir(Path(f'{new_build_folder_name}/resources/__pycache__')) != []
     assert os.listdir(Path(f'{new_build_folder_name}/resources/{interpreter_name}')) != []
-    assert len(os.listdir(Path(f'{new_build_folder_name}/resources/packages'))) == 23
+    assert len(os.listdir(Path(f'{new_build_folder_name}/resources/packages'))) == 21
     assert len(os.listdir(Path(f'{new_build_folder_name}/resources/gui_images'))) == 13
-    assert len(os.listdir(Path(f'{new_build_folder_name}/locales'))) == 13
+    assert len(os.listdir(Path(f'{new_build_folder_name}/locales'))) == 14
+    assert os.path.isfile(Path(f'{new_build_folder_name}/locales/catalog.bin'))
     assert os.path.isfile(Path(f'{new_build_folder_name}/TF2 Rich Presence.bat'))
     assert os.path.isfile(Path(f'{new_build_folder_name}/Changelogs.html'))
     assert os.path.isfile(Path(f'{new_build_folder_name}/License.txt'))
@@ -3,13 +3,18 @@
 # cython: language_level=3
 
 import os
-import winreg
-from typing import Callable, List, Optional, Tuple, Union, Set
+import re
+import sys
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple, Union
 
 import vdf
 
 import console_log
 import logger
+import utils
+
+if sys.platform == 'win32':
+    import winreg
 
 
 # allows for detecting which class the user is playing as
@@ -82,9 +87,7 @@ def steam_config_file(self, exe_location: str, require_condebug: bool) -> Option
         global_config_file_path: str = os.path.join(exe_location, 'userdata', user_id_folder, 'config', 'localconfig.vdf')
 
         try:
-            with open(global_config_file_path, 'r', errors='replace') as global_config_file:
-                global_config_file_read: str = global_config_file.read()
-                global_config_file_size: int = os.stat(global_config_file_path).st_size
+            local_config: Optional[LocalConfig] = self.localconfig_cache.read(self.log, global_config_file_path)
         except FileNotFoundError:
             self.log.debug(f"Couldn't find {global_config_file_path}")
             continue
@@ -92,49 +95,28 @@ def steam_config_file(self, exe_location: str, require_condebug: bool) -> Option
             self.log.error(f"Couldn't read {global_config_file_path}: {str(error)}")
             continue
 
-        self.log.debug(f"Reading {global_config_file_path}")
+        if not local_config:
+            continue
 
         if require_condebug:
-            if '"440"' not in global_config_file_read or '-condebug' not in global_config_file_read:
+            if not local_config.has_tf2 or not local_config.mentions_condebug:
                 continue
             else:
-                self.log.debug(f"\"440\" found, parsing file ({global_config_file_size} bytes)")
-        else:
-            self.log.debug(f"Parsing file ({global_config_file_size} bytes)")
-
-        try:
-            parsed: dict = vdf.loads(global_config_file_read)
-        except SyntaxError as error:
-            self.log.error(f"Couldn't parse user VDF ({error})'")
-            continue
-
-        self.log.debug(f"User VDF parse complete ({len(parsed['UserLocalConfigStore'])} keys)")
-        parsed_lowercase: dict = lowercase_keys(parsed)
-        self.log.debug(f"Lowercase complete ({len(parsed_lowercase['userlocalconfigstore'])} keys)")
-
-        try:
-            username: Optional[str] = parsed_lowercase['userlocalconfigstore']['friends']['personaname']
-        except KeyError:
-            username = None
-
-        try:
-            tf2_savedata: dict = parsed_lowercase['userlocalconfigstore']['software']['valve']['steam']['apps']['440']
-        except KeyError:
-            pass  # (hopefully) -condebug was in some other game
-        else:
-            last_played_time: int = int(tf2_savedata['lastplayed']) if 'lastplayed' in tf2_savedata else 0
-            launch_options: str = tf2_savedata['launchoptions'] if 'launchoptions' in tf2_savedata else ''
+                self.log.debug("\"440\" found")
 
-            if username in self.usernames or last_played_time > most_likely_args[0]:
-                most_likely_args = (last_played_time, launch_options)
+        if local_config.has_tf2:
+            if local_config.persona_name in self.usernames or local_config.last_played > most_likely_args[0]:
+                most_likely_args = (local_config.last_played, local_config.launch_options)
 
-            if require_condebug and '-condebug' in tf2_savedata['launchoptions']:
+            if require_condebug and '-condebug' in local_config.launch_options:
                 found_condebug = True
-                self.log.debug(f"Found -condebug in launch options ({launch_options})")
+                self.log.debug(f"Found -condebug in launch options ({local_config.launch_options})")
+        # else (hopefully) -condebug was in some other game
 
-        config_mtime: int = int(os.stat(global_config_file_path).st_mtime)
-        self.steam_config_mtimes[global_config_file_path] = config_mtime
-        self.log.debug(f"Added mtime ({config_mtime})")
+        self.steam_config_mtimes[global_config_file_path] = local_config.mtime
+        self.log.debug(f"Added mtime ({local_config.mtime})")
+
+    self.localconfig_cache.save()
 
     if not found_condebug and require_condebug:
         self.log.error("-condebug not found, telling user", reportable=False)
@@ -145,8 +127,272 @@ def steam_config_file(self, exe_location: str, require_condebug: bool) -> Option
         return most_likely_args[1]
 
 
+# the only parts of a localconfig.vdf that are ever used
+class LocalConfig(NamedTuple):
+    mtime: int
+    persona_name: Optional[str] = None
+    has_tf2: bool = False
+    last_played: int = 0
+    launch_options: str = ''
+    mentions_condebug: bool = False  # anywhere in the file, not just TF2's launch options
+
+
+# remembers what was extracted from each localconfig.vdf, which is only trusted while the file's mtime and size haven't changed. persisted in the DB
+class LocalConfigCache:
+    def __init__(self, persist: bool = True):
+        self.persist: bool = persist
+        self.entries: Optional[Dict[str, dict]] = None if persist else {}
+        self.changed: bool = False
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __repr__(self) -> str:
+        return f"configs.LocalConfigCache ({len(self.entries) if self.entries is not None else 'not loaded'} files, {self.hits} hits, {self.misses} misses)"
+
+    # raises OSError if the file can't be read, returns None if it can't be parsed
+    def read(self, log: logger.Log, path: str) -> Optional[LocalConfig]:
+        if self.entries is None:
+            self.entries = utils.access_db().get('localconfig_cache', {})
+
+        try:
+            config_stat: os.stat_result = os.stat(path)
+        except FileNotFoundError:
+            if self.entries.pop(path, None):
+                self.changed = True
+
+            raise
+
+        stat_key: List[int] = [config_stat.st_mtime_ns, config_stat.st_size]
+
+        try:
+            if self.entries[path]['stat'] == stat_key:
+                self.hits += 1
+                log.debug(f"{path} is unchanged ({config_stat.st_size} bytes), using cached contents")
+                return LocalConfig(**self.entries[path]['config'])
+        except (KeyError, TypeError):
+            pass
+
+        self.misses += 1
+        log.debug(f"Reading {path} ({config_stat.st_size} bytes)")
+
+        with open(path, 'rb') as config_file:
+            config_read: bytes = config_file.read()
+
+        try:
+            local_config: LocalConfig = extract_localconfig(config_read, int(config_stat.st_mtime))
+        except SyntaxError as error:
+            log.error(f"Couldn't parse user VDF ({error})'")
+            return None
+
+        log.debug(f"Extracted {local_config}")
+        self.entries[path] = {'stat': stat_key, 'config': local_config._asdict()}
+        self.changed = True
+        return local_config
+
+    def save(self):
+        if self.persist and self.changed:
+            db: Dict[str, Union[bool, list, str, dict]] = utils.access_db()
+            db['localconfig_cache'] = self.entries
+            utils.access_db(db)
+
+        self.changed = False
+
+
+# pulls persona name and TF2's launch options out of a localconfig.vdf without tokenizing any of the (huge) blocks that don't lead to them
+# key matching is case-insensitive and duplicate keys are merged, same as vdf.loads + lowercase_keys() used to do
+def extract_localconfig(config_read: bytes, mtime: int) -> LocalConfig:
+    found: Dict[str, str] = {}
+    has_tf2: bool = False
+    path: Tuple[bytes, ...] = ()
+    key: Optional[bytes] = None
+    position: int = 3 if config_read.startswith(b'\xef\xbb\xbf') else 0  # UTF8 BOM
+
+    while True:
+        if key is None:
+            # steps over every following "key" {block} that doesn't lead anywhere, in one regex match
+            position = localconfig_skip_regexes[path].match(config_read, position).end()
+
+        token: Optional[re.Match] = vdf_token_regex.search(config_read, position)
+
+        if not token:
+            break
+
+        position = token.end()
+        group: int = token.lastindex
+
+        if group == 1 or group == 4:  # a quoted or unquoted string
+            if key is None:
+                key = token.group(group)
+            else:
+                if path in localconfig_wanted_values and key.lower() in localconfig_wanted_values[path]:
+                    found[key.lower().decode()] = vdf_unescape(token.group(group).decode('UTF8', errors='replace'))
+
+                key = None
+        elif group == 2:  # {
+            if key is None:
+                raise SyntaxError(f"opening brace without a key at byte {token.start()}")
+
+            if path + (key.lower(),) in localconfig_skip_regexes:
+                path += (key.lower(),)
+                has_tf2 = has_tf2 or path == localconfig_tf2_path
+            else:
+                position = skip_vdf_block(config_read, position)
+
+            key = None
+        elif group == 3:  # }
+            if key is not None or not path:
+                raise SyntaxError(f"unexpected closing brace at byte {token.start()}")
+
+            path = path[:-1]
+        elif group == 5:
+            raise SyntaxError(f"unclosed quote at byte {token.start()}")
+
+    if path or key is not None:
+        raise SyntaxError("unexpected end of file")
+
+    last_played: str = found.get('lastplayed', '0')
+    return LocalConfig(mtime=mtime,
+                       persona_name=found.get('personaname'),
+                       has_tf2=has_tf2,
+                       last_played=int(last_played) if last_played.isdigit() else 0,
+                       launch_options=found.get('launchoptions', ''),
+                       mentions_condebug=b'-condebug' in config_read)
+
+
+# returns the position just after the brace that closes the block that was just opened
+def skip_vdf_block(config_read: bytes, position: int) -> int:
+    block_rest: Optional[re.Match] = vdf_block_rest_regex.match(config_read, position)
+
+    if block_rest:
+        return block_rest.end()
+
+    # nested too deeply for the regex (or broken), so go brace by brace
+    depth: int = 1
+
+    while depth:
+        brace: Optional[re.Match] = vdf_brace_regex.match(config_read, position)
+
+        if not brace:
+            raise SyntaxError("unexpected end of file")
+        elif brace.group(1) == b'"':
+            raise SyntaxError(f"unclosed quote at byte {brace.start(1)}")
+
+        depth += 1 if brace.group(1) == b'{' else -1
+        position = brace.end()
+
+    return position
+
+
+def vdf_unescape(text: str) -> str:
+    return vdf_escape_regex.sub(lambda match: vdf_unescapes[match.group()], text) if '\\' in text else text
+
+
+# matches a {block} with up to max_depth levels of blocks in it, since re doesn't do recursion
+def vdf_block_pattern(max_depth: int) -> bytes:
+    block_pattern: bytes = rb'\{(?:[^{}"]++|' + vdf_string_pattern + rb')*+\}'
+
+    for _ in range(max_depth - 1):
+        block_pattern = rb'\{(?:[^{}"]++|' + vdf_string_pattern + rb'|' + block_pattern + rb')*+\}'
+
+    return block_pattern
+
+
+# matches any number of "key" {block} pairs (and whitespace) whose keys aren't descend_keys. stops before anything else, like "key" "value" pairs
+def vdf_skip_pattern(descend_keys: Set[bytes]) -> bytes:
+    key_pattern: bytes = rb'"(?!(?i:' + b'|'.join(re.escape(key) for key in descend_keys) + rb')")' if descend_keys else rb'"'
+    return rb'(?:\s++|' + key_pattern + rb'(?:[^"\\]|\\.)*+"\s*+' + vdf_block_pattern(8) + rb')*+'
+
+
+vdf_string_pattern: bytes = rb'"(?:[^"\\]|\\.)*+"'
+vdf_token_regex: re.Pattern = re.compile(rb'"((?:[^"\\]|\\.)*)"|(\{)|(\})|//[^\n]*|([^\s{}"]+)|(")', re.DOTALL)
+vdf_brace_regex: re.Pattern = re.compile(rb'(?:[^{}"]++|' + vdf_string_pattern + rb')*+([{}"])', re.DOTALL)
+vdf_block_rest_regex: re.Pattern = re.compile(rb'(?:[^{}"]++|' + vdf_string_pattern + rb'|' + vdf_block_pattern(8) + rb')*+\}', re.DOTALL)
+vdf_unescapes: Dict[str, str] = {r'\n': '\n', r'\t': '\t', r'\v': '\v', r'\b': '\b', r'\r': '\r', r'\f': '\f', r'\a': '\a', '\\\\': '\\', r'\?': '?', r'\"': '"', r"\'": "'"}
+vdf_escape_regex: re.Pattern = re.compile('|'.join(re.escape(escape) for escape in vdf_unescapes))
+localconfig_tf2_path: Tuple[bytes, ...] = (b'userlocalconfigstore', b'software', b'valve', b'steam', b'apps', b'440')
+localconfig_wanted_values: Dict[Tuple[bytes, ...], Tuple[bytes, ...]] = {(b'userlocalconfigstore', b'friends'): (b'personaname',), localconfig_tf2_path: (b'lastplayed', b'launchoptions')}
+localconfig_descend: Dict[Tuple[bytes, ...], Set[bytes]] = {(): {b'userlocalconfigstore'}, (b'userlocalconfigstore',): {b'friends', b'software'}, (b'userlocalconfigstore', b'friends'): set(),
+                                                            **{localconfig_tf2_path[:depth]: {localconfig_tf2_path[depth]} for depth in range(2, len(localconfig_tf2_path))}, localconfig_tf2_path: set()}
+localconfig_skip_regexes: Dict[Tuple[bytes, ...], re.Pattern] = {path: re.compile(vdf_skip_pattern(keys), re.DOTALL) for path, keys in localconfig_descend.items()}
+
+
+# remembers where TF2 was found for each Steam install, which is trusted until its steam_appid.txt or Steam's libraryfolders.vdf change. persisted in the DB
+class TF2InstallCache:
+    def __init__(self, persist: bool = True):
+        self.persist: bool = persist
+        self.entries: Optional[Dict[str, dict]] = None if persist else {}
+
+    def __repr__(self) -> str:
+        return f"configs.TF2InstallCache ({self.entries})"
+
+    def lookup(self, log: logger.Log, steam_location: str) -> Optional[str]:
+        if self.entries is None:
+            self.entries = utils.access_db().get('tf2_install_cache', {})
+
+        try:
+            entry: dict = self.entries[steam_location]
+            valid: bool = entry['appid_stat'] == stat_key(appid_path(entry['path'])) and entry['libraryfolders_stat'] == stat_key(libraryfolders_path(steam_location))
+        except (KeyError, TypeError):
+            return None
+
+        if valid:
+            log.debug(f"Using cached TF2 install location ({entry['path']})")
+            return entry['path']
+        else:
+            log.debug(f"Cached TF2 install location ({entry['path']}) is outdated")
+            del self.entries[steam_location]
+            self.save()
+            return None
+
+    def store(self, steam_location: str, exe_location: str):
+        if self.entries is None:
+            self.entries = utils.access_db().get('tf2_install_cache', {})
+
+        self.entries[steam_location] = {'path': exe_location, 'appid_stat': stat_key(appid_path(exe_location)), 'libraryfolders_stat': stat_key(libraryfolders_path(steam_location))}
+        self.save()
+
+    def save(self):
+        if self.persist:
+            db: Dict[str, Union[bool, list, str, dict]] = utils.access_db()
+            db['tf2_install_cache'] = self.entries
+            utils.access_db(db)
+
+
+# [mtime in ns, size], or None if the file doesn't exist. JSON-friendly so that it can be persisted and compared later
+def stat_key(path: str) -> Optional[List[int]]:
+    try:
+        path_stat: os.stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return [path_stat.st_mtime_ns, path_stat.st_size]
+
+
+def appid_path(exe_location: str) -> str:
+    return os.path.join(os.path.dirname(exe_location), 'steam_appid.txt')
+
+
+def libraryfolders_path(steam_location: str) -> str:
+    return os.path.join(steam_location, 'steamapps', 'libraryfolders.vdf')
+
+
 # given Steam's install, find a TF2 install
 def find_tf2_exe(self, steam_location: str) -> Optional[str]:
+    cached_path: Optional[str] = self.tf2_install_cache.lookup(self.log, steam_location)
+
+    if cached_path:
+        return cached_path
+
+    found_path: Optional[str] = find_tf2_exe_uncached(self, steam_location)
+
+    if found_path:
+        self.tf2_install_cache.store(steam_location, found_path)
+
+    return found_path
+
+
+# the slow part of find_tf2_exe(), which can mean reading through every Steam library
+def find_tf2_exe_uncached(self, steam_location: str) -> Optional[str]:
     extend_path: Callable[[str], str] = lambda path: os.path.join(path, 'steamapps', 'common', 'Team Fortress 2', 'tf_win64.exe')
     default_path: str = extend_path(steam_location)
 
@@ -155,7 +401,7 @@ def find_tf2_exe(self, steam_location: str) -> Optional[str]:
 
     self.log.debug("Reading libraryfolders.vdf for TF2 installation")
 
-    with open(os.path.join(steam_location, 'steamapps', 'libraryfolders.vdf'), 'r', encoding='UTF8', errors='replace') as libraryfolders_vdf:
+    with open(libraryfolders_path(steam_location), 'r', encoding='UTF8', errors='replace') as libraryfolders_vdf:
         libraryfolders_vdf_read: dict = vdf.load(libraryfolders_vdf)
 
     if 'LibraryFolders' in libraryfolders_vdf_read:
@@ -185,10 +431,10 @@ def is_tf2_install(log: logger.Log, exe_location: str) -> bool:
         return False
 
     is_tf2: bool = False
-    appid_path: str = os.path.join(os.path.dirname(exe_location), 'steam_appid.txt')
+    appid_file_path: str = appid_path(exe_location)
 
-    if os.path.isfile(appid_path):
-        with open(appid_path, 'rb') as appid_file:
+    if os.path.isfile(appid_file_path):
+        with open(appid_file_path, 'rb') as appid_file:
             appid_read: bytes = appid_file.read()
 
             if appid_read.startswith(b'440\n'):
@@ -206,30 +452,58 @@ def is_tf2_install(log: logger.Log, exe_location: str) -> bool:
         return False
 
 
-# Steam seems to update this often enough
-def get_steam_username() -> str:
-    key: winreg.HKEYType = winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"SOFTWARE\\Valve\\Steam\\")
-    username: str = winreg.QueryValueEx(key, 'LastGameNameUsed')[0]
-    key.Close()
-    return username
+# Steam seems to update this often enough. on Linux, Steam keeps the same values in ~/.steam/registry.vdf instead (None if that can't be read)
+def get_steam_username() -> Optional[str]:
+    if sys.platform == 'win32':
+        key: winreg.HKEYType = winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"SOFTWARE\\Valve\\Steam\\")
+        username: str = winreg.QueryValueEx(key, 'LastGameNameUsed')[0]
+        key.Close()
+        return username
 
+    return registry_username_cache.lookup(os.path.join(os.path.expanduser('~'), '.steam', 'registry.vdf'))
 
-# lowercases all the keys in a complex dictionary
-def lowercase_keys(mixed_case: Union[dict, list]) -> Union[dict, list]:
-    key: str
 
-    for key in list(mixed_case):
-        key_lower: str = key.lower()
+# this gets checked every loop, so only parse registry.vdf again when its stat_key changes
+class RegistryUsernameCache:
+    def __init__(self):
+        self.entries: Dict[str, Tuple[List[int], Optional[str]]] = {}
+        self.parses: int = 0
 
-        if key_lower in allowed_keys:
-            mixed_case[key_lower] = mixed_case.pop(key)
+    def __repr__(self) -> str:
+        return f"configs.RegistryUsernameCache ({len(self.entries)} entries, {self.parses} parses)"
 
-            if isinstance(mixed_case[key_lower], dict) or isinstance(mixed_case[key_lower], list):
-                mixed_case[key_lower] = lowercase_keys(mixed_case[key_lower])
-        else:
-            del mixed_case[key]
+    def lookup(self, registry_path: str) -> Optional[str]:
+        registry_stat: Optional[List[int]] = stat_key(registry_path)
+
+        if registry_stat is None:
+            self.entries.pop(registry_path, None)
+            return None
+
+        cached: Optional[Tuple[List[int], Optional[str]]] = self.entries.get(registry_path)
+
+        if cached and cached[0] == registry_stat:
+            return cached[1]
+
+        username: Optional[str] = read_registry_username(registry_path)
+        self.parses += 1
+        self.entries[registry_path] = (registry_stat, username)
+        return username
+
+
+def read_registry_username(registry_path: str) -> Optional[str]:
+    try:
+        with open(registry_path, 'r', encoding='UTF8', errors='replace') as registry_vdf:
+            registry: Union[dict, str] = vdf.load(registry_vdf)
+    except (OSError, SyntaxError):
+        return None
+
+    for key in ('registry', 'hkcu', 'software', 'valve', 'steam', 'lastgamenameused'):
+        if not isinstance(registry, dict):
+            return None
+
+        registry = {registry_key.lower(): value for registry_key, value in registry.items()}.get(key)
 
-    return mixed_case
+    return registry if isinstance(registry, str) and registry else None
 
 
-allowed_keys: Set[str] = {'userlocalconfigstore', 'friends', 'personaname', 'userlocalconfigstore', 'software', 'valve', 'steam', 'apps', '440', 'launchoptions', 'lastplayed'}
+registry_username_cache: RegistryUsernameCache = RegistryUsernameCache()
@@ -7,7 +7,7 @@ import functools
 import os
 import re
 import tkinter.font
-from typing import Dict, List, Optional, Set, Tuple, Pattern
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Pattern, Union
 
 import logger
 import settings
@@ -38,161 +38,253 @@ class ConsoleLogPersistence:
     is_mvm: bool = False
 
 
-# reads a console.log and returns as much game state as possible, alternatively None if whether an old scan was reused
-def interpret(self, console_log_path: str, user_usernames: Set[str], force: bool = False, from_game_state: Optional = None, tf2_start_time: int = 0) -> Optional[ConsoleLogParsed]:
-    TF2_LOAD_TIME_ASSUMPTION: int = 10
+# reads console.log in fixed-size binary chunks and yields one line at a time, so memory use stays flat no matter how big the file gets
+class ConsoleLogTailer:
+    def __init__(self, path: str, position: int = 0, chunk_size: int = 65536):
+        self.path: str = path
+        self.position: int = position  # byte offset just after the last yielded line, which is what gets saved as file_position
+        self.chunk_size: int = chunk_size
+        self.bytes_read: int = 0
+        self.lines_read: int = 0
+        self.queue_search_stopped_at: Optional[int] = None  # where find_session_start() stopped looking for a queue line, if it found TF2 being launched first
 
-    # defaults
-    parse_results = ConsoleLogParsed()
-    in_menus: bool = parse_results.in_menus
-    tf2_map: str = parse_results.tf2_map
-    tf2_class: str = parse_results.tf2_class
-    queued_state: str = parse_results.queued_state
-    hosting: bool = parse_results.hosting
-    server_players: int = parse_results.server_players
-    server_players_max: int = parse_results.server_players_max
+    def __repr__(self) -> str:
+        return f"console_log.ConsoleLogTailer ({self.path}, position={self.position}, read {self.bytes_read} bytes and {self.lines_read} lines)"
 
-    # if we already have a game state and file position, just update the state from the new lines since then
-    if from_game_state:
-        in_menus = from_game_state.in_menus
-        tf2_map = from_game_state.tf2_map
-        tf2_class = from_game_state.tf2_class
-        queued_state = from_game_state.queued_state
-        hosting = from_game_state.hosting
-        server_players = from_game_state.server_players[0]
-        server_players_max = from_game_state.server_players[1]
-        persistence: ConsoleLogPersistence = from_game_state.console_log_persistence
-    else:
-        persistence = ConsoleLogPersistence()
+    # lines are decoded lazily and keep their line endings, same as splitlines(keepends=True) used to give
+    def lines(self) -> Iterator[str]:
+        with open(self.path, 'rb') as consolelog_file:
+            consolelog_file.seek(self.position)  # skip to last saved position
+            partial: bytes = b''
 
-    def store_parsing_persistence(default: bool):
-        if default:
-            self.game_state.console_log_persistence = ConsoleLogPersistence()
-        else:
-            self.game_state.console_log_persistence = ConsoleLogPersistence(file_position, just_started_server, server_still_running, connecting_to_matchmaking,
-                                                                            in_community_server, found_first_wav_cache, kataiser_seen_on, server_name_full, is_mvm)
+            while True:
+                chunk: bytes = consolelog_file.read(self.chunk_size)
 
-    # console.log is a log of tf2's console (duh), only exists if tf2 has -condebug (see no_condebug_warning() in GUI)
-    self.log.debug(f"Looking for console.log at {console_log_path}")
+                if not chunk:
+                    break
 
-    if not os.path.isfile(console_log_path):
-        self.log.error(f"console.log doesn't exist, issuing warning (files/dirs in /tf/: {os.listdir(os.path.dirname(console_log_path))})", reportable=False)
-        self.no_condebug = False
-        store_parsing_persistence(True)
-        return parse_results  # might as well
+                self.bytes_read += len(chunk)
+                buffer: bytes = partial + chunk if partial else chunk
+                line_start: int = 0
 
-    # only interpret console.log again if it's been modified
-    self.console_log_mtime = int(os.stat(console_log_path).st_mtime)
-    if not force and self.console_log_mtime == self.old_console_log_mtime:
-        self.log.debug("Not rescanning console.log")
-        return None
+                while True:
+                    line_end: int = buffer.find(b'\n', line_start) + 1
 
-    # TF2 takes some time to load the console when starting up, so wait until it's been modified to avoid getting outdated information
-    console_log_mtime_relative: int = self.console_log_mtime - tf2_start_time
-    if console_log_mtime_relative <= TF2_LOAD_TIME_ASSUMPTION:
-        self.log.debug(f"console.log's mtime relative to TF2's start time is {console_log_mtime_relative} (<= {TF2_LOAD_TIME_ASSUMPTION}), assuming default state")
-        store_parsing_persistence(True)
-        return parse_results
-
-    # resume parsing from persistence
-    file_position: int = persistence.file_position
-    just_started_server: bool = persistence.just_started_server
-    server_still_running: bool = persistence.server_still_running
-    connecting_to_matchmaking: bool = persistence.connecting_to_matchmaking
-    in_community_server: bool = persistence.in_community_server
-    found_first_wav_cache: bool = persistence.found_first_wav_cache
-    kataiser_seen_on: str = persistence.kataiser_seen_on
-    server_name_full: str = persistence.server_name_full
-    is_mvm: bool = persistence.is_mvm
-
-    consolelog_file_size: int = os.stat(console_log_path).st_size
+                    if not line_end:
+                        break
 
-    if self.last_console_log_size is not None:
-        if consolelog_file_size < self.last_console_log_size:
-            self.log.error("console.log seems to have been externally shortened (possibly TF2BD)")
-            # TODO: try to account for this somehow, if need be
+                    self.position += line_end - line_start
+                    self.lines_read += 1
+                    yield decode_line(buffer[line_start:line_end])
+                    line_start = line_end
 
-        self.last_console_log_size = consolelog_file_size
+                # carry the unfinished line over to the next chunk
+                partial = buffer[line_start:]
 
-    # actually open the file finally
-    with open(console_log_path, 'r', errors='replace', encoding='UTF8') as consolelog_file:
-        consolelog_file.seek(file_position)  # skip to last saved position
-        consolelog_read = consolelog_file.read()
-        lines: List[str] = consolelog_read.splitlines(keepends=True)
-        self.log.debug(f"console.log: {consolelog_file_size} bytes, skipped to {file_position}, read {len(consolelog_read)} bytes and {len(lines)} lines")
-        file_position = consolelog_file.tell()
+            if partial:
+                # TF2 hasn't finished writing this line yet, but text mode reads used to include it so keep doing that
+                self.position += len(partial)
+                self.lines_read += 1
+                yield decode_line(partial)
 
-    if not lines and not force:
-        self.log.debug("No lines read, so skipping parsing")
-        return None
+    # yields decoded blocks of whole lines, roughly chunk_size each, for parsing with triggered_lines()
+    def blocks(self) -> Iterator[str]:
+        with open(self.path, 'rb') as consolelog_file:
+            consolelog_file.seek(self.position)  # skip to last saved position
+            partial: bytes = b''
 
-    # setup
-    now_in_menus: bool = False
-    chat_safety: bool = True
-    user_is_kataiser: bool = 'Kataiser' in user_usernames
-    # TODO: detection for canceling loading into community servers (if possible)
-    match_types: Dict[str, str] = {'12v12 Casual Match': 'Casual', 'MvM Practice': 'MvM (Boot Camp)', 'MvM MannUp': 'MvM (Mann Up)', '6v6 Ladder Match': 'Competitive'}
-    menus_messages: Tuple[str, ...] = ('For FCVAR_REPLICATED', 'request to abandon', 'Server shutting down', 'Lobby destroyed', 'Disconnect:', 'destroyed CAsyncWavDataCache',
-                                       'ShutdownGC', 'Connection failed after', 'Host_Error', 'destroyed Lobby')
-    menus_message_used: Optional[str] = None
-    menus_message: str
-    gui_update: int = 0
-    gui_updates: int = 0
-    is_initial_parse = file_position == 0
-
-    for username in user_usernames:
-        if ' :  ' in username:
-            chat_safety = False
-
-    # iterates though console.log lines and learns (almost) everything from them
-    line: str
-    for line in lines:
-        gui_update += 1
-
-        if gui_update == 1500:
-            # update the GUI occasionally during big parses, to prevent UI lag
-            self.gui.safe_update()
-            gui_update = 0
-            gui_updates += 1
+            while True:
+                chunk: bytes = consolelog_file.read(self.chunk_size)
 
+                if not chunk:
+                    break
+
+                self.bytes_read += len(chunk)
+                buffer: bytes = partial + chunk if partial else chunk
+                block_end: int = buffer.rfind(b'\n') + 1
+
+                if block_end:
+                    # carry the unfinished line over to the next chunk
+                    partial = buffer[block_end:]
+                    block: str = decode_line(buffer[:block_end])
+                    self.position += block_end
+                    self.lines_read += block.count('\n')
+                    yield block
+                else:
+                    partial = buffer
+
+            if partial:
+                self.position += len(partial)
+                self.lines_read += 1
+                yield decode_line(partial)
+
+    # find where the most recent session starts, by reading backwards from the end in blocks. a session starts at the first menus message (or other reset)
+    # after the second-to-last map, since resets while already in menus do nothing and the lines between there and the last map (connecting, hosting) matter.
+    # also returns the last line before that point that changed the queue state, since queueing carries across sessions. that's looked for in the same pass,
+    # going no further back than when TF2 was launched, since being queued doesn't carry across launches (and so the whole file isn't read for someone who never queues)
+    def find_session_start(self, user_usernames: Set[str], chat_safety: bool) -> Tuple[int, Optional[str]]:
+        usernames_bytes: List[bytes] = [username.encode('UTF8') for username in user_usernames]
+        reset_position: Optional[int] = None
+        session_start: int = 0
+        queue_lines: List[Tuple[int, bytes]] = []  # newest first
+        launch_position: Optional[int] = None  # the latest one found so far, for before session_start is known
+
+        for block_position, block in self.reverse_blocks(os.stat(self.path).st_size):
+            for line_start in reversed(triggered_line_starts(block, session_queue_triggers)):
+                line_bytes: bytes = block_line(block, line_start)
+
+                if chat_safety and b' :  ' in line_bytes:
+                    continue
+
+                line_position: int = block_position + line_start
+
+                if b'[PartyClient] L' in line_bytes or b'[PartyClient] Entering q' in line_bytes or b'[PartyClient] Entering s' in line_bytes:
+                    if session_start:
+                        return session_start, decode_line(line_bytes)  # everything from here on is before the session start
+
+                    queue_lines.append((line_position, line_bytes))
+                elif line_bytes.startswith(b'Steam config directory: '):
+                    if session_start:
+                        self.queue_search_stopped_at = line_position
+                        return session_start, None
+
+                    launch_position = line_position
+                elif session_start:
+                    continue
+                elif line_bytes.startswith(b'Map:'):
+                    if reset_position is not None:
+                        session_start = reset_position
+                        launch_before_start: Optional[int] = launch_position if launch_position is not None and launch_position < session_start else None
+
+                        for queue_position, queue_line in queue_lines:
+                            if queue_position < session_start:
+                                if launch_before_start is not None and queue_position < launch_before_start:
+                                    break
+
+                                return session_start, decode_line(queue_line)
+
+                        if launch_before_start is not None:
+                            self.queue_search_stopped_at = launch_before_start
+                            return session_start, None
+                elif is_reset_line(line_bytes, usernames_bytes):
+                    reset_position = line_position  # keeps getting moved earlier until a map is found
+
+        # with session_start still 0, there are no finished sessions, so everything needs to be parsed anyway
+        return session_start, None
+
+    # yields (position, bytes) of blocks ending at end and going backwards, each containing only whole lines
+    def reverse_blocks(self, end: int) -> Iterator[Tuple[int, bytes]]:
+        with open(self.path, 'rb') as consolelog_file:
+            block_position: int = end
+            partial: bytes = b''
+
+            while block_position > 0:
+                read_size: int = min(self.chunk_size, block_position)
+                block_position -= read_size
+                consolelog_file.seek(block_position)
+                block: bytes = consolelog_file.read(read_size) + partial
+                self.bytes_read += read_size
+
+                if block_position == 0:
+                    yield 0, block
+                    break
+
+                # the start of the block is probably the end of a line that started in the previous block
+                first_line_end: int = block.find(b'\n') + 1
+
+                if first_line_end:
+                    partial = block[:first_line_end]
+                    yield block_position + first_line_end, block[first_line_end:]
+                else:
+                    partial = block
+
+
+# owns everything learned from console.log lines so far, so that parsing can pick up where it left off whenever new lines show up
+class ConsoleLogStateMachine:
+    __slots__ = ('log', 'user_usernames', 'user_is_kataiser', 'chat_safety', 'menus_message_used',
+                 'in_menus', 'tf2_map', 'tf2_class', 'queued_state', 'hosting', 'server_players', 'server_players_max',
+                 'file_position', 'just_started_server', 'server_still_running', 'connecting_to_matchmaking', 'in_community_server', 'found_first_wav_cache',
+                 'kataiser_seen_on', 'server_name_full', 'is_mvm')
+
+    def __init__(self, log: logger.Log, user_usernames: Optional[Set[str]] = None):
+        self.log: logger.Log = log
+        self.menus_message_used: Optional[str] = None
+        self.set_usernames(user_usernames if user_usernames else set())
+
+        defaults: ConsoleLogParsed = ConsoleLogParsed()
+        self.in_menus: bool = defaults.in_menus
+        self.tf2_map: str = defaults.tf2_map
+        self.tf2_class: str = defaults.tf2_class
+        self.queued_state: str = defaults.queued_state
+        self.hosting: bool = defaults.hosting
+        self.server_players: int = defaults.server_players
+        self.server_players_max: int = defaults.server_players_max
+
+        self.file_position: int = 0
+        self.just_started_server: bool = False
+        self.server_still_running: bool = False
+        self.connecting_to_matchmaking: bool = False
+        self.in_community_server: bool = False
+        self.found_first_wav_cache: bool = False
+        self.kataiser_seen_on: str = ''
+        self.server_name_full: str = ''
+        self.is_mvm: bool = False
+
+    def __repr__(self) -> str:
+        return f"console_log.ConsoleLogStateMachine ({self.persistence()})"
+
+    # the usernames can change between parses (although they basically never do)
+    def set_usernames(self, user_usernames: Set[str]):
+        self.user_usernames: Set[str] = user_usernames
+        self.user_is_kataiser: bool = 'Kataiser' in user_usernames
+        self.chat_safety: bool = True
+
+        for username in user_usernames:
+            if ' :  ' in username:
+                self.chat_safety = False
+
+    # learns (almost) everything from a single line, which needs to still have its newline
+    def feed(self, line: str):
         # reduce false detections
-        if chat_safety and ' :  ' in line:
-            continue
+        if self.chat_safety and ' :  ' in line:
+            return
 
-        if not in_menus:
+        now_in_menus: bool = False
+
+        if not self.in_menus:
             for menus_message in menus_messages:
                 if menus_message in line:
                     now_in_menus = True
                     break
 
             if line.startswith('hostname: '):
-                server_name_full = line[10:-1]
+                self.server_name_full = line[10:-1]
 
             elif line.startswith('players : '):
                 line_split = line.split()
-                server_players = int(line_split[2]) + (0 if is_mvm else int(line_split[4]))  # exclude bots from count if in mvm
-                server_players_max = int(line_split[6][1:])
+                self.server_players = int(line_split[2]) + (0 if self.is_mvm else int(line_split[4]))  # exclude bots from count if in mvm
+                self.server_players_max = int(line_split[6][1:])
 
-            elif tf2_map and line.startswith('Players: ') and ' / ' in line:
+            elif self.tf2_map and line.startswith('Players: ') and ' / ' in line:
                 # just joined, don't have info from status yet but just read map
                 line_split = line.split()
-                server_players = int(line_split[1])
-                server_players_max = int(line_split[3])
+                self.server_players = int(line_split[1])
+                self.server_players_max = int(line_split[3])
 
                 # valve servers report as 32 players when joining but they're 24
                 # this can be inaccurate when joining a community server directly from a valve server,
                 # but should only happen for a moment because the status loop will have been started
-                if not in_community_server and server_players_max == 32:
-                    server_players_max = 6 if is_mvm else 24
+                if not self.in_community_server and self.server_players_max == 32:
+                    self.server_players_max = 6 if self.is_mvm else 24
 
             elif line.endswith(' selected \n'):
                 class_line_possibly: List[str] = line[:-11].split()
 
                 if class_line_possibly and class_line_possibly[-1] in tf2_classes:
-                    tf2_class = class_line_possibly[-1]
+                    self.tf2_class = class_line_possibly[-1]
 
             elif 'Disconnect by user' in line:
-                for user_username in user_usernames:
+                for user_username in self.user_usernames:
                     if user_username in line:
                         now_in_menus = True
                         break
@@ -200,115 +292,264 @@ def interpret(self, console_log_path: str, user_usernames: Set[str], force: bool
             elif 'Missing map' in line and 'Missing map material' not in line:
                 now_in_menus = True
 
-            if not user_is_kataiser and '[U:1:160315024]' in line:
-                kataiser_seen_on = tf2_map
+            if not self.user_is_kataiser and '[U:1:160315024]' in line:
+                self.kataiser_seen_on = self.tf2_map
 
         elif 'SV_ActivateServer' in line:  # full line: "SV_ActivateServer: setting tickrate to 66.7"
-            just_started_server = True
+            self.just_started_server = True
 
         if line.startswith('Map:'):
-            in_menus = False
-            connecting_to_matchmaking = False
-            found_first_wav_cache = False
-            tf2_map = line[5:-1].removeprefix('workshop/').partition('.')[0]
-            is_mvm = tf2_map.startswith('mvm_')
-            tf2_class = ''
-
-            if just_started_server:
-                server_still_running = True
-                just_started_server = False
-            else:
-                just_started_server = False
-                server_still_running = False
-
-        elif not connecting_to_matchmaking and 'Connected to' in line:
+            self.in_menus = False
+            self.connecting_to_matchmaking = False
+            self.found_first_wav_cache = False
+            self.tf2_map = line[5:-1].removeprefix('workshop/').partition('.')[0]
+            self.is_mvm = self.tf2_map.startswith('mvm_')
+            self.tf2_class = ''
+            self.server_still_running = self.just_started_server
+            self.just_started_server = False
+
+        elif not self.connecting_to_matchmaking and 'Connected to' in line:
             # joined a community server, so must use CAsyncWavDataCache method to detect disconnects
-            in_community_server = True
-            connecting_to_matchmaking = False
-            found_first_wav_cache = False
+            self.in_community_server = True
+            self.connecting_to_matchmaking = False
+            self.found_first_wav_cache = False
 
         elif 'Connecting to matchmaking server' in line:
-            connecting_to_matchmaking = True
+            self.connecting_to_matchmaking = True
 
-        elif in_community_server and 'CAsyncWavDataCache' in line:
-            if found_first_wav_cache:
+        elif self.in_community_server and 'CAsyncWavDataCache' in line:
+            if self.found_first_wav_cache:
                 # it's the one after disconnecting
 
-                if in_menus:
+                if self.in_menus:
                     # ...unless it isn't?
                     self.log.error("Found CAsyncWavDataCache despite being in menus already")
                 else:
                     now_in_menus = True
             else:
                 # it's the one after loading in
-                found_first_wav_cache = True
+                self.found_first_wav_cache = True
 
         elif '[P' in line:
             if '[PartyClient] L' in line:  # full line: "[PartyClient] Leaving queue"
                 # queueing is not necessarily only in menus
-                queued_state = "Not queued"
+                self.queued_state = "Not queued"
 
             elif '[PartyClient] Entering q' in line:  # full line: "[PartyClient] Entering queue for match group " + whatever mode
                 match_type: str = line.split('match group ')[-1][:-1]
-                queued_state = f"Queued for {match_types[match_type]}"
+                self.queued_state = f"Queued for {match_types[match_type]}"
 
             elif '[PartyClient] Entering s' in line:  # full line: "[PartyClient] Entering standby queue"
-                queued_state = 'Queued for a party\'s match'
+                self.queued_state = 'Queued for a party\'s match'
 
         if now_in_menus:
-            now_in_menus = False
-            in_menus = True
-            menus_message_used = line
-            kataiser_seen_on = ''
-            connecting_to_matchmaking = False
-            in_community_server = False
-            found_first_wav_cache = False
-            just_started_server = False
-            server_still_running = False
-
-    if not user_is_kataiser and not in_menus and kataiser_seen_on == tf2_map:
-        self.log.debug(f"Kataiser located, telling user :D (on {tf2_map})")
-        self.gui.set_bottom_text('kataiser', True)
-
-    if in_menus:
-        tf2_map = ''
-        tf2_class = ''
-        hosting = False
-        server_name = ''
-        server_name_full = ''
-        server_players = 0
-        server_players_max = 0
-        is_mvm = False
-        self.gui.set_bottom_text('kataiser', False)
-
-        if menus_message_used:
-            self.log.debug(f"Menus message used: \"{menus_message_used.strip()}\"")
+            self.in_menus = True
+            self.menus_message_used = line
+            self.kataiser_seen_on = ''
+            self.connecting_to_matchmaking = False
+            self.in_community_server = False
+            self.found_first_wav_cache = False
+            self.just_started_server = False
+            self.server_still_running = False
+
+    def feed_many(self, lines: Iterable[str]):
+        feed = self.feed
+
+        for line in lines:
+            feed(line)
+
+    # cleans up after a batch of lines has been fed and returns what's been learned, ready for the game state
+    def snapshot(self) -> ConsoleLogParsed:
+        if self.in_menus:
+            self.tf2_map = ''
+            self.tf2_class = ''
+            self.hosting = False
+            self.server_name_full = ''
+            self.server_players = 0
+            self.server_players_max = 0
+            self.is_mvm = False
+            server_name: str = ''
+        else:
+            server_name, is_valve_server = cleanup_server_name(self.server_name_full)
+
+            if is_valve_server and self.server_players_max == 32:  # cool
+                self.server_players_max = 6 if self.is_mvm else 24
+
+            if self.tf2_class != '' and self.tf2_map == '':
+                self.log.error("Have class without map")
+
+            if self.server_still_running:
+                self.hosting = True
+
+        queued_state: str = self.queued_state
+
+        if settings.current().hide_queued_gamemode and "Queued" in queued_state:
+            self.log.debug(f"Hiding queued state (\"{queued_state}\" to \"Queued\")")
+            queued_state = "Queued"
+
+        return ConsoleLogParsed(self.in_menus, self.tf2_map, self.tf2_class, queued_state, self.hosting, server_name, self.server_players, self.server_players_max)
+
+    # the state that only matters for parsing, and not for the game state
+    def persistence(self) -> ConsoleLogPersistence:
+        return ConsoleLogPersistence(self.file_position, self.just_started_server, self.server_still_running, self.connecting_to_matchmaking, self.in_community_server,
+                                     self.found_first_wav_cache, self.kataiser_seen_on, self.server_name_full, self.is_mvm)
+
+
+# reads a console.log and returns as much game state as possible, alternatively None if whether an old scan was reused
+def interpret(self, console_log_path: str, user_usernames: Set[str], force: bool = False, from_game_state: Optional = None, tf2_start_time: int = 0) -> Optional[ConsoleLogParsed]:
+    TF2_LOAD_TIME_ASSUMPTION: int = 10
+
+    # if we already have a game state and file position, just update the state from the new lines since then
+    if from_game_state:
+        state_machine: ConsoleLogStateMachine = from_game_state.console_log_state
     else:
-        server_name, is_valve_server = cleanup_server_name(server_name_full)
+        state_machine = ConsoleLogStateMachine(self.log)
 
-        if is_valve_server and server_players_max == 32:  # cool
-            server_players_max = 6 if is_mvm else 24
+    # console.log is a log of tf2's console (duh), only exists if tf2 has -condebug (see no_condebug_warning() in GUI)
+    self.log.debug("Looking for console.log at {}", console_log_path)
+
+    # only one stat for everything, this happens every loop
+    try:
+        console_log_stat: Optional[os.stat_result] = os.stat(console_log_path)
+    except FileNotFoundError:
+        console_log_stat = None
+
+    if not console_log_stat:
+        self.log.error(f"console.log doesn't exist, issuing warning (files/dirs in /tf/: {os.listdir(os.path.dirname(console_log_path))})", reportable=False)
+        self.no_condebug = False
+        self.game_state.console_log_state = ConsoleLogStateMachine(self.log)
+        return ConsoleLogParsed()  # might as well
+
+    # only interpret console.log again if it's been modified. in nanoseconds, since being woken up by a change can happen within the same second as the last parse
+    self.console_log_mtime = console_log_stat.st_mtime_ns
+    if not force and self.console_log_mtime == self.old_console_log_mtime:
+        self.log.debug("Not rescanning console.log")
+        return None
+
+    # TF2 takes some time to load the console when starting up, so wait until it's been modified to avoid getting outdated information
+    console_log_mtime_relative: int = int(console_log_stat.st_mtime) - tf2_start_time
+    if console_log_mtime_relative <= TF2_LOAD_TIME_ASSUMPTION:
+        self.log.debug(f"console.log's mtime relative to TF2's start time is {console_log_mtime_relative} (<= {TF2_LOAD_TIME_ASSUMPTION}), assuming default state")
+        self.game_state.console_log_state = ConsoleLogStateMachine(self.log)
+        return ConsoleLogParsed()
+
+    file_position: int = state_machine.file_position
+    consolelog_file_size: int = console_log_stat.st_size
+
+    if self.last_console_log_size is not None:
+        if consolelog_file_size < self.last_console_log_size:
+            self.log.error("console.log seems to have been externally shortened (possibly TF2BD)")
+            # TODO: try to account for this somehow, if need be
+
+        self.last_console_log_size = consolelog_file_size
+
+    if consolelog_file_size <= file_position and not force:
+        self.log.debug("No lines read, so skipping parsing")
+        return None
+
+    # setup
+    state_machine.set_usernames(user_usernames)
+    state_machine.menus_message_used = None
+    is_initial_parse: bool = file_position == 0
 
-        if tf2_class != '' and tf2_map == '':
-            self.log.error("Have class without map")
+    # actually open the file finally (lazily, blocks are read as the loop below consumes them)
+    tailer: ConsoleLogTailer = ConsoleLogTailer(console_log_path, file_position)
 
-        if server_still_running:
-            hosting = True
+    if is_initial_parse:
+        # no need to go through old sessions (possibly weeks of them) when starting up
+        session_start, queue_line = tailer.find_session_start(user_usernames, state_machine.chat_safety)
+        self.log.debug(f"Initial parse starting from {session_start} (read {tailer.bytes_read} bytes in reverse), last queue change before that: {repr(queue_line)}")
 
-    if settings.get('hide_queued_gamemode') and "Queued" in queued_state:
-        self.log.debug(f"Hiding queued state (\"{queued_state}\" to \"Queued\")")
-        queued_state = "Queued"
+        if tailer.queue_search_stopped_at is not None:
+            self.log.debug(f"Stopped looking for a queue change at TF2 being launched ({tailer.queue_search_stopped_at}), assuming not queued")
+        file_position = tailer.position = session_start
+        tailer.bytes_read = 0
 
-    parse_results = ConsoleLogParsed(in_menus, tf2_map, tf2_class, queued_state, hosting, server_name, server_players, server_players_max)
-    self.log.debug(f"console.log parse results (initial = {is_initial_parse}): {parse_results}")
+        if queue_line:
+            state_machine.feed(queue_line)
 
-    if gui_updates != 0:
-        self.log.debug(f"Mid-parse GUI updates: {gui_updates}")
+    block: str
+    for block in tailer.blocks():
+        # lines without any triggers can't change anything, so only these need to be looked at
+        state_machine.feed_many(triggered_lines(block))
 
-    store_parsing_persistence(False)
+    self.log.debug("console.log: {} bytes, skipped to {}, read {} bytes and {} lines", consolelog_file_size, file_position, tailer.bytes_read, tailer.lines_read)
+    state_machine.file_position = tailer.position
+
+    if not state_machine.user_is_kataiser and not state_machine.in_menus and state_machine.kataiser_seen_on == state_machine.tf2_map:
+        self.log.debug(f"Kataiser located, telling user :D (on {state_machine.tf2_map})")
+        self.has_seen_kataiser = True
+
+    parse_results: ConsoleLogParsed = state_machine.snapshot()
+
+    if parse_results.in_menus:
+        self.has_seen_kataiser = False
+
+        if state_machine.menus_message_used:
+            self.log.debug(f"Menus message used: \"{state_machine.menus_message_used.strip()}\"")
+
+    self.log.debug("console.log parse results (initial = {}): {}", is_initial_parse, parse_results)
+
+    self.game_state.console_log_state = state_machine
     return parse_results
 
 
+# decode a raw line from console.log, translating Windows line endings like text mode does
+def decode_line(line_bytes: bytes) -> str:
+    line: str = line_bytes.decode('UTF8', errors='replace')
+
+    if '\r' in line:
+        line = line.replace('\r\n', '\n').replace('\r', '\n')
+
+    return line
+
+
+# whether a raw line would put interpret() back in menus, if it weren't already
+def is_reset_line(line_bytes: bytes, usernames_bytes: List[bytes]) -> bool:
+    for menus_message in menus_messages_bytes:
+        if menus_message in line_bytes:
+            return True
+
+    if b'Disconnect by user' in line_bytes:
+        for username in usernames_bytes:
+            if username in line_bytes:
+                return True
+
+    return b'Missing map' in line_bytes and b'Missing map material' not in line_bytes
+
+
+# find the lines in a block that contain anything interpret() looks for, in order
+def triggered_lines(block: str) -> List[str]:
+    return [block_line(block, line_start) for line_start in triggered_line_starts(block, line_triggers)]
+
+
+# find where the lines containing any of the triggers start in a block (str or bytes), in order. each trigger gets one search through the whole block,
+# which is much faster than checking every line against every trigger in Python (a big regex alternation is even slower, re doesn't handle those well)
+def triggered_line_starts(block: Union[str, bytes], triggers: Tuple[Union[str, bytes], ...]) -> List[int]:
+    newline: Union[str, bytes] = '\n' if isinstance(block, str) else b'\n'
+    block_find = block.find
+    block_rfind = block.rfind
+    line_starts: Set[int] = set()
+
+    for trigger in triggers:
+        trigger_position: int = block_find(trigger)
+
+        while trigger_position != -1:
+            line_starts.add(block_rfind(newline, 0, trigger_position) + 1)
+            trigger_position = block_find(newline, trigger_position)
+
+            if trigger_position != -1:
+                trigger_position = block_find(trigger, trigger_position)  # the rest of this line doesn't matter anymore
+
+    return sorted(line_starts)
+
+
+# the line in a block that starts at line_start, including its line ending if it has one
+def block_line(block: Union[str, bytes], line_start: int) -> Union[str, bytes]:
+    line_end: int = block.find('\n' if isinstance(block, str) else b'\n', line_start) + 1
+    return block[line_start:line_end] if line_end else block[line_start:]
+
+
 # check if any characters outside of ASCII exist in any usernames
 def non_ascii_in_usernames(usernames: Set[str]) -> bool:
     for username in usernames:
@@ -351,6 +592,17 @@ def cleanup_server_name(name: str, log: Optional[logger.Log] = None) -> tuple[st
 re_valve_server: Pattern[str] = re.compile(r'Valve Matchmaking Server \(.*srcds.*\)')
 re_valve_server_remove: Pattern[str] = re.compile(r'( srcds[^)]+)|( \(srcds.*\))')
 re_double_space: Pattern[str] = re.compile(r' {2,}')
+menus_messages: Tuple[str, ...] = ('For FCVAR_REPLICATED', 'request to abandon', 'Server shutting down', 'Lobby destroyed', 'Disconnect:', 'destroyed CAsyncWavDataCache',
+                                   'ShutdownGC', 'Connection failed after', 'Host_Error', 'destroyed Lobby')
+menus_messages_bytes: Tuple[bytes, ...] = tuple(menus_message.encode('UTF8') for menus_message in menus_messages)
+# every line that interpret() does anything with contains at least one of these (the starts/ends of line checks are done afterwards, these are only a filter)
+line_triggers: Tuple[str, ...] = tuple(trigger for trigger in menus_messages if trigger != 'destroyed CAsyncWavDataCache') + \
+                                 ('hostname: ', 'players : ', 'Players: ', ' selected ', 'Disconnect by user', 'Missing map', '[U:1:160315024]', 'SV_ActivateServer', 'Map:',
+                                  'Connected to', 'Connecting to matchmaking server', 'CAsyncWavDataCache', '[PartyClient] ')
+session_triggers: Tuple[bytes, ...] = menus_messages_bytes + (b'Disconnect by user', b'Missing map', b'Map:')
+session_queue_triggers: Tuple[bytes, ...] = session_triggers + (b'[PartyClient] ', b'Steam config directory: ')
+# TODO: detection for canceling loading into community servers (if possible)
+match_types: Dict[str, str] = {'12v12 Casual Match': 'Casual', 'MvM Practice': 'MvM (Boot Camp)', 'MvM MannUp': 'MvM (Mann Up)', '6v6 Ladder Match': 'Competitive'}
 tf2_classes: Tuple[str, ...] = ('Scout', 'Soldier', 'Pyro', 'Demoman', 'Heavy', 'Engineer', 'Medic', 'Sniper', 'Spy')
 non_ascii_regex = re.compile('[^\x00-\x7F]')
 gui_font: Optional[tkinter.font.Font] = None
@@ -0,0 +1,55 @@
+# Copyright (C) 2018-2025 Kataiser & https://github.com/Kataiser/tf2-rich-presence/contributors
+# https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
+
+import os
+import time
+from typing import Callable, List
+
+import console_log
+
+
+# compares finding the console.log lines that interpret() cares about line by line (how it used to be done) vs with triggered_lines() on whole blocks
+def main():
+    for file_name in sorted(os.listdir('test_resources')):
+        file_path: str = os.path.join('test_resources', file_name)
+
+        if not file_name.endswith('.log') or os.stat(file_path).st_size < 1_000_000:
+            continue
+
+        blocks: List[str] = list(console_log.ConsoleLogTailer(file_path).blocks())
+        lines: List[str] = [line for block in blocks for line in block.splitlines(keepends=True)]
+        triggered_per_line: List[str] = per_line(lines)
+        triggered_blocks: List[str] = [line for block in blocks for line in console_log.triggered_lines(block)]
+        assert triggered_per_line == triggered_blocks
+
+        time_per_line: float = best_time(lambda: per_line(lines))
+        time_blocks: float = best_time(lambda: [console_log.triggered_lines(block) for block in blocks])
+        print(f"{file_name} ({round(os.stat(file_path).st_size / 1048576, 1)} MB, {len(lines)} lines, {len(triggered_blocks)} triggered): "
+              f"per line {round(time_per_line * 1000, 1)} ms, blocks {round(time_blocks * 1000, 1)} ms ({round(time_per_line / time_blocks, 1)}x)")
+
+
+def per_line(lines: List[str]) -> List[str]:
+    triggered: List[str] = []
+
+    for line in lines:
+        for trigger in console_log.line_triggers:
+            if trigger in line:
+                triggered.append(line)
+                break
+
+    return triggered
+
+
+def best_time(func: Callable, runs: int = 5) -> float:
+    times: List[float] = []
+
+    for _ in range(runs):
+        start_time: float = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+
+    return min(times)
+
+
+if __name__ == '__main__':
+    main()
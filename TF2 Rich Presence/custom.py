@@ -4,6 +4,7 @@
 # Add some custom functionality to TF2 Rich Presence if you'd like
 # Quite limited but someone may find a use it (I know I have)
 # Also you can replace a .pyd file here with a .py of the same name (sans .cp310-win32) and it'll import
+# Note that before_loop, modify_game_state, and modify_rpc_activity run in the main loop's worker thread, so don't touch app.gui from them
 
 import logger
 import main
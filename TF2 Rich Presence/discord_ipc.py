@@ -0,0 +1,340 @@
+# Copyright (C) 2018-2025 Kataiser & https://github.com/Kataiser/tf2-rich-presence/contributors
+# https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
+# cython: language_level=3
+
+import asyncio
+import copy
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import ujson
+
+import logger
+
+# every message in either direction is a header of (opcode, payload length) followed by that many bytes of JSON
+HEADER: struct.Struct = struct.Struct('<II')
+HANDSHAKE: int = 0
+FRAME: int = 1
+CLOSE: int = 2
+PING: int = 3
+PONG: int = 4
+
+
+def encode(opcode: int, payload: dict) -> bytes:
+    payload_bytes: bytes = ujson.dumps(payload, ensure_ascii=False).encode('UTF8')
+    return HEADER.pack(opcode, len(payload_bytes)) + payload_bytes
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[int, dict]:
+    opcode, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return opcode, ujson.loads(await reader.readexactly(length)) if length else {}
+
+
+# where Discord might be listening, in the order it would pick them. on Linux, also where the Flatpak and Snap versions put their sockets
+def ipc_paths() -> List[str]:
+    if sys.platform == 'win32':
+        return [f'\\\\?\\pipe\\discord-ipc-{pipe_num}' for pipe_num in range(10)]
+
+    base_dir: str = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or os.environ.get('TMP') or os.environ.get('TEMP') or '/tmp'
+    socket_dirs: Tuple[str, ...] = (base_dir, os.path.join(base_dir, 'app', 'com.discordapp.Discord'), os.path.join(base_dir, 'snap.discord'))
+    return [os.path.join(socket_dir, f'discord-ipc-{pipe_num}') for pipe_num in range(10) for socket_dir in socket_dirs]
+
+
+# a named pipe on Windows (which needs the proactor event loop, the default there), a Unix socket everywhere else
+async def open_ipc_connection(path: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    if sys.platform == 'win32':
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        reader: asyncio.StreamReader = asyncio.StreamReader()
+        transport, protocol = await loop.create_pipe_connection(lambda: asyncio.StreamReaderProtocol(reader), path)
+        return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+    else:
+        return await asyncio.open_unix_connection(path)
+
+
+# decides what actually gets sent to Discord: nothing that's the same as what was last sent, and nothing sooner than min_interval after the last send.
+# changes during that window replace each other, and whichever's newest is sent once it's over. Discord only shows updates every 15 seconds anyway
+class ActivityPublisher:
+    def __init__(self, min_interval: float = 15.0):
+        self.min_interval: float = min_interval
+        self.last_sent: Optional[dict] = None
+        self.last_sent_time: float = float('-inf')
+        self.pending: Optional[dict] = None
+        self.published: int = 0
+        self.dropped: int = 0  # identical to what was already sent or waiting to be
+        self.coalesced: int = 0  # replaced by a newer activity before they could be sent
+
+    def __repr__(self) -> str:
+        return f"discord_ipc.ActivityPublisher ({self.published} published, {self.dropped} dropped, {self.coalesced} coalesced)"
+
+    # returns whether there's now something new to send
+    def offer(self, activity: dict) -> bool:
+        if activity == self.pending or (self.pending is None and activity == self.last_sent):
+            self.dropped += 1
+            return False
+
+        if self.pending is not None:
+            self.coalesced += 1
+
+        # copied because the caller is free to modify theirs before it gets sent
+        self.pending = None if activity == self.last_sent else copy.deepcopy(activity)
+        return self.pending is not None
+
+    # seconds until the pending activity can be sent, or None if there isn't one
+    def wait_time(self) -> Optional[float]:
+        if self.pending is None:
+            return None
+
+        return max(self.last_sent_time + self.min_interval - time.perf_counter(), 0.0)
+
+    def take(self) -> dict:
+        self.last_sent, self.pending = self.pending, None
+        self.last_sent_time = time.perf_counter()
+        self.published += 1
+        return self.last_sent
+
+    # a new connection doesn't have the old one's activity, so send it again (immediately)
+    def resend(self):
+        if self.pending is None:
+            self.pending = self.last_sent
+
+        self.last_sent_time = float('-inf')
+
+    def clear(self):
+        self.last_sent = None
+        self.pending = None
+
+
+# talks to Discord from an asyncio event loop in its own thread, so nothing here ever blocks the caller. keeps one connection open for as long as it's wanted,
+# reconnecting with exponential backoff (instead of every loop while Discord is starting up), and leaves what to send when up to an ActivityPublisher
+class DiscordIPCClient:
+    def __init__(self, log: logger.Log, client_id: str, paths: Optional[List[str]] = None, min_backoff: float = 0.5, max_backoff: float = 30.0,
+                 max_in_flight: int = 4, timeout: float = 5.0, min_interval: float = 15.0):
+        self.log: logger.Log = log
+        self.client_id: str = client_id
+        self.paths: List[str] = paths if paths else ipc_paths()
+        self.min_backoff: float = min_backoff
+        self.max_backoff: float = max_backoff
+        self.max_in_flight: int = max_in_flight  # how many sent activities can be waiting on a response from Discord before holding off on sending more
+        self.timeout: float = timeout  # for connecting and handshaking
+        self.pid: int = os.getpid()
+        self.ipc_path: Optional[str] = None
+        self.connected: bool = False
+        self.last_error: Optional[str] = None  # cleared once connected
+        self.connect_failures: int = 0  # since the last successful connection
+        self.sent: int = 0
+        self.acknowledged: int = 0
+
+        # everything below is only touched from the event loop's thread
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.connection_task: Optional[asyncio.Task] = None
+        self.wake: Optional[asyncio.Event] = None
+        self.closed: Optional[asyncio.Event] = None
+        self.wanted: bool = False
+        self.publisher: ActivityPublisher = ActivityPublisher(min_interval)
+        self.in_flight: Dict[str, float] = {}  # nonce: time sent
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    def __repr__(self) -> str:
+        return f"discord_ipc.DiscordIPCClient ({'connected to ' + self.ipc_path if self.connected else 'not connected'}, " \
+               f"{self.sent} sent, {self.acknowledged} acknowledged, {self.publisher.dropped} dropped, {self.publisher.coalesced} coalesced)"
+
+    # queue an activity to be sent (if it's changed), connecting first if need be. returns immediately
+    def update_activity(self, activity: dict):
+        self.start()
+        self.loop.call_soon_threadsafe(self.queue_activity, activity)
+
+    # close the connection (if there is one) and stop trying to connect until the next update_activity(). returns immediately
+    def disconnect(self):
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.stop_connecting)
+
+    # disconnect and stop the event loop thread, waiting up to timeout seconds for that
+    def close(self, timeout: float = 1.0):
+        if not self.thread:
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout)
+        except Exception:
+            pass
+
+        self.thread.join(timeout)
+        self.thread = None
+
+    def start(self):
+        if self.thread:
+            return
+
+        self.loop = asyncio.new_event_loop()
+        self.wake = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.connection_task = self.loop.create_task(self.maintain_connection())
+        self.thread = threading.Thread(target=self.run_loop, name='discord_ipc', daemon=True)
+        self.thread.start()
+
+    def run_loop(self):
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def queue_activity(self, activity: dict):
+        self.wanted = True
+
+        if self.publisher.offer(activity):
+            self.wake.set()
+
+    def stop_connecting(self):
+        self.wanted = False
+        self.publisher.clear()
+        self.wake.set()
+
+    async def shutdown(self):
+        self.stop_connecting()
+        self.closed.set()
+        self.connection_task.cancel()  # still sends Discord a close message if connected
+
+        try:
+            await self.connection_task
+        except asyncio.CancelledError:
+            pass
+
+        self.loop.stop()
+
+    # the client's whole life, basically: wait until a connection is wanted, connect (or back off), send until disconnected, repeat
+    async def maintain_connection(self):
+        backoff: float = self.min_backoff
+
+        while not self.closed.is_set():
+            if not self.wanted:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+
+            try:
+                reader, self.writer = await self.connect()
+            except (OSError, EOFError, ValueError, asyncio.TimeoutError) as error:
+                self.connect_failures += 1
+                self.last_error = f"Can't connect to Discord ({error.__class__.__name__}: {error})"
+                self.log.error(f"{self.last_error}, retrying in {backoff} seconds (attempt {self.connect_failures})", reportable=False)
+
+                try:
+                    await asyncio.wait_for(self.closed.wait(), backoff)  # activity updates don't cut this short, which is the point
+                except asyncio.TimeoutError:
+                    pass
+
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            self.log.debug(f"Connected to Discord IPC at {self.ipc_path} (after {self.connect_failures} failed attempts)")
+            backoff = self.min_backoff
+            self.connect_failures = 0
+            self.last_error = None
+            self.connected = True
+            self.publisher.resend()
+            reader_task: asyncio.Task = asyncio.create_task(self.read_responses(reader))
+
+            try:
+                await self.send_pending(reader_task)
+            except (OSError, EOFError) as error:
+                self.last_error = f"Can't send data to Discord ({error.__class__.__name__}: {error})"
+                self.log.error(self.last_error, reportable=False)
+            finally:
+                self.connected = False
+                self.in_flight.clear()
+
+                if not reader_task.done():
+                    try:
+                        self.writer.write(encode(CLOSE, {}))
+                    except OSError:
+                        pass
+
+                    reader_task.cancel()
+
+                self.writer.close()
+                self.writer = None
+                self.log.debug(f"Disconnected from Discord IPC (wanted = {self.wanted})")
+
+            if self.wanted:
+                # the connection was lost rather than closed on purpose, so don't immediately hammer Discord if it's restarting
+                try:
+                    await asyncio.wait_for(self.closed.wait(), self.min_backoff)
+                except asyncio.TimeoutError:
+                    pass
+
+    # try each possible socket/pipe until one handshakes
+    async def connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        for path in self.paths:
+            try:
+                reader, writer = await asyncio.wait_for(open_ipc_connection(path), self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                continue
+
+            try:
+                writer.write(encode(HANDSHAKE, {'v': 1, 'client_id': self.client_id}))
+                opcode, payload = await asyncio.wait_for(read_message(reader), self.timeout)
+            except BaseException:
+                writer.close()
+                raise
+
+            if opcode != FRAME or payload.get('evt') != 'READY':
+                writer.close()
+                raise ConnectionRefusedError(f"Handshake rejected with opcode {opcode}: {payload}")
+
+            self.ipc_path = path
+            return reader, writer
+
+        raise FileNotFoundError("No Discord IPC socket found")
+
+    # sends the newest activity whenever the publisher allows, without waiting for Discord to respond to the previous ones
+    async def send_pending(self, reader_task: asyncio.Task):
+        while self.wanted and not reader_task.done():
+            wait_time: Optional[float] = self.publisher.wait_time()
+
+            if wait_time == 0 and len(self.in_flight) < self.max_in_flight:
+                nonce: str = str(uuid.uuid4())
+                self.writer.write(encode(FRAME, {'cmd': 'SET_ACTIVITY', 'args': {'pid': self.pid, 'activity': self.publisher.take()}, 'nonce': nonce}))
+                self.in_flight[nonce] = time.perf_counter()
+                self.sent += 1
+                await self.writer.drain()
+            else:
+                self.wake.clear()
+
+                try:
+                    await asyncio.wait_for(self.wake.wait(), wait_time or None)  # times out at the end of the publisher's interval, to send what's pending then
+                except asyncio.TimeoutError:
+                    pass
+
+    async def read_responses(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                opcode, payload = await read_message(reader)
+
+                if opcode == FRAME:
+                    sent_time: Optional[float] = self.in_flight.pop(payload.get('nonce'), None)
+
+                    if payload.get('evt') == 'ERROR':
+                        self.log.error(f"Discord rejected an activity: {payload.get('data')}")
+                    elif sent_time is not None:
+                        self.acknowledged += 1
+                        self.log.debug(lambda: f"Discord acknowledged activity after {round((time.perf_counter() - sent_time) * 1000, 1)} ms")
+
+                    self.wake.set()  # in case send_pending() was waiting on max_in_flight
+                elif opcode == PING:
+                    self.writer.write(encode(PONG, payload))
+                elif opcode == CLOSE:
+                    self.last_error = f"Discord closed the connection ({payload.get('message')})"
+                    self.log.error(self.last_error, reportable=False)
+                    return
+        except (OSError, EOFError, ValueError) as error:
+            if self.wanted:
+                self.last_error = f"Lost connection to Discord ({error.__class__.__name__}: {error})"
+                self.log.error(self.last_error, reportable=False)
+        finally:
+            self.wake.set()  # so that send_pending() notices
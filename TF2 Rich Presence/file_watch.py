@@ -0,0 +1,149 @@
+# Copyright (C) 2018-2025 Kataiser & https://github.com/Kataiser/tf2-rich-presence/contributors
+# https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
+# cython: language_level=3
+
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from typing import Optional, Tuple
+
+import logger
+
+
+# watches a single file (console.log) for changes, by checking its mtime and size whenever asked. works everywhere, and is what other backends fall back to
+class PollingFileWatcher:
+    backend: str = 'polling'
+
+    def __init__(self, log: logger.Log, poll_interval: float = 0.5):
+        self.log: logger.Log = log
+        self.poll_interval: float = poll_interval  # how often the scheduler should call changed(), if there's no fileno() to wait on
+        self.path: Optional[str] = None
+        self.last_stat: Optional[Tuple[int, int]] = None
+
+    def __repr__(self) -> str:
+        return f"file_watch.{self.__class__.__name__} ({self.path})"
+
+    # start watching a file, or stop watching with None. does nothing if the path hasn't changed
+    def watch(self, path: Optional[str]):
+        if path == self.path:
+            return
+
+        self.log.debug(f"File watcher ({self.backend}) now watching {path}")
+        self.path = path
+        self.last_stat = self.stat()
+
+    # whether the file has changed since the last time this returned True, without blocking
+    def changed(self) -> bool:
+        if not self.path:
+            return False
+
+        new_stat: Optional[Tuple[int, int]] = self.stat()
+
+        if new_stat != self.last_stat:
+            self.last_stat = new_stat
+            return True
+
+        return False
+
+    def stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            path_stat: os.stat_result = os.stat(self.path) if self.path else None
+        except OSError:
+            return None
+
+        return (path_stat.st_mtime_ns, path_stat.st_size) if path_stat else None
+
+    # a file descriptor that becomes readable when the file changes, or None if changed() needs to be polled instead
+    def fileno(self) -> Optional[int]:
+        return None
+
+    def close(self):
+        self.path = None
+
+
+# Linux only, gets told about changes by the kernel instead of asking, so it can react immediately without any polling
+class InotifyFileWatcher(PollingFileWatcher):
+    backend: str = 'inotify'
+
+    IN_MODIFY: int = 0x2
+    IN_CLOSE_WRITE: int = 0x8
+    IN_MOVED_TO: int = 0x80
+    IN_CREATE: int = 0x100
+    IN_DELETE: int = 0x200
+    EVENT_HEADER: struct.Struct = struct.Struct('iIII')  # struct inotify_event {int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[];}
+
+    def __init__(self, log: logger.Log, poll_interval: float = 0.5):
+        super().__init__(log, poll_interval)
+        self.libc: ctypes.CDLL = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.inotify_fd: int = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        self.watch_descriptor: Optional[int] = None
+        self.file_name: bytes = b''
+
+        if self.inotify_fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    # watches the directory instead of the file itself, so that the file being deleted, replaced, or not existing yet is handled too
+    def watch(self, path: Optional[str]):
+        if path == self.path:
+            return
+
+        if self.watch_descriptor is not None:
+            self.libc.inotify_rm_watch(self.inotify_fd, self.watch_descriptor)
+            self.watch_descriptor = None
+
+        super().watch(path)
+
+        if path:
+            self.file_name = os.fsencode(os.path.basename(path))
+            watch_descriptor: int = self.libc.inotify_add_watch(self.inotify_fd, os.fsencode(os.path.dirname(path) or '.'),
+                                                                self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE)
+
+            if watch_descriptor < 0:
+                self.log.error(f"Couldn't add inotify watch for {path} (errno {ctypes.get_errno()}), polling instead", reportable=False)
+            else:
+                self.watch_descriptor = watch_descriptor
+
+    def changed(self) -> bool:
+        if self.watch_descriptor is None:
+            return super().changed()
+
+        changed: bool = False
+
+        try:
+            events: bytes = os.read(self.inotify_fd, 65536)
+        except BlockingIOError:
+            return False
+
+        event_position: int = 0
+        while event_position < len(events):
+            name_length: int = self.EVENT_HEADER.unpack_from(events, event_position)[3]
+            name_start: int = event_position + self.EVENT_HEADER.size
+            event_position = name_start + name_length
+
+            if events[name_start:event_position].rstrip(b'\0') == self.file_name:
+                changed = True
+
+        return changed
+
+    def fileno(self) -> Optional[int]:
+        return self.inotify_fd if self.watch_descriptor is not None else None
+
+    def close(self):
+        super().close()
+
+        if self.inotify_fd >= 0:
+            os.close(self.inotify_fd)
+            self.inotify_fd = -1
+
+
+# picks the best backend that works here
+def create_watcher(log: logger.Log) -> PollingFileWatcher:
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyFileWatcher(log)
+        except (OSError, AttributeError):
+            log.error("Couldn't set up inotify, falling back to polling for file changes", reportable=False)
+
+    return PollingFileWatcher(log)
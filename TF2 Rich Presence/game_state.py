@@ -3,7 +3,7 @@
 # cython: language_level=3
 
 import time
-from typing import Dict, Optional, Tuple
+from typing import Dict, NamedTuple, Optional, Tuple
 
 import console_log
 import gamemodes
@@ -14,6 +14,19 @@ import logger
 import settings
 
 
+# everything the GUI shows from a GameState, frozen so that it can be handed from the main loop's worker thread to the GUI's thread
+class GameStateSnapshot(NamedTuple):
+    in_menus: bool
+    tf2_map: str
+    tf2_class: str
+    queued_state: str
+    gamemode: str
+    custom_map: bool
+    map_line: str
+    top_line: Optional[str]
+    bottom_line: Optional[str]
+
+
 # this could be in main.py due to being so closely linked to the main logic, but I figured this was better for organization
 class GameState:
     def __init__(self, log: Optional[logger.Log] = None, loc: Optional[localization.Localizer] = None):
@@ -35,10 +48,10 @@ class GameState:
         self.map_line: str = ''
 
         self.update_rpc: bool = True
+        self.activity_shows_map_time: bool = False  # if so, the activity goes stale without the game state changing
         # don't track whether the GUI needs to be updated, main just always calls its updates and lets it handle whether or not it needs to set elements
         self.prev_line_settings: tuple[str, str] = ('', '')
         self.force_zero_map_time: bool = False
-        self.console_log_persistence: console_log.ConsoleLogPersistence = console_log.ConsoleLogPersistence()
 
         if log:
             self.log: logger.Log = log
@@ -52,6 +65,8 @@ class GameState:
             self.loc = localization.Localizer()
             self.log.error("Initialized GameState without a localizer")
 
+        self.console_log_state: console_log.ConsoleLogStateMachine = console_log.ConsoleLogStateMachine(self.log)
+
     def __repr__(self) -> str:
         return f"game_state.GameState ({str(self)})"
 
@@ -61,17 +76,27 @@ class GameState:
         else:
             return f"{self.tf2_class} on {self.map_fancy}, gamemode={self.gamemode}, hosting={self.hosting}, queued=\"{self.queued_state}\", server=\"{self.server_name}\""
 
+    # what console.log parsing needs to resume, besides the game state itself
+    @property
+    def console_log_persistence(self) -> console_log.ConsoleLogPersistence:
+        return self.console_log_state.persistence()
+
+    def snapshot(self) -> GameStateSnapshot:
+        return GameStateSnapshot(self.in_menus, self.tf2_map, self.tf2_class, self.queued_state, self.gamemode, self.custom_map, self.map_line,
+                                 self.get_line('top'), self.get_line('bottom'))
+
     # mess of logic that generates an activity dict for RPC
     def activity(self) -> dict:
         self.update_rpc = False
+        self.activity_shows_map_time = False
 
         if self.in_menus:
-            top_line: str = self.loc.text("In menus")
+            top_line: str = self.loc.templates.in_menus.text
             bottom_line: str = self.loc.text(self.queued_state)
             small_image: str = 'tf2_logo'
-            small_text: str = self.loc.text("Team Fortress 2")
+            small_text: str = self.loc.templates.team_fortress_2.text
             large_image: str = 'main_menu'
-            large_text_base: str = self.loc.text("In menus")
+            large_text_base: str = self.loc.templates.in_menus.text
 
             if self.queued_state == "Queued for Casual":
                 large_image = 'casual'
@@ -146,15 +171,16 @@ class GameState:
             self.log.error("Small text is blank")
             small_text = "Team Fortress 2"
 
-        large_text: str = self.loc.text("{0} - TF2 Rich Presence {1}").format(large_text_base, launcher.VERSION)
+        large_text: str = self.loc.templates.large_text(large_text_base, launcher.VERSION)
 
         return {'details': top_line, 'state': bottom_line, 'timestamps': {'start': self.game_start_time},
                 'assets': {'large_image': large_image, 'large_text': large_text, 'small_image': small_image, 'small_text': small_text}}
 
     # set everything straight from console.log parse results
     def set_bulk(self, state: console_log.ConsoleLogParsed):
-        prev_state: str = str(self)
-        line_settings: tuple[str, str] = (settings.get('top_line'), settings.get('bottom_line'))
+        prev_state: str = str(self) if self.log.log_level_allowed('Debug') else ''  # only needed for the debug line below
+        current_settings: settings.Settings = settings.current()
+        line_settings: tuple[str, str] = (current_settings.top_line, current_settings.bottom_line)
 
         self.set_in_menus(state.in_menus)
         self.set_hosting(state.hosting)
@@ -171,7 +197,7 @@ class GameState:
         self.prev_line_settings = line_settings
 
         if self.update_rpc:
-            self.log.debug(f"Game state updated from ({prev_state}) to ({str(self)})")
+            self.log.debug("Game state updated from ({}) to ({})", prev_state, self)
 
     def set_in_menus(self, in_menus: bool):
         if in_menus != self.in_menus:
@@ -195,8 +221,8 @@ class GameState:
             if tf2_map:
                 self.map_change_time = int(time.time())
                 self.map_fancy, self.gamemode, self.gamemode_fancy, self.custom_map = gamemodes.get_map_gamemode(self.log, self.tf2_map)
-                self.map_line = self.loc.text("Map: {0} (hosting)").format(self.map_fancy) if self.hosting else self.loc.text("Map: {0}").format(self.map_fancy)
-                self.log.debug(f"Set map to {(self.tf2_map, self.map_fancy, self.gamemode)}, custom map={self.custom_map}")
+                self.map_line = self.loc.templates.map_line_hosting(self.map_fancy) if self.hosting else self.loc.templates.map_line(self.map_fancy)
+                self.log.debug("Set map to {}, custom map={}", (self.tf2_map, self.map_fancy, self.gamemode), self.custom_map)
 
     def set_tf2_class(self, tf2_class: str):
         tf2_class = tf2_class if tf2_class else "unselected"  # because console.log parse just gives an empty string when unselected
@@ -215,9 +241,11 @@ class GameState:
 
         if server_players_tuple != self.server_players:
             self.server_players = (server_players, server_players_max)
-            self.player_count_text = self.loc.text("Players: {0}/{1}").format(server_players, server_players_max)
+            self.player_count_text = self.loc.templates.player_count(server_players, server_players_max)
+
+            current_settings: settings.Settings = settings.current()
 
-            if 'Player count' in (settings.get('top_line'), settings.get('bottom_line')):
+            if 'Player count' in (current_settings.top_line, current_settings.bottom_line):
                 self.update_rpc = True
 
     def set_queued_state(self, queued_state: str):
@@ -233,16 +261,17 @@ class GameState:
     # convert seconds to a pretty timestamp, keep leading zeros though
     def time_on_map(self) -> str:
         if self.force_zero_map_time:
-            return self.loc.text("Time on map: {0}").format('0:00')
+            return self.loc.templates.time_on_map('0:00')
         else:
             seconds_on_map: float = time.time() - self.map_change_time
             time_format: str = '%M:%S' if seconds_on_map <= 3600 else '%H:%M:%S'
             map_time_formatted: str = time.strftime(time_format, time.gmtime(seconds_on_map)).removeprefix('0')
-            return self.loc.text("Time on map: {0}").format(map_time_formatted)
+            return self.loc.templates.time_on_map(map_time_formatted)
 
     # get either the top or bottom line, based on user settings
     def get_line(self, line: str = 'top', rpc: bool = False) -> Optional[str]:
-        line_setting: str = settings.get('top_line' if line == 'top' else 'bottom_line')
+        current_settings: settings.Settings = settings.current()
+        line_setting: str = current_settings.top_line if line == 'top' else current_settings.bottom_line
 
         if line_setting == 'Server name':
             if self.server_name:
@@ -253,11 +282,11 @@ class GameState:
             return self.player_count_text
         elif line_setting == 'Time on map':
             if rpc:
-                self.update_rpc = True  # because new time on map guarantees changed RPC
+                self.activity_shows_map_time = True
 
             return self.time_on_map()
         elif line_setting == 'Class':
-            return self.loc.text("Class: {0}").format(self.loc.text(self.tf2_class))
+            return self.loc.templates.class_line(self.loc.text(self.tf2_class))
         elif line_setting == 'Map':
             return self.map_fancy
         else:
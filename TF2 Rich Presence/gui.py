@@ -169,13 +169,13 @@ class GUI(tk.Frame):
         if bg_state != self.bg_state:
             self.canvas.itemconfigure(self.bg_image, image=self.bg_image_load(bg))
             self.bg_state = bg_state
-            self.log.debug(f"Updated GUI BG state: {bg_state}")
+            self.log.debug("Updated GUI BG state: {}", bg_state)
 
         if line != self.text_state:
             self.clear_text(1)
             self.canvas.itemconfigure(self.text_1, text=line)
             self.text_state = (line,)
-            self.log.debug(f"Updated GUI text state: \"{line}\"")
+            self.log.debug("Updated GUI text state: \"{}\"", line)
 
     # set the BG and line states (3 lines, for in menus)
     def set_state_3(self, bg: str, lines: Tuple[str, str, str]):
@@ -184,7 +184,7 @@ class GUI(tk.Frame):
         if bg_state != self.bg_state:
             self.canvas.itemconfigure(self.bg_image, image=self.bg_image_load(bg, (bg_state[1], bg_state[2])))
             self.bg_state = bg_state
-            self.log.debug(f"Updated GUI BG state: {bg_state}")
+            self.log.debug("Updated GUI BG state: {}", bg_state)
 
         if lines != self.text_state:
             self.clear_text(3)
@@ -193,7 +193,7 @@ class GUI(tk.Frame):
             self.canvas.itemconfigure(self.text_3_2, text=lines[2])
             self.auto_adjust_centered(lines)
             self.text_state = lines
-            self.log.debug(f"Updated GUI text state: {lines}")
+            self.log.debug("Updated GUI text state: {}", lines)
 
     # set the BG and line states (4 lines, for in game)
     def set_state_4(self, bg: str, lines: Tuple[str, str, str, str]):
@@ -202,7 +202,7 @@ class GUI(tk.Frame):
         if bg_state != self.bg_state:
             self.canvas.itemconfigure(self.bg_image, image=self.bg_image_load(bg, (bg_state[1], bg_state[2])))
             self.bg_state = bg_state
-            self.log.debug(f"Updated GUI BG state: {bg_state}")
+            self.log.debug("Updated GUI BG state: {}", bg_state)
 
         if lines != self.text_state:
             self.clear_text(4)
@@ -212,7 +212,7 @@ class GUI(tk.Frame):
             self.canvas.itemconfigure(self.text_4_3, text=lines[3])
             self.auto_adjust_centered(lines)
             self.text_state = lines
-            self.log.debug(f"Updated GUI text state: {lines}")
+            self.log.debug("Updated GUI text state: {}", lines)
 
     # set the map/gamemode/queued image
     def set_fg_image(self, image: str):
@@ -223,7 +223,7 @@ class GUI(tk.Frame):
 
             self.canvas.itemconfigure(self.fg_image, image=self.fg_image_load(image, 120))
             self.fg_state = image
-            self.log.debug(f"Updated GUI FG image to {image}")
+            self.log.debug("Updated GUI FG image to {}", image)
 
     # set the class icon image, over the FG
     def set_class_image(self, tf2_class: str):
@@ -233,7 +233,7 @@ class GUI(tk.Frame):
             if class_path != self.class_state:
                 self.canvas.itemconfigure(self.class_image, image=self.fg_image_load(class_path, 60))
                 self.class_state = class_path
-                self.log.debug(f"Updated GUI class image to {class_path}")
+                self.log.debug("Updated GUI class image to {}", class_path)
         else:
             self.clear_class_image()
 
@@ -259,7 +259,7 @@ class GUI(tk.Frame):
                 break
 
         if text != prev_text:
-            self.log.debug(f"Updated GUI bottom text to \"{text}\" (state: {self.bottom_text_state})")
+            self.log.debug("Updated GUI bottom text to \"{}\" (state: {})", text, self.bottom_text_state)
             self.canvas.itemconfigure(self.bottom_text, text=text)
 
         return text
@@ -283,7 +283,7 @@ class GUI(tk.Frame):
         if title != self.window_title:
             self.window_title = title
             self.master.title(title)
-            self.log.debug(f"Set window title to \"{title}\"")
+            self.log.debug("Set window title to \"{}\"", title)
 
     # clears any text that isn't blank, set dont_clear to avoid clearing text that will be overwritten anyway
     def clear_text(self, dont_clear: int):
@@ -342,7 +342,7 @@ class GUI(tk.Frame):
             return
 
         self.centerable_elements_offset = target_offset
-        self.log.debug(f"Offset centerable elements to {target_offset} (delta = {move_delta})")
+        self.log.debug("Offset centerable elements to {} (delta = {})", target_offset, move_delta)
 
         for centerable_element in self.centerable_elements:
             self.canvas.move(centerable_element, move_delta, 0)
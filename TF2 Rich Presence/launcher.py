@@ -101,15 +101,8 @@ def handle_crash():
 # don't report the same exception twice
 def exc_already_reported(tb: str) -> bool:
     try:
-        tb_hash: str = str(zlib.crc32(tb.encode('UTF8', errors='replace')))  # technically not a hash but w/e
-        db: dict = utils.access_db()
-
-        if tb_hash in db['tb_hashes']:
-            return True
-        else:
-            db['tb_hashes'].append(tb_hash)
-            utils.access_db(db)
-            return False
+        tb_hash: int = zlib.crc32(tb.encode('UTF8', errors='replace'))  # technically not a hash but w/e
+        return not utils.reported_hashes('tb_hashes').add(tb_hash)
     except Exception:
         return False
 
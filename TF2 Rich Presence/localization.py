@@ -5,10 +5,14 @@
 import ctypes
 import functools
 import locale
+import math
+import mmap
 import os
+import struct
+import weakref
 import zlib
 from tkinter import messagebox
-from typing import Dict, Optional, Tuple, Union
+from typing import Callable, Dict, NamedTuple, Optional, Tuple, Union
 from typing import List
 
 import ujson
@@ -26,6 +30,10 @@ class Localizer:
         self.appending: bool = appending  # if extending localization files
         self.text.cache_clear()
         self.missing_lines: List[str] = utils.access_db()['missing_localization'] if persist_missing else []
+        self.templates: TemplateRegistry = TemplateRegistry(self)
+
+        if not language:
+            setting_localizers.add(self)  # so that it can follow the language setting
 
     def __repr__(self) -> str:
         return f"localization.Localizer ({self.language}, appending={self.appending}, {len(self.missing_lines)} missing lines)"
@@ -39,7 +47,9 @@ class Localizer:
             access_localization_data(append=(english_text_adler32, english_text))
             return english_text
 
-        if english_text_adler32 not in access_localization_data()[self.language]:
+        localized_text: Optional[str] = catalog().lookup(self.language, int(english_text_adler32))
+
+        if localized_text is None:
             if english_text not in self.missing_lines:
                 self.missing_lines.append(english_text)
 
@@ -57,10 +67,244 @@ class Localizer:
             # this means that that file is only used for helping with translating
             return english_text
         else:
-            try:
-                return access_localization_data()[self.language][english_text_adler32]
-            except KeyError as error:
-                raise KeyError(f"{error}, ({english_text_adler32}, {self.language})")
+            return localized_text
+
+    # switches to another language, including every template
+    def set_language(self, language: str):
+        if language != self.language:
+            self.language = language
+            self.text.cache_clear()
+            self.templates.resolve()
+
+
+# text that's shown (and usually formatted) every loop, localized once ahead of time. call it with the format args, e.g. loc.templates.time_on_map('1:23')
+class Template:
+    def __init__(self, english_text: str):
+        self.english_text: str = english_text
+        self.text: str = english_text
+        self.format: Callable[..., str] = english_text.format
+
+    def __repr__(self) -> str:
+        return f"localization.Template ({repr(self.english_text)} -> {repr(self.text)})"
+
+    def __call__(self, *args) -> str:
+        return self.format(*args)
+
+    def resolve(self, localized_text: str):
+        self.text = localized_text
+        self.format = localized_text.format  # bound once, instead of looking up the method every call
+
+
+# every template in TEMPLATES, as an attribute (e.g. loc.templates.in_menus). the Template objects stay the same when the language changes, they just get resolved again
+class TemplateRegistry:
+    def __init__(self, localizer: Localizer):
+        self.localizer: Localizer = localizer
+
+        for name, english_text in TEMPLATES.items():
+            setattr(self, name, Template(english_text))
+
+        self.resolve()
+
+    def __repr__(self) -> str:
+        return f"localization.TemplateRegistry ({self.localizer.language}, {len(TEMPLATES)} templates)"
+
+    def resolve(self):
+        if self.localizer.appending:
+            return
+
+        for name, english_text in TEMPLATES.items():
+            getattr(self, name).resolve(self.localizer.text(english_text))
+
+    # english text: localized text, for everything in use
+    def resolved(self) -> Dict[str, str]:
+        return {english_text: getattr(self, name).text for name, english_text in TEMPLATES.items()}
+
+
+# every language's text, compiled from locales/*.json by compile_catalog() into one file that's memory-mapped, so that only what's actually looked up gets read
+# (instead of parsing every language's JSON at startup). each language has a string table and a perfect hash index on the text hash, so a lookup is one probe
+#
+# the file is MAGIC, a u16 language count, then for each language: its name, localized name, and code (each a u8 length and UTF-8), and the u32 offset of its section
+# a section is a header (SECTION_HEADER), a u32 seed per bucket, the slots (SLOT, with unused ones having EMPTY_SLOT as the key), the other JSON keys
+# (credits, notes, etc.) as a u32 length and JSON, then the strings. a key's bucket is key_hash(key, 0) % buckets, and its slot is key_hash(key, that bucket's seed) % slots
+class LocalizationCatalog:
+    MAGIC: bytes = b'TF2RPLC\x01'
+    SECTION_HEADER: struct.Struct = struct.Struct('<IIII')  # key count, bucket count, slot count, offset of the strings from the start of the section
+    SLOT: struct.Struct = struct.Struct('<QII')  # key, string offset (from the start of the strings), string length
+    EMPTY_SLOT: int = 0xFFFFFFFFFFFFFFFF
+
+    def __init__(self, path: Optional[str] = None, data: Optional[bytes] = None):
+        self.path: Optional[str] = path
+
+        if data is None:
+            with open(path, 'rb') as catalog_file:
+                self.data: Union[mmap.mmap, bytes] = mmap.mmap(catalog_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = data
+
+        if self.data[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError(f"{path} isn't a localization catalog")
+
+        self.languages: Dict[str, Tuple[str, str, int]] = {}  # name: (localized name, code, section offset)
+        self.sections: Dict[str, CatalogSection] = {}  # only read once a language is used
+        language_count: int = struct.unpack_from('<H', self.data, len(self.MAGIC))[0]
+        position: int = len(self.MAGIC) + 2
+
+        for _ in range(language_count):
+            language_strings: List[str] = []
+
+            for _ in range(3):
+                string_length: int = self.data[position]
+                language_strings.append(self.data[position + 1:position + 1 + string_length].decode('UTF8'))
+                position += 1 + string_length
+
+            self.languages[language_strings[0]] = (language_strings[1], language_strings[2], struct.unpack_from('<I', self.data, position)[0])
+            position += 4
+
+    def __repr__(self) -> str:
+        return f"localization.LocalizationCatalog ({self.path}, {len(self.languages)} languages, {len(self.sections)} loaded)"
+
+    def section(self, language: str) -> 'CatalogSection':
+        if language not in self.sections:
+            section_offset: int = self.languages[language][2]
+            key_count, bucket_count, slot_count, strings_offset = self.SECTION_HEADER.unpack_from(self.data, section_offset)
+            seeds_offset: int = section_offset + self.SECTION_HEADER.size
+            seeds: Tuple[int, ...] = struct.unpack_from(f'<{bucket_count}I', self.data, seeds_offset)
+            self.sections[language] = CatalogSection(key_count, seeds, slot_count, seeds_offset + bucket_count * 4, section_offset + strings_offset)
+
+        return self.sections[language]
+
+    # the text for a key (as in, int(hash_text(english_text))), or None if the language doesn't have it
+    def lookup(self, language: str, key: int) -> Optional[str]:
+        section: CatalogSection = self.section(language)
+        seed: int = section.seeds[key_hash(key, 0) % len(section.seeds)]
+        slot_key, string_offset, string_length = self.SLOT.unpack_from(self.data, section.slots_offset + (key_hash(key, seed) % section.slot_count) * self.SLOT.size)
+
+        if slot_key != key:
+            return None
+
+        string_start: int = section.strings_offset + string_offset
+        return self.data[string_start:string_start + string_length].decode('UTF8')
+
+    # name_localized, code, credits, and notes
+    def meta(self, language: str) -> dict:
+        section: CatalogSection = self.section(language)
+        meta_offset: int = section.slots_offset + section.slot_count * self.SLOT.size
+        meta_length: int = struct.unpack_from('<I', self.data, meta_offset)[0]
+        return ujson.loads(self.data[meta_offset + 4:meta_offset + 4 + meta_length])
+
+    def name_localized(self, language: str) -> str:
+        return self.languages[language][0]
+
+    def code(self, language: str) -> str:
+        return self.languages[language][1]
+
+
+class CatalogSection(NamedTuple):
+    key_count: int
+    seeds: Tuple[int, ...]
+    slot_count: int
+    slots_offset: int
+    strings_offset: int
+
+
+# builds the catalog from the JSON files (done by build.py, and automatically when running from source), returning it and saving it to path if there is one
+def compile_catalog(path: Optional[str] = None) -> bytes:
+    localization_data: dict = read_localization_files()
+    meta_keys: Tuple[str, ...] = ('name_localized', 'code', 'credits', 'notes')
+    directory: List[bytes] = [LocalizationCatalog.MAGIC, struct.pack('<H', len(localization_data))]
+    sections: List[bytes] = []
+    directory_size: int = len(LocalizationCatalog.MAGIC) + 2 + sum(3 + len(lang.encode('UTF8')) + len(localization_data[lang]['name_localized'].encode('UTF8')) +
+                                                                   len(localization_data[lang]['code'].encode('UTF8')) + 4 for lang in localization_data)
+    section_offset: int = directory_size
+
+    for lang in sorted(localization_data):
+        lang_data: dict = localization_data[lang]
+        lines: Dict[int, bytes] = {int(key): line.encode('UTF8') for key, line in lang_data.items() if key not in meta_keys}
+        bucket_count: int = max(math.ceil(len(lines) / 3), 1)
+        slot_count: int = max(math.ceil(len(lines) * 1.25), 1)
+        seeds: List[int] = [0] * bucket_count
+        slots: List[Optional[int]] = [None] * slot_count
+        buckets: Dict[int, List[int]] = {}
+
+        for key in lines:
+            buckets.setdefault(key_hash(key, 0) % bucket_count, []).append(key)
+
+        # the biggest buckets are the hardest to place, so they go first
+        for bucket, bucket_keys in sorted(buckets.items(), key=lambda bucket_pair: len(bucket_pair[1]), reverse=True):
+            for seed in range(1, 1_000_000):
+                bucket_slots: List[int] = [key_hash(key, seed) % slot_count for key in bucket_keys]
+
+                if len(set(bucket_slots)) == len(bucket_slots) and all(slots[slot] is None for slot in bucket_slots):
+                    seeds[bucket] = seed
+
+                    for key, slot in zip(bucket_keys, bucket_slots):
+                        slots[slot] = key
+
+                    break
+            else:
+                raise ValueError(f"Couldn't find a perfect hash for {lang}")
+
+        strings: List[bytes] = []
+        string_offsets: Dict[int, int] = {}
+        strings_size: int = 0
+
+        for key, line in lines.items():
+            string_offsets[key] = strings_size
+            strings.append(line)
+            strings_size += len(line)
+
+        slots_packed: bytes = b''.join(LocalizationCatalog.SLOT.pack(key, string_offsets[key], len(lines[key])) if key is not None else LocalizationCatalog.SLOT.pack(LocalizationCatalog.EMPTY_SLOT, 0, 0)
+                                       for key in slots)
+        meta_packed: bytes = ujson.dumps({key: lang_data[key] for key in meta_keys if key in lang_data}, ensure_ascii=False).encode('UTF8')
+        strings_offset: int = LocalizationCatalog.SECTION_HEADER.size + bucket_count * 4 + len(slots_packed) + 4 + len(meta_packed)
+        section: bytes = b''.join((LocalizationCatalog.SECTION_HEADER.pack(len(lines), bucket_count, slot_count, strings_offset), struct.pack(f'<{bucket_count}I', *seeds), slots_packed,
+                                   struct.pack('<I', len(meta_packed)), meta_packed, *strings))
+
+        for language_string in (lang, lang_data['name_localized'], lang_data['code']):
+            language_string_bytes: bytes = language_string.encode('UTF8')
+            directory.append(bytes((len(language_string_bytes),)) + language_string_bytes)
+
+        directory.append(struct.pack('<I', section_offset))
+        sections.append(section)
+        section_offset += len(section)
+
+    catalog_data: bytes = b''.join(directory + sections)
+
+    if path:
+        # written to a temporary file first and then renamed over the old one, so nothing can ever map a half-written catalog
+        with open(f'{path}.tmp', 'wb') as catalog_file:
+            catalog_file.write(catalog_data)
+
+        os.replace(f'{path}.tmp', path)
+
+    return catalog_data
+
+
+# the catalog at locales/catalog.bin. when running from source, it's recompiled whenever the JSON files are newer than it
+@functools.cache
+def catalog() -> LocalizationCatalog:
+    catalog_path: str = os.path.join('locales', 'catalog.bin')
+
+    try:
+        catalog_mtime: Optional[float] = os.stat(catalog_path).st_mtime
+    except FileNotFoundError:
+        catalog_mtime = None
+
+    if catalog_mtime is None or (launcher.DEBUG and any(os.stat(os.path.join('locales', file)).st_mtime > catalog_mtime for file in os.listdir('locales') if file.endswith('.json'))):
+        try:
+            compile_catalog(catalog_path)
+        except OSError:
+            return LocalizationCatalog(data=compile_catalog())  # can't save it, so just keep it in memory
+
+    return LocalizationCatalog(catalog_path)
+
+
+# SplitMix64's finalizer, with a seed
+def key_hash(key: int, seed: int) -> int:
+    hashed: int = (key + seed * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    hashed = ((hashed ^ (hashed >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    hashed = ((hashed ^ (hashed >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return hashed ^ (hashed >> 31)
 
 
 @functools.cache
@@ -119,7 +363,7 @@ def detect_system_language(log: logger.Log):
     db: Dict[str, Union[bool, list, str]] = utils.access_db()
 
     if not db['has_asked_language']:
-        language_codes: dict = {read_localization_files()[lang]['code']: lang for lang in langs[1:]}
+        language_codes: dict = {catalog().code(lang): lang for lang in langs[1:]}
         system_locale: str = locale.windows_locale[ctypes.windll.kernel32.GetUserDefaultUILanguage()]
         system_language_code: str = system_locale.split('_')[0]
         is_brazilian_port: bool = system_locale == 'pt_BR'
@@ -146,10 +390,35 @@ def detect_system_language(log: logger.Log):
                 settings.change('language', system_language)
 
 
+# Localizers that didn't get a specific language, and so switch when the setting changes
+def settings_changed(changed: Dict[str, Union[str, int, bool, None]]):
+    if 'language' in changed:
+        for localizer in list(setting_localizers):
+            localizer.set_language(settings.get('language'))
+
+
+# every bit of text that's used every loop, by name. also makes the text that's most often seen easy to find for translating
+TEMPLATES: Dict[str, str] = {'window_title': "TF2 Rich Presence ({0})",
+                             'window_title_menus': "{0} - {1} ({2})",
+                             'window_title_in_game': "{0} - {1} on {2}",
+                             'window_title_waiting': "{0} - Waiting for {1}",
+                             'not_running': "{0} isn't running",
+                             'time_elapsed': "{0} elapsed",
+                             'in_menus': "In menus",
+                             'team_fortress_2': "Team Fortress 2",
+                             'large_text': "{0} - TF2 Rich Presence {1}",
+                             'map_line': "Map: {0}",
+                             'map_line_hosting': "Map: {0} (hosting)",
+                             'player_count': "Players: {0}/{1}",
+                             'time_on_map': "Time on map: {0}",
+                             'class_line': "Class: {0}"}
+setting_localizers: weakref.WeakSet = weakref.WeakSet()
+settings.subscribe(settings_changed)
+
 with open(os.path.join('locales', 'order.txt'), 'r') as order_file:
     langs: List[str] = order_file.read().splitlines()
 
-langs_localized: List[str] = [read_localization_files()[lang]['name_localized'] for lang in langs]
+langs_localized: List[str] = [catalog().name_localized(lang) for lang in langs]
 
 
 if __name__ == '__main__':
@@ -2,29 +2,41 @@
 # https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
 # cython: language_level=3
 
+import atexit
+import collections
 import datetime
 import functools
 import getpass
 import gzip
+import lzma
 import os
+import queue
+import shutil
 import socket
 import sys
+import threading
 import time
 import traceback
 import zlib
-from operator import itemgetter
-from typing import Dict, List, Optional, TextIO, Tuple, Union
+from typing import BinaryIO, Callable, Dict, List, Optional, Set, TextIO, Tuple, Union
 
 import sentry_sdk
+import sentry_sdk.scope
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 import launcher
+import session_log
 import settings
 import utils
 
 
 # TODO: replace this whole thing with a real logger
 class Log:
-    def __init__(self, path: Optional[str] = None):
+    def __init__(self, path: Optional[str] = None, structured: bool = False):
         # make sure there's actually somewhere to put the log
         if os.path.isdir('logs'):
             self.logs_path: str = 'logs'
@@ -50,14 +62,14 @@ class Log:
         if path:
             self.filename: str = path
         else:
-            existing_logs: List[str] = sorted(os.listdir(self.logs_path))
+            existing_logs: Set[str] = set(os.listdir(self.logs_path))
             log_index: int = 0
 
             while True:
                 filename: str = f'TF2RP_{user_pc_name}_{user_identifier}_{launcher.VERSION}_{log_index}.log'
                 log_index += 1
 
-                if filename not in existing_logs and f'{filename}.gz' not in existing_logs:
+                if filename not in existing_logs and not any(f'{filename}{suffix}' in existing_logs for suffix in COMPRESSED_SUFFIXES):
                     break
 
             self.filename = os.path.join(self.logs_path, filename)
@@ -68,18 +80,29 @@ class Log:
         self.to_stderr: bool = launcher.DEBUG
         self.force_disabled: bool = False
         self.log_levels: List[str] = ['Debug', 'Info', 'Error', 'Critical', 'Off']
-        self.local_error_hashes: List[int] = []  # just in case DB.json breaks
+
+        self.structured_filename: Optional[str] = f'{os.path.splitext(self.filename)[0]}{session_log.EXTENSION}' if structured else None
+        self.structured_file: Optional[BinaryIO] = None
 
         if self.enabled():
             self.log_file: TextIO = open(self.filename, 'a', encoding='UTF8')
 
+            if structured:
+                # everything that's logged also goes into a session log, for session_log_query.py to dig through
+                self.structured_file = open(self.structured_filename, 'ab')
+
+                if self.structured_file.tell() == 0:
+                    self.structured_file.write(session_log.MAGIC)
+
+                self.event('session_start', version=launcher.VERSION, text_log=os.path.basename(self.filename))
+
             if created_logs_dir:
                 self.debug(f"Created logs folder at {os.path.abspath(self.logs_path)}")
 
         try:
-            utils.access_db(write=utils.access_db(), pass_permission_error=False)
+            utils.access_db(write=utils.access_db(), pass_permission_error=False, force=True)
         except PermissionError:
-            self.error("DB.json can't be written to, due to permissions. This could cause crashes")
+            self.error("DB.sqlite can't be written to, due to permissions. This could cause crashes")
 
         self.debug(f"Created {repr(self)}")
 
@@ -91,22 +114,26 @@ class Log:
         try:
             if self.enabled() and not self.log_file.closed:
                 self.debug(f"Closing log file ({self.filename}) via destructor")
+                self.flush()
                 self.log_file.close()
+
+                if self.structured_file:
+                    self.structured_file.close()
         except Exception as error:
             print(f"Couldn't safely close log: {error}'")
 
     def enabled(self) -> bool:
-        return settings.get('log_level') != 'Off' and not self.force_disabled
+        return settings.current().log_level != 'Off' and not self.force_disabled
 
     # list of log levels that are higher priority than the log_level setting
     def log_levels_allowed(self) -> List[str]:
-        return [level for level in self.log_levels if self.log_levels.index(level) >= self.log_levels.index(settings.get('log_level'))]
+        return [level for level in self.log_levels if self.log_levels.index(level) >= self.log_levels.index(settings.current().log_level)]
 
     @functools.cache
     def log_level_allowed(self, level: str):
         return level in self.log_levels_allowed()
 
-    # adds a line to the current log file
+    # adds a line to the current log file (eventually, the actual writing happens on log_writer's thread)
     def write_log(self, level: str, message_out: str, use_errors_file: bool = False):
         if self.enabled():
             if self.last_log_time:
@@ -114,59 +141,57 @@ class Log:
             else:
                 time_since_last = '+0.0000'
 
-            full_line: str = f"[{datetime.datetime.now().strftime('%c')[4:-5]} {time_since_last}] {level}: {message_out}\n"
+            log_time: float = time.time()
+            full_line: str = f"[{formatted_time(int(log_time))} {time_since_last}] {level}: {message_out}\n"
 
-            if settings.get('sentry_level') != "Never":
-                # log breadcrumb to Sentry
-                sentry_sdk.add_breadcrumb(message=full_line[-512:], level=level.lower().replace('critical', 'fatal'))
+            if settings.current().sentry_level != "Never":
+                breadcrumbs.add(log_time, level, message_out)
 
-            try:
-                self.log_file.write(full_line)
-                self.log_file.flush()
-
-                if use_errors_file and not launcher.DEBUG:
-                    with open(self.filename_errors, 'a', encoding='UTF8') as errors_log:
-                        errors_log.write(full_line)
-            except UnicodeEncodeError as error:
-                self.error(f"Couldn't write log due to UnicodeEncodeError: {error}")
-            except PermissionError as error:
-                self.error(f"Couldn't write log due to PermissionError: {error}")
-            except OSError as error:
-                if "No space left on device" in str(error):
-                    # not my problem
-                    pass
-                else:
-                    raise
+            log_writer.write(self.log_file, full_line)
+
+            if self.structured_file:
+                log_writer.write(self.structured_file, session_log.encode_record(log_time, level.title(), 'log', {'message': message_out}))
+
+            if use_errors_file and not launcher.DEBUG:
+                log_writer.write(self.filename_errors, full_line)
 
             if self.to_stderr:
                 print(full_line[:-1], file=sys.stderr)
 
             self.last_log_time = time.perf_counter()
 
+            if log_writer.write_errors:
+                self.error(log_writer.write_errors.pop(0), reportable=False)
+
+    # a record that only goes in the session log (if there is one), with whatever fields are useful for later. not affected by the log level
+    def event(self, event_type: str, level: str = 'Debug', **fields):
+        if self.structured_file and self.enabled():
+            log_writer.write(self.structured_file, session_log.encode_record(time.time(), level, event_type, fields))
+
+    # blocks until everything logged so far is actually in the file
+    def flush(self):
+        log_writer.flush()
+
     # a log with a level of INFO (not commonly used)
-    def info(self, message_in: str):
+    def info(self, message_in: Union[str, Callable[[], str]], *args):
         if self.log_level_allowed('Info'):
-            self.write_log('INFO', message_in)
+            self.write_log('INFO', deferred_message(message_in, args))
 
     # a log with a level of DEBUG (most things)
-    def debug(self, message_in: str):
+    def debug(self, message_in: Union[str, Callable[[], str]], *args):
         if self.log_level_allowed('Debug'):
-            self.write_log('DEBUG', message_in)
+            self.write_log('DEBUG', deferred_message(message_in, args))
 
     # a log with a level of ERROR (caught, non-fatal errors)
     def error(self, message_in: str, reportable: bool = True):
         if self.log_level_allowed('Error'):
             self.write_log('ERROR', message_in, use_errors_file=reportable)
 
-        if reportable and settings.get('sentry_level') == 'All errors':
-            db: Dict[str, Union[bool, list, str]] = utils.access_db()
+        if reportable and settings.current().sentry_level == 'All errors':
             message_hash: int = zlib.adler32(message_in.encode('UTF8'))
 
-            if message_hash not in db['error_hashes'] and message_hash not in self.local_error_hashes:
-                self.local_error_hashes.append(message_hash)
+            if utils.reported_hashes('error_hashes').add(message_hash):
                 sentry_sdk.capture_message(message_in[-512:])
-                db['error_hashes'].append(message_hash)
-                utils.access_db(write=db)
             else:
                 self.debug("Not reporting the error (has already been reported)")
 
@@ -175,44 +200,259 @@ class Log:
         if self.log_level_allowed('Critical'):
             self.write_log('CRITICAL', message_in, use_errors_file=True)
 
-    # deletes older log files and compresses the rest
-    def cleanup(self, max_logs: int):
-        all_logs: List[str] = [os.path.join(self.logs_path, log) for log in os.listdir(self.logs_path) if not log.endswith('.errors.log')]
-        all_logs_times: List[Tuple[str, int]] = [(log_filename, os.stat(log_filename).st_mtime_ns) for log_filename in all_logs]
-        all_logs_sorted: List[str] = [log_pair[0] for log_pair in sorted(all_logs_times, key=itemgetter(1))]
-        overshoot: int = max_logs - len(all_logs_sorted)
+        self.flush()  # probably about to crash
+
+    # deletes older log files and compresses the rest. keeps at most max_logs (including the current one), then if max_bytes is set, also deletes the oldest until the rest fit in that
+    # slow-ish with big logs, so main runs this on its own thread
+    def cleanup(self, max_logs: int, max_bytes: int = 0, compression: str = 'gz'):
+        current_logs: Tuple[str, Optional[str]] = (self.filename, self.structured_filename)
+
+        # scandir gets the stats along with the names (for free, on Windows), instead of a stat call per file
+        with os.scandir(self.logs_path) as logs_dir:
+            log_entries: List[os.DirEntry] = [entry for entry in logs_dir if entry.is_file() and not entry.name.endswith('.errors.log')]
+
+        old_logs_sorted: List[Tuple[str, int]] = [(entry.path, entry.stat().st_size) for entry in sorted(log_entries, key=lambda entry: entry.stat().st_mtime_ns) if entry.path not in current_logs]
+        max_old_logs: int = max_logs - (len(log_entries) - len(old_logs_sorted))
         deleted_logs: List[str] = []
         compressed_logs: List[Tuple[str, float, float]] = []
 
-        while overshoot < 0:
-            log_to_delete: str = all_logs_sorted.pop(0)
+        while old_logs_sorted and len(old_logs_sorted) > max_old_logs:
+            log_to_delete: str = old_logs_sorted.pop(0)[0]
             deleted_logs.append(log_to_delete)
+            self.delete_log(log_to_delete)
+
+        for log_index, (old_log, old_log_size) in enumerate(old_logs_sorted):
+            if not old_log.endswith(COMPRESSED_SUFFIXES):
+                compressed_log: str = self.compress_log(old_log, compression)
+                compressed_size: int = os.stat(compressed_log).st_size
+                old_logs_sorted[log_index] = (compressed_log, compressed_size)
+                compressed_logs.append((old_log, round(old_log_size / 1024, 1), round(compressed_size / 1024, 1)))
+
+        if max_bytes:
+            old_logs_size: int = sum(log_pair[1] for log_pair in old_logs_sorted)
+
+            while old_logs_sorted and old_logs_size > max_bytes:
+                log_to_delete, log_size = old_logs_sorted.pop(0)
+                deleted_logs.append(log_to_delete)
+                old_logs_size -= log_size
+                self.delete_log(log_to_delete)
+
+        self.debug("Deleted {} log(s): {}", len(deleted_logs), deleted_logs)
+        self.debug("Compressed {} log(s): {}", len(compressed_logs), compressed_logs)
+
+    def delete_log(self, log_to_delete: str):
+        try:
+            os.remove(log_to_delete)
+        except Exception as e:
+            self.error(f"Couldn't delete old log file {log_to_delete}: {traceback.format_exc()}", reportable=not isinstance(e, PermissionError))
+
+    # streams the log into a compressed copy (so memory use doesn't depend on how big it is), then deletes the original. returns the compressed copy's path
+    # the copy is written under a temporary name first, so that a failure partway through doesn't leave a broken one behind
+    def compress_log(self, old_log: str, compression: str) -> str:
+        compressed_log: str = f'{old_log}.{compression}'
+        compressed_log_temp: str = f'{compressed_log}.tmp'
+
+        try:
+            with open(old_log, 'rb') as old_log_r, open_compressed(compressed_log_temp, compression) as old_log_w:
+                shutil.copyfileobj(old_log_r, old_log_w, 1048576)
+
+            shutil.copystat(old_log, compressed_log_temp)  # keeps the modified time, so that logs stay in order for next time
+            os.replace(compressed_log_temp, compressed_log)
+        except BaseException:
+            if os.path.isfile(compressed_log_temp):
+                os.remove(compressed_log_temp)
+
+            raise
+
+        try:
+            os.remove(old_log)
+        except Exception as e:
+            self.error(f"Couldn't replace log file {old_log}: {traceback.format_exc()}", reportable=not isinstance(e, PermissionError))
+
+        return compressed_log
+
+
+# writes log lines for every Log on a background thread, in batches. lines are queued (bounded, so a stuck disk will eventually block logging instead of eating memory)
+# and written once enough have built up, once the oldest has waited flush_interval seconds, or when something calls flush()
+class LogWriter:
+    def __init__(self, max_queued: int = 10000, flush_interval: float = 1.0, flush_size: int = 65536):
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queued)  # of (target, line), with lines being bytes for binary files
+        self.flush_interval: float = flush_interval
+        self.flush_size: int = flush_size
+        self.thread: Optional[threading.Thread] = None
+        self.start_lock: threading.Lock = threading.Lock()
+        self.write_errors: List[str] = []  # for Log to report, since this can't log anything itself
+        self.unflushed: bool = False
+        self.batches_written: int = 0
+        self.lines_written: int = 0
+
+    def __repr__(self) -> str:
+        return f"logger.LogWriter ({self.lines_written} lines in {self.batches_written} batches, {self.queue.qsize()} queued)"
+
+    # target is either an open file or a path to append to
+    def write(self, target: Union[TextIO, BinaryIO, str], line: Union[str, bytes]):
+        if not self.thread:
+            self.start()
+
+        self.unflushed = True
+        self.queue.put((target, line))
+
+    def start(self):
+        with self.start_lock:
+            if not self.thread:
+                self.thread = threading.Thread(target=self.run, name='log_writer', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def flush(self, timeout: float = 5.0):
+        if self.unflushed and self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.unflushed = False
+            flushed: threading.Event = threading.Event()
+            self.queue.put((None, flushed))
+            flushed.wait(timeout)
+
+    def run(self):
+        buffers: Dict[Union[TextIO, BinaryIO, str], List[Union[str, bytes]]] = {}
+        buffered_size: int = 0
+        oldest_time: Optional[float] = None
+
+        while True:
+            wait_time: Optional[float] = None if oldest_time is None else max(oldest_time + self.flush_interval - time.perf_counter(), 0)
+            flushed: Optional[threading.Event] = None
 
             try:
-                os.remove(log_to_delete)
-            except Exception as e:
-                self.error(f"Couldn't delete old log file {log_to_delete}: {traceback.format_exc()}", reportable=not isinstance(e, PermissionError))
+                target, line = self.queue.get(timeout=wait_time)
+            except queue.Empty:
+                pass
+            else:
+                if target is None:
+                    flushed = line
+                else:
+                    buffers.setdefault(target, []).append(line)
+                    buffered_size += len(line)
+                    oldest_time = oldest_time if oldest_time is not None else time.perf_counter()
+
+            if flushed or buffered_size >= self.flush_size or (oldest_time is not None and time.perf_counter() - oldest_time >= self.flush_interval):
+                for target, lines in buffers.items():
+                    self.write_lines(target, lines)
+
+                buffers = {}
+                buffered_size = 0
+                oldest_time = None
+
+                if flushed:
+                    flushed.set()
+
+    def write_lines(self, target: Union[TextIO, BinaryIO, str], lines: List[Union[str, bytes]]):
+        try:
+            if isinstance(target, str):
+                with open(target, 'a', encoding='UTF8') as target_file:
+                    target_file.write(''.join(lines))
+            else:
+                target.write(lines[0][:0].join(lines))  # works for both str and bytes
+                target.flush()
+        except ValueError:
+            pass  # file got closed, shouldn't happen
+        except UnicodeEncodeError as error:
+            self.write_errors.append(f"Couldn't write log due to UnicodeEncodeError: {error}")
+        except PermissionError as error:
+            self.write_errors.append(f"Couldn't write log due to PermissionError: {error}")
+        except OSError as error:
+            if "No space left on device" not in str(error):  # not my problem
+                self.write_errors.append(f"Couldn't write log due to OSError: {error}")
+        else:
+            self.batches_written += 1
+            self.lines_written += len(lines)
+
+
+# the most recent log lines, for Sentry events to include as breadcrumbs. these used to be given to Sentry (via sentry_sdk.add_breadcrumb) as they were logged, which was a lot of
+# work per line for something that's almost never sent. now logging a line is just a deque append, and the breadcrumbs are only made when an event is actually being sent
+# sample_every is how many lines of each level to go through per one kept (1 is all of them, 0 is none). defaults are BREADCRUMB_DEPTH and BREADCRUMB_SAMPLE_EVERY
+class BreadcrumbBuffer:
+    def __init__(self, depth: Optional[int] = None, sample_every: Optional[Dict[str, int]] = None):
+        self.records: collections.deque = collections.deque(maxlen=depth if depth is not None else BREADCRUMB_DEPTH)  # of (unix time, level, message)
+        self.sample_every: Dict[str, int] = dict(sample_every if sample_every is not None else BREADCRUMB_SAMPLE_EVERY)
+        self.sample_counts: Dict[str, int] = {level: 0 for level in self.sample_every}
+
+    def __repr__(self) -> str:
+        return f"logger.BreadcrumbBuffer ({len(self.records)}/{self.records.maxlen} records, sample_every={self.sample_every})"
 
-            overshoot = max_logs - len(all_logs_sorted)
+    def add(self, timestamp: float, level: str, message: str):
+        sample_every: int = self.sample_every.get(level, 0)
 
-        self.debug(f"Deleted {len(deleted_logs)} log(s): {deleted_logs}")
+        if sample_every == 1:
+            self.records.append((timestamp, level, message))
+        elif sample_every:
+            self.sample_counts[level] += 1
 
-        for old_log in [log for log in all_logs if not log.endswith('.gz') and os.path.isfile(log) and log != self.filename]:
-            with open(old_log, 'rb') as old_log_r:
-                data_in: bytes = old_log_r.read()
-                data_out: bytes = gzip.compress(data_in)
+            if self.sample_counts[level] >= sample_every:
+                self.sample_counts[level] = 0
+                self.records.append((timestamp, level, message))
 
-                with open(f'{old_log}.gz', 'wb') as old_log_w:
-                    old_log_w.write(data_out)
+    # a Sentry event processor, adds the records to the event's breadcrumbs (alongside any Sentry collected itself)
+    def add_to_event(self, event: dict, hint: dict) -> dict:
+        records: collections.deque = self.records.copy()  # copying is atomic, iterating while another thread logs isn't
+
+        if records:
+            breadcrumbs_values: list = event.setdefault('breadcrumbs', {}).setdefault('values', [])
+            breadcrumbs_values.extend({'type': 'default', 'category': 'log', 'level': level.lower().replace('critical', 'fatal'), 'message': message[-512:],
+                                       'timestamp': datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)} for timestamp, level, message in records)
 
             try:
-                os.remove(old_log)
-            except Exception as e:
-                self.error(f"Couldn't replace log file {old_log}: {traceback.format_exc()}", reportable=not isinstance(e, PermissionError))
+                breadcrumbs_values.sort(key=lambda breadcrumb: breadcrumb['timestamp'])
+            except TypeError:
+                pass  # Sentry's own might have had string timestamps, so they just won't be in order
+
+        return event
+
+
+# info() and debug() messages can be given as a format string and its args, e.g. log.debug("Results: {}", results), or as a function that returns the message
+# either way, the formatting (which can mean repr'ing big dicts) only happens if the message will actually be logged
+def deferred_message(message_in: Union[str, Callable[[], str]], args: tuple) -> str:
+    if args:
+        return message_in.format(*args)
+    elif callable(message_in):
+        return message_in()
+    else:
+        return message_in
+
+
+# opens a file to write compressed data to, with compression being 'gz', 'xz', or 'zst' (only if zstandard is installed)
+def open_compressed(path: str, compression: str) -> BinaryIO:
+    if compression == 'zst':
+        return zstandard.ZstdCompressor(level=10).stream_writer(open(path, 'wb'), closefd=True)
+    elif compression == 'xz':
+        return lzma.open(path, 'wb')
+    else:
+        return gzip.GzipFile(path, 'wb')
+
+
+# zstd compresses logs smaller than gzip does, and much faster than xz
+def best_compression() -> str:
+    return 'zst' if zstandard else 'gz'
+
+
+# formatting the time is surprisingly slow, so only do it once per second
+@functools.lru_cache(maxsize=1)
+def formatted_time(timestamp: int) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%c')[4:-5]
+
+
+COMPRESSED_SUFFIXES: Tuple[str, ...] = ('.gz', '.xz', '.zst')
+BREADCRUMB_DEPTH: int = 50  # same as Sentry's own max_breadcrumbs in launcher
+BREADCRUMB_SAMPLE_EVERY: Dict[str, int] = {'DEBUG': 1, 'INFO': 1, 'ERROR': 1, 'CRITICAL': 1}
+log_writer: LogWriter = LogWriter()
+breadcrumbs: BreadcrumbBuffer = BreadcrumbBuffer()
+sentry_sdk.scope.add_global_event_processor(breadcrumbs.add_to_event)
+
+
+# the allowed log levels are cached, so they need to be recalculated when the setting changes
+def settings_changed(changed: Dict[str, Union[str, int, bool, None]]):
+    if 'log_level' in changed:
+        Log.log_level_allowed.cache_clear()
 
-            compressed_logs.append((old_log, round(len(data_in) / 1024, 1), round(len(data_out) / 1024, 1)))
 
-        self.debug(f"Compressed {len(compressed_logs)} log(s): {compressed_logs}")
+settings.subscribe(settings_changed)
 
 
 if __name__ == '__main__':
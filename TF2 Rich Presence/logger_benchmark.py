@@ -0,0 +1,80 @@
+# Copyright (C) 2018-2025 Kataiser & https://github.com/Kataiser/tf2-rich-presence/contributors
+# https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
+
+import os
+import tempfile
+import time
+from typing import Callable, List
+
+import logger
+import settings
+
+
+# compares logging a typical main loop's worth of debug lines with f-strings (formatted whether or not they get logged) vs deferred, at a few log levels
+def main():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        settings.store.backend = settings.JSONFileBackend(os.path.join(temp_dir, 'settings.json'))  # so as to not touch real settings
+        settings.store.reload()
+        settings.change('sentry_level', 'Never')
+        log: logger.Log = logger.Log(os.path.join(temp_dir, 'benchmark.log'))
+        log.to_stderr = False
+
+        for log_level in ('Debug', 'Info', 'Error'):
+            settings.change('log_level', log_level)
+            time_eager: float = best_time(lambda: loop_eager(log))
+            time_deferred: float = best_time(lambda: loop_deferred(log))
+            print(f"{log_level}: f-strings {round(time_eager * 1000, 2)} ms, deferred {round(time_deferred * 1000, 2)} ms ({round(time_eager / time_deferred, 1)}x) per 100 loops")
+
+        log.log_file.close()
+
+
+# both include waiting for the log writer, so that its thread isn't still busy when the next run is timed
+def loop_eager(log: logger.Log):
+    for loop_iteration in range(100):
+        log.debug(f"Main loop iteration this app session: {loop_iteration}")
+        log.debug(f"Process scanning (used tasklist: False) results: {snapshot}")
+        log.debug(f"console.log: 18734552 bytes, skipped to 18730011, read 4541 bytes and {loop_iteration} lines")
+        log.debug(f"console.log parse results (initial = False): {parse_results}")
+        log.debug(f"Game state updated from ({game_state}) to ({game_state})")
+        log.info(f"Queued for RPC: {activity}")
+        log.debug(f"Sleeping for 1 seconds (slow = False, fast next loop = {loop_iteration > 50})")
+
+    log.flush()
+
+
+def loop_deferred(log: logger.Log):
+    for loop_iteration in range(100):
+        log.debug("Main loop iteration this app session: {}", loop_iteration)
+        log.debug("Process scanning (used tasklist: False) results: {}", snapshot)
+        log.debug("console.log: 18734552 bytes, skipped to 18730011, read 4541 bytes and {} lines", loop_iteration)
+        log.debug("console.log parse results (initial = False): {}", parse_results)
+        log.debug("Game state updated from ({}) to ({})", game_state, game_state)
+        log.info("Queued for RPC: {}", activity)
+        log.debug(lambda: f"Sleeping for 1 seconds (slow = False, fast next loop = {loop_iteration > 50})")
+
+    log.flush()
+
+
+def best_time(func: Callable, runs: int = 5) -> float:
+    times: List[float] = []
+
+    for _ in range(runs):
+        start_time: float = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+
+    return min(times)
+
+
+# roughly what's logged while playing
+snapshot: tuple = ((True, 14872, r'C:\Program Files (x86)\Steam\steamapps\common\Team Fortress 2', 1700000000), (True, 9984, r'C:\Program Files (x86)\Steam', None), (True, 11212, None, None))
+parse_results: dict = {'in_menus': False, 'tf2_map': 'pl_upward', 'tf2_class': 'Engineer', 'queued_state': "Not queued", 'hosting': False, 'server_name': 'Valve Matchmaking Server (Virginia srcds1036-iad1 #91)',
+                       'server_players': 23, 'server_players_max': 24}
+game_state: str = 'Engineer on Upward, gamemode=payload, hosting=False, queued="Not queued", server="Valve Matchmaking Server (Virginia)"'
+activity: dict = {'details': 'Map: Upward', 'state': 'Players: 23/24', 'timestamps': {'start': 1700000000},
+                  'assets': {'large_image': 'pl_upward', 'large_text': 'Upward - TF2 Rich Presence v2.2.4', 'small_image': 'engineer', 'small_text': 'Engineer'},
+                  'buttons': [{'label': 'Get TF2 Rich Presence', 'url': 'https://github.com/Kataiser/tf2-rich-presence'}]}
+
+
+if __name__ == '__main__':
+    main()
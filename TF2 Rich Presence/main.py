@@ -22,26 +22,31 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
+import concurrent.futures
 import datetime
 import gc
 import os
 import platform
+import threading
 import time
 import traceback
-from typing import Any, Dict, Optional, Set, Tuple, Union
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
 
 import psutil
-from discoIPC import ipc
 
 import configs
 import console_log
+import discord_ipc
+import file_watch
 import game_state
 import gamemodes
 import gui
 import launcher
 import localization
 import logger
+import process_events
 import processes
+import scheduler
 import settings
 import utils
 
@@ -55,7 +60,7 @@ def launch():
     try:
         gc.disable()
 
-        log_main: logger.Log = logger.Log()
+        log_main: logger.Log = logger.Log(structured=command_line_args().structured_log)
         log_main.to_stderr = launcher.DEBUG
         log_main.info(f"Starting TF2 Rich Presence {launcher.VERSION}")
 
@@ -73,6 +78,34 @@ def launch():
         raise
 
 
+def command_line_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--launch', action='store_true', help="Automatically launch TF2 when opening the program", default=False)
+    parser.add_argument('--structured-log', action='store_true', help="Also write a session log, for session_log_query.py", default=False)
+    return parser.parse_args()
+
+
+# the GUI state that loop_work() needs, read on the GUI's thread before handing off to the worker, since the worker doesn't touch the GUI
+class LoopInputs(NamedTuple):
+    has_tf2_launch_cmd: bool
+    launched_tf2_with_button: bool
+
+
+# what one run of loop_work() found, handed from the worker thread to the GUI's thread (so it's immutable)
+class LoopResult(NamedTuple):
+    tf2_running: bool
+    steam_running: bool
+    tf2_start_time: Optional[int]
+    missing_program: Optional[str]
+    tf2_launch_cmd: Optional[Tuple[str, str]]
+    console_log_path: Optional[str]
+    game_state: Optional[game_state.GameStateSnapshot]
+    window_title: Optional[str]
+    rpc_failed: bool
+    kataiser_seen: bool
+    work_time: float
+
+
 class TF2RichPresense:
     def __init__(self, log: Optional[logger.Log] = None, set_process_priority: bool = True):
         if log:
@@ -91,10 +124,16 @@ class TF2RichPresense:
             self.log.debug(f"Non-default settings: {settings.compare_settings(default_settings, current_settings)}")
 
         self.gui: gui.GUI = gui.GUI(self.log, main_controlled=True)
+        self.scheduler: scheduler.Scheduler = scheduler.Scheduler(self.log, self.gui.master)
         self.process_scanner: processes.ProcessScanner = processes.ProcessScanner(self.log)
+        self.process_events: process_events.ProcessEventSource = process_events.create_event_source(self.log)
+        self.process_events.watch_names(self.process_scanner.executables['posix'])
+        self.last_process_snapshot: Optional[processes.ProcessSnapshot] = None  # for the worker
+        self.watched_process_snapshot: Optional[processes.ProcessSnapshot] = None  # for the GUI thread
+        self.console_log_watcher: file_watch.PollingFileWatcher = file_watch.create_watcher(self.log)
         self.loc: localization.Localizer = localization.Localizer(self.log)
         self.game_state: game_state.GameState = game_state.GameState(self.log, self.loc)
-        self.rpc_client: Optional[ipc.DiscordIPC] = None
+        self.rpc_client: discord_ipc.DiscordIPCClient = discord_ipc.DiscordIPCClient(self.log, utils.get_api_key('discord2'))
         self.client_connected: bool = False
         self.rpc_connected: bool = False
         self.test_state: str = 'init'
@@ -111,19 +150,25 @@ class TF2RichPresense:
         self.usernames: Set[str] = set()
         self.last_name_scan_time: float = time.time()  # close enough
         self.steam_config_mtimes: Dict[str, int] = {}
+        self.localconfig_cache: configs.LocalConfigCache = configs.LocalConfigCache()
+        self.tf2_install_cache: configs.TF2InstallCache = configs.TF2InstallCache()
         self.slow_sleep_time: bool = False
         self.has_set_process_priority: bool = not set_process_priority
         self.kataiser_scan_loop: int = 0
         self.did_init_operations: bool = False
         self.no_condebug: bool = False
         self.fast_next_loop: bool = False
+        self.process_events_while_busy: bool = False
+        self.sleep_start_time: float = time.perf_counter()
+        self.rpc_failed: bool = False
+        self.last_rpc_error: Optional[str] = None
+        self.loop_worker: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='main_loop')
+        self.loop_future: Optional[concurrent.futures.Future] = None
         self.reset_launched_with_button: bool = False
         self.last_console_log_size: Optional[int] = None
 
-        try:
-            self.log.cleanup(20 if launcher.DEBUG else 10)
-        except (FileNotFoundError, PermissionError):
-            self.log.error(f"Couldn't clean up logs folder:\n{traceback.format_exc()}")
+        self.log_cleanup_thread: threading.Thread = threading.Thread(target=self.cleanup_logs, name='log_cleanup', daemon=True)
+        self.log_cleanup_thread.start()
 
         self.log.debug(f"CPU: {psutil.cpu_count(logical=False)} cores, {psutil.cpu_count()} threads, {round(psutil.cpu_freq().max / 1000, 1)} GHz")
 
@@ -144,13 +189,20 @@ class TF2RichPresense:
 
         self.import_custom()
 
-        parser = argparse.ArgumentParser()
-        parser.add_argument('--launch', action='store_true', help="Automatically launch TF2 when opening the program", default=False)
-        self.auto_launch_tf2 = parser.parse_args().launch
+        self.auto_launch_tf2 = command_line_args().launch
 
     def __repr__(self) -> str:
         return f"main.TF2RichPresense (state={self.test_state})"
 
+    # runs in its own thread, since compressing old logs can take a while
+    def cleanup_logs(self):
+        try:
+            self.log.cleanup(20 if launcher.DEBUG else 10, max_bytes=100 * 1048576, compression=logger.best_compression())
+        except (FileNotFoundError, PermissionError):
+            self.log.error(f"Couldn't clean up logs folder:\n{traceback.format_exc()}")
+        except Exception:
+            self.log.error(traceback.format_exc())  # would otherwise disappear along with this thread
+
     # import custom functionality
     def import_custom(self):
         custom_functions_path: str = 'custom.py' if launcher.DEBUG else os.path.join('resources', 'custom.py')
@@ -165,57 +217,140 @@ class TF2RichPresense:
         else:
             self.log.debug("custom.py doesn't exist")
 
-    # main program loop
+    # main program loop, which is just loop_body() scheduled to run every so often until the GUI is closed
+    # the work itself is done in a worker thread, so that the GUI stays responsive no matter how long process scanning, console.log parsing, or RPC take
     def run(self):
-        while True:
-            self.loop_body()
+        self.scheduler.schedule('main_loop', 0, self.main_loop_job)
+        self.scheduler.run()  # sleeps in Tk's event loop until there's something to do
+        self.exit_if_gui_closed()
 
-            # rich presence only updates every 15 seconds, but it listens constantly so sending every 2 or 5 seconds (by default) is probably fine
-            sleep_time: int = settings.get('wait_time_slow') if self.slow_sleep_time else settings.get('wait_time')
-            sleep_time_started: float = time.perf_counter()
-            self.log.debug(f"Sleeping for {sleep_time} seconds (slow = {self.slow_sleep_time})")
+    def main_loop_job(self):
+        self.exit_if_gui_closed()
+        self.loop_future = self.loop_worker.submit(self.loop_work_batched, self.loop_inputs())
+        self.scheduler.schedule('loop_result', 1 / 30, self.loop_result_job)
 
-            if not self.fast_next_loop:
-                while time.perf_counter() - sleep_time_started < sleep_time and self.gui.alive:
-                    time.sleep(1 / 30)  # 30 Hz updates (btw tell me if this is stupid)
-                    self.gui.safe_update()
+    # checks on the worker 30 times a second while it's busy (and only then), and shows its results once they're ready
+    def loop_result_job(self):
+        if not self.loop_future.done():
+            self.scheduler.schedule('loop_result', 1 / 30, self.loop_result_job)
+            return
 
-    # the main logic. runs every 2 or 5 seconds (by default)
-    def loop_body(self):
-        # because closing the GUI doesn't actually exit the program
+        self.apply_loop_result(self.loop_future.result())  # also raises anything that happened in the worker
+
+        # rich presence only updates every 15 seconds, but it listens constantly so sending every 2 or 5 seconds (by default) is probably fine
+        current_settings: settings.Settings = settings.current()
+        sleep_time: int = current_settings.wait_time_slow if self.slow_sleep_time else current_settings.wait_time
+
+        if self.slow_sleep_time and self.process_events.detects_starts:
+            sleep_time = max(sleep_time, 60)  # process_events_ready() wakes this up as soon as a program starts, so this is just in case
+        self.log.debug("Sleeping for {} seconds (slow = {}, fast next loop = {})", sleep_time, self.slow_sleep_time, self.fast_next_loop)
+        self.sleep_start_time = time.perf_counter()
+        self.scheduler.schedule('main_loop', 0 if self.fast_next_loop else sleep_time, self.main_loop_job)
+        self.scheduler.watch_file(self.console_log_watcher, self.console_log_changed)
+
+        if self.process_scanner.snapshot is not self.watched_process_snapshot:
+            self.process_events.watch_pids(self.process_scanner.running_pids())
+            self.watched_process_snapshot = self.process_scanner.snapshot
+
+        self.scheduler.watch_fileno('process_events', self.process_events.fileno(), self.process_events_ready)
+
+        if self.update_check_pending() and not self.scheduler.is_scheduled('update_check'):
+            self.scheduler.schedule('update_check', 0.5, self.update_check_job)
+
+    # wake up early when TF2 writes to console.log, but not so often that being in game is constantly looping
+    def console_log_changed(self):
+        main_loop_wait: Optional[float] = self.scheduler.time_until('main_loop')
+        early_wait: float = max(0.5 - (time.perf_counter() - self.sleep_start_time), 0.0)
+
+        if main_loop_wait is not None and early_wait < main_loop_wait - 0.01:  # None means the worker is busy right now
+            self.log.debug(lambda: f"console.log changed, waking up early (by {round(main_loop_wait - early_wait, 2)} seconds)")
+            self.scheduler.schedule('main_loop', early_wait, self.main_loop_job)
+
+    # a program started or exited, so don't wait for the next loop to notice
+    def process_events_ready(self):
+        events: List[process_events.ProcessEvent] = self.process_events.read_events()
+
+        if events:
+            self.log.debug("Process events: {}", events)
+
+            if self.scheduler.is_scheduled('main_loop'):
+                self.scheduler.schedule('main_loop', 0, self.main_loop_job)
+            else:
+                self.process_events_while_busy = True  # so go again once the worker's done
+
+    # waits for update checks started by init_operations() or the GUI's menu
+    def update_check_job(self):
+        if self.gui.update_checker.update_check_ready():
+            self.gui.handle_update_check(self.gui.update_checker.receive_update_check())
+        elif self.update_check_pending():
+            self.scheduler.schedule('update_check', 0.5, self.update_check_job)
+
+    def update_check_pending(self) -> bool:
+        return self.gui.update_checker.api_future is not None and not self.gui.update_checker.checked_response
+
+    # because closing the GUI doesn't actually exit the program
+    def exit_if_gui_closed(self):
         if not self.gui.alive:
             try:
-                self.disconnect_client()
+                self.rpc_client.close()
+                self.console_log_watcher.close()
+                self.process_events.close()
+                self.loop_worker.shutdown(wait=False)
                 del self.log
             except Exception:
                 pass
 
             raise SystemExit
 
+    # the main logic, all at once on the current thread. runs every 2 or 5 seconds (by default)
+    def loop_body(self):
+        self.exit_if_gui_closed()
+        self.apply_loop_result(self.loop_work_batched(self.loop_inputs()))
+        return self.client_connected, self.rpc_client
+
+    def loop_inputs(self) -> LoopInputs:
+        return LoopInputs(bool(self.gui.tf2_launch_cmd), self.gui.launched_tf2_with_button)
+
+    # anything loop_work() saves to the DB (caches, reported errors, missing localizations) is saved all at once afterwards
+    def loop_work_batched(self, inputs: LoopInputs) -> LoopResult:
+        with utils.get_db().batch():
+            return self.loop_work(inputs)
+
+    # the half of the main logic that doesn't touch the GUI, and so can run in the worker thread
+    def loop_work(self, inputs: LoopInputs) -> LoopResult:
         loop_start_time: float = time.perf_counter()
         self.slow_sleep_time = False
         self.loop_iteration += 1
-        self.log.debug(f"Main loop iteration this app session: {self.loop_iteration}")
+        self.log.debug("Main loop iteration this app session: {}", self.loop_iteration)
         self.no_condebug = False  # this will be updated if need be
-        self.fast_next_loop = False
+        self.rpc_failed = False
+        tf2_launch_cmd_found: Optional[Tuple[str, str]] = None
+        console_log_path: Optional[str] = None
+        game_state_snapshot: Optional[game_state.GameStateSnapshot] = None
+        window_title: Optional[str] = None
+        missing_program: Optional[Tuple[str, str]] = None
 
         if self.custom_functions:
             self.custom_functions.before_loop(self)
 
-        p_data: Dict[str, Dict[str, Union[bool, str, int, None]]] = self.process_scanner.scan()
+        p_data: processes.ProcessSnapshot = self.process_scanner.scan()
+        processes_changed: bool = p_data is not self.last_process_snapshot
+        self.last_process_snapshot = p_data
 
         if self.process_scanner.tf2_without_condebug:
             self.no_condebug = True
 
-        if p_data['Steam']['running']:
+        if p_data.steam.running:
             username_count: int = len(self.usernames)
-            self.usernames.add(configs.get_steam_username())
+            steam_username: Optional[str] = configs.get_steam_username()
+            if steam_username:
+                self.usernames.add(steam_username)
             if len(self.usernames) != username_count:
                 self.log.debug(f"Username(s) updated: {self.usernames}")
 
-            if not p_data['TF2']['running']:
+            if not p_data.tf2.running:
                 # reads steam config files to find TF2 launch options (on first loop, and if any of them have been modified)
-                config_scan_needed: bool = self.steam_config_mtimes == {} or not self.gui.tf2_launch_cmd
+                config_scan_needed: bool = self.steam_config_mtimes == {} or not inputs.has_tf2_launch_cmd
 
                 for steam_config in self.steam_config_mtimes:
                     old_mtime: int = self.steam_config_mtimes[steam_config]
@@ -231,78 +366,106 @@ class TF2RichPresense:
 
                 if config_scan_needed:
                     # to be clear, this scan is always needed but doesn't need to be re-done every loop
-                    tf2_exe_path: str = self.find_tf2_exe(p_data['Steam']['path'])
-                    need_condebug: bool = not self.gui.launched_tf2_with_button and self.process_scanner.tf2_without_condebug
-                    tf2_launch_cmd: Optional[str] = self.steam_config_file(p_data['Steam']['path'], need_condebug)
+                    tf2_exe_path: str = self.find_tf2_exe(p_data.steam.path)
+                    need_condebug: bool = not inputs.launched_tf2_with_button and self.process_scanner.tf2_without_condebug
+                    tf2_launch_cmd: Optional[str] = self.steam_config_file(p_data.steam.path, need_condebug)
 
                     if tf2_exe_path and tf2_launch_cmd is not None:
-                        self.gui.tf2_launch_cmd = (tf2_exe_path, tf2_launch_cmd)
-                        self.log.debug(f"Set launch TF2 command to {self.gui.tf2_launch_cmd}")
+                        tf2_launch_cmd_found = (tf2_exe_path, tf2_launch_cmd)
+                        self.log.debug(f"Set launch TF2 command to {tf2_launch_cmd_found}")
                     elif self.process_scanner.tf2_without_condebug:
                         self.no_condebug = True
-        else:
-            if p_data['Steam']['pid'] is not None or p_data['Steam']['path'] is not None:
-                self.log.error(f"Steam isn't running but its process info is {p_data['Steam']}. WTF?")
+        elif p_data.tf2.running:
+            self.log.error("TF2 is running but Steam isn't. WTF?")
 
-            if p_data['TF2']['running']:
-                self.log.error("TF2 is running but Steam isn't. WTF?")
-
-        if p_data['TF2']['running'] and p_data['Discord']['running'] and p_data['Steam']['running']:
+        if p_data.tf2.running and p_data.discord.running and p_data.steam.running:
             # modifies a few tf2 config files
             if not self.has_checked_class_configs:
-                configs.class_config_files(self.log, p_data['TF2']['path'])
+                configs.class_config_files(self.log, p_data.tf2.path)
                 self.has_checked_class_configs = True
 
-            self.game_state.game_start_time = p_data['TF2']['time']
-            self.gui.set_console_log_button_states(True)
-            self.gui.set_launch_tf2_button_state(False)
-            self.gui.set_bottom_text('discord', False)
-            self.reset_launched_with_button = True
-
-            console_log_path: str = os.path.join(p_data['TF2']['path'], 'tf', 'console.log')
-            self.gui.console_log_path = console_log_path
+            self.game_state.game_start_time = p_data.tf2.time
+            console_log_path = os.path.join(p_data.tf2.path, 'tf', 'console.log')
             console_log_parsed: Optional[console_log.ConsoleLogParsed] = self.interpret_console_log(console_log_path, self.usernames, from_game_state=self.game_state,
-                                                                                                    tf2_start_time=p_data['TF2']['time'])
+                                                                                                    tf2_start_time=p_data.tf2.time)
             self.old_console_log_mtime = self.console_log_mtime
 
             if console_log_parsed:
                 self.game_state.set_bulk(console_log_parsed)
 
-            base_window_title: str = self.loc.text("TF2 Rich Presence ({0})").format(launcher.VERSION)
-            window_title_format_menus: str = self.loc.text("{0} - {1} ({2})")
-            window_title_format_main: str = self.loc.text("{0} - {1} on {2}")
+            base_window_title: str = self.loc.templates.window_title(launcher.VERSION)
 
             if self.game_state.in_menus:
                 self.test_state = 'menus'
-                window_title: str = window_title_format_menus.format(base_window_title, "In menus", self.loc.text(self.game_state.queued_state))
+                window_title = self.loc.templates.window_title_menus(base_window_title, "In menus", self.loc.text(self.game_state.queued_state))
             else:
                 self.test_state = 'in game'
-                window_title = window_title_format_main.format(base_window_title, self.game_state.tf2_class, self.game_state.map_fancy)
+                window_title = self.loc.templates.window_title_in_game(base_window_title, self.game_state.tf2_class, self.game_state.map_fancy)
 
             if self.custom_functions:
                 self.custom_functions.modify_game_state(self)
 
-            self.set_gui_from_game_state(p_data['TF2']['time'])
+            game_state_snapshot = self.game_state.snapshot()
 
-            if self.custom_functions:
-                self.custom_functions.modify_gui(self)
-
-            if self.game_state.update_rpc:
+            # the IPC client's publisher takes care of not sending time on map changes (or anything else) more often than Discord shows them
+            if self.game_state.update_rpc or self.game_state.activity_shows_map_time:
                 self.activity = self.game_state.activity()
 
                 if self.custom_functions:
                     self.custom_functions.modify_rpc_activity(self)
 
-                try:
-                    self.send_rpc_activity()
-                except KeyboardInterrupt:
-                    self.handle_rpc_error("Timed out sending RPC activity")
+                self.send_rpc_activity()
             else:
                 self.log.debug("Not updating RPC state")
 
-            self.gui.set_window_title(window_title)
+            self.check_rpc_client()
+
+        elif not p_data.tf2.running:
+            if processes_changed:
+                self.last_console_log_size = None
+                self.game_state.console_log_state = console_log.ConsoleLogStateMachine(self.log)
+
+            missing_program = ('Team Fortress 2', 'TF2')
+            self.should_mention_tf2 = False
+        elif not p_data.discord.running:
+            missing_program = ('Discord', 'Discord')
+            self.should_mention_discord = False
+        else:
+            # last but not least, Steam
+            missing_program = ('Steam', 'Steam')
+            self.should_mention_steam = False
+
+        if missing_program:
+            self.necessary_program_not_running(*missing_program)
 
-        elif not p_data['TF2']['running']:
+        return LoopResult(p_data.tf2.running, p_data.steam.running, p_data.tf2.time, missing_program and missing_program[0], tf2_launch_cmd_found,
+                          console_log_path, game_state_snapshot, window_title, self.rpc_failed, self.has_seen_kataiser, round(time.perf_counter() - loop_start_time, 3))
+
+    # the other half of the main logic, which shows what loop_work() found and so has to run in the GUI's thread
+    def apply_loop_result(self, result: LoopResult):
+        apply_start_time: float = time.perf_counter()
+        self.fast_next_loop = self.process_events_while_busy
+        self.process_events_while_busy = False
+
+        if result.tf2_launch_cmd:
+            self.gui.tf2_launch_cmd = result.tf2_launch_cmd
+
+        self.console_log_watcher.watch(result.console_log_path)
+
+        if result.game_state:
+            self.gui.set_console_log_button_states(True)
+            self.gui.set_launch_tf2_button_state(False)
+            self.gui.set_bottom_text('discord', result.rpc_failed)
+            self.reset_launched_with_button = True
+            self.gui.console_log_path = result.console_log_path
+            self.set_gui_from_game_state(result.tf2_start_time, result.game_state)
+
+            if self.custom_functions:
+                self.custom_functions.modify_gui(self)
+
+            self.gui.set_window_title(result.window_title)
+
+        elif not result.tf2_running:
             # there's probably a better way to do this
             if self.reset_launched_with_button:
                 self.gui.launched_tf2_with_button = False
@@ -316,35 +479,22 @@ class TF2RichPresense:
                     self.gui.set_launch_tf2_button_state(True)
                     self.gui.launch_tf2()
                 else:
-                    self.gui.set_launch_tf2_button_state(p_data['Steam']['running'])
+                    self.gui.set_launch_tf2_button_state(result.steam_running)
 
-            self.last_console_log_size = None
-            self.game_state.console_log_file_position = 0
-            self.necessary_program_not_running('Team Fortress 2', 'TF2')
-            self.should_mention_tf2 = False
-        elif not p_data['Discord']['running']:
-            self.necessary_program_not_running('Discord')
-            self.should_mention_discord = False
-            self.gui.set_launch_tf2_button_state(p_data['Steam']['running'])
-            self.gui.launch_tf2_button['state'] = 'disabled'
+            self.set_gui_program_not_running(result.missing_program)
         else:
-            # last but not least, Steam
-            self.necessary_program_not_running('Steam')
-            self.should_mention_steam = False
-            self.gui.set_launch_tf2_button_state(p_data['Steam']['running'])
+            self.set_gui_program_not_running(result.missing_program)
+            self.gui.set_launch_tf2_button_state(result.steam_running)
             self.gui.launch_tf2_button['state'] = 'disabled'
 
+        self.gui.set_bottom_text('kataiser', result.kataiser_seen)
         self.auto_launch_tf2 = False
-        self.gui.safe_update()
         self.init_operations()
 
         if self.no_condebug and not self.gui.launched_tf2_with_button:
             self.gui.no_condebug_warning()
             self.fast_next_loop = True
 
-        if self.gui.update_checker.update_check_ready():
-            self.gui.handle_update_check(self.gui.update_checker.receive_update_check())
-
         if self.custom_functions:
             self.custom_functions.after_loop(self)
 
@@ -366,51 +516,56 @@ class TF2RichPresense:
             gc.collect()
             self.log.debug("Enabled GC and collected")
 
-        self.gui.main_loop_body_times.append(round(time.perf_counter() - loop_start_time, 3))
-        return self.client_connected, self.rpc_client
+        apply_time: float = time.perf_counter() - apply_start_time
+        self.gui.main_loop_body_times.append(round(result.work_time + apply_time, 3))
+        self.log.event('loop', iteration=self.loop_iteration, loop_time=round(result.work_time + apply_time, 4), work_time=result.work_time, apply_time=round(apply_time, 4),
+                       tf2_running=result.tf2_running, missing_program=result.missing_program)
+
+    # tell the GUI what it needs to look like, based on self.game_state (or a snapshot of it)
+    def set_gui_from_game_state(self, tf2_start_time: Optional[int] = None, state: Optional[game_state.GameStateSnapshot] = None):
+        if not state:
+            state = self.game_state.snapshot()
 
-    # tell the GUI what it needs to look like, based on self.game_state
-    def set_gui_from_game_state(self, tf2_start_time: Optional[int] = None):
         if tf2_start_time:
             time_elapsed_num: str = str(datetime.timedelta(seconds=int(time.time() - tf2_start_time)))
-            time_elapsed: str = self.loc.text("{0} elapsed").format(time_elapsed_num.removeprefix('0:').removeprefix('0'))
+            time_elapsed: str = self.loc.templates.time_elapsed(time_elapsed_num.removeprefix('0:').removeprefix('0'))
         else:
-            time_elapsed = self.loc.text("{0} elapsed").format('0:00')
+            time_elapsed = self.loc.templates.time_elapsed('0:00')
 
-        if self.game_state.in_menus:
-            self.gui.set_state_3('main_menu', (self.loc.text("In menus"), self.loc.text(self.game_state.queued_state), time_elapsed))
+        if state.in_menus:
+            self.gui.set_state_3('main_menu', (self.loc.templates.in_menus.text, self.loc.text(state.queued_state), time_elapsed))
             self.gui.clear_class_image()
             self.gui.set_bottom_text('queued', False)
 
-            if self.game_state.queued_state == "Queued for Casual":
+            if state.queued_state == "Queued for Casual":
                 self.gui.set_fg_image('casual')
-            elif self.game_state.queued_state == "Queued for Competitive":
+            elif state.queued_state == "Queued for Competitive":
                 self.gui.set_fg_image('comp')
-            elif "Queued for MvM" in self.game_state.queued_state:
+            elif "Queued for MvM" in state.queued_state:
                 self.gui.set_fg_image('mvm_queued')
             else:
                 self.gui.set_fg_image('tf2_logo')
         else:
-            gamemode_gui: str = self.game_state.gamemode
+            gamemode_gui: str = state.gamemode
 
-            if settings.get('drawing_gamemodes') and gamemode_gui in gamemodes.have_drawing:
+            if settings.current().drawing_gamemodes and gamemode_gui in gamemodes.have_drawing:
                 gamemode_gui = f'drawing_{gamemode_gui}'
 
-            self.gui.set_state_4(f'bg_modes/{gamemode_gui}', (self.game_state.map_line, self.game_state.get_line('top'), self.game_state.get_line('bottom'), time_elapsed))
-            self.gui.set_class_image(self.game_state.tf2_class)
+            self.gui.set_state_4(f'bg_modes/{gamemode_gui}', (state.map_line, state.top_line, state.bottom_line, time_elapsed))
+            self.gui.set_class_image(state.tf2_class)
 
-            if self.game_state.custom_map:
+            if state.custom_map:
                 self.gui.set_fg_image(f'fg_modes/{gamemode_gui}')
             else:
-                if self.game_state.tf2_map in game_state.map_fallbacks:
-                    self.gui.set_fg_image(f'fg_maps/{game_state.map_fallbacks[self.game_state.tf2_map]}')
+                if state.tf2_map in game_state.map_fallbacks:
+                    self.gui.set_fg_image(f'fg_maps/{game_state.map_fallbacks[state.tf2_map]}')
                 else:
-                    self.gui.set_fg_image(f'fg_maps/{self.game_state.tf2_map}')
+                    self.gui.set_fg_image(f'fg_maps/{state.tf2_map}')
 
-            if self.game_state.queued_state == "Not queued":
+            if state.queued_state == "Not queued":
                 self.gui.set_bottom_text('queued', False)
             else:
-                self.gui.bottom_text_queue_state = self.loc.text(self.game_state.queued_state)
+                self.gui.bottom_text_queue_state = self.loc.text(state.queued_state)
                 self.gui.set_bottom_text('queued', True)
 
     # handle one or more of the three programs we need not running
@@ -418,58 +573,47 @@ class TF2RichPresense:
         name_short = program_name if not name_short else name_short
         self.test_state = f'no {name_short.lower()}'
         self.slow_sleep_time = True  # update less often if not all programs are running
+        self.has_seen_kataiser = False
         self.disconnect_client(program_name)
 
-        self.gui.set_state_1('default', self.loc.text("{0} isn't running").format(program_name))
+    def set_gui_program_not_running(self, program_name: str):
+        self.gui.set_state_1('default', self.loc.templates.not_running(program_name))
         self.gui.clear_fg_image()
         self.gui.clear_class_image()
         self.gui.set_console_log_button_states(False)
         self.gui.set_bottom_text('queued', False)
-        self.gui.set_bottom_text('kataiser', False)
 
-        base_window_title: str = self.loc.text("TF2 Rich Presence ({0})").format(launcher.VERSION)
-        window_title: str = self.loc.text("{0} - Waiting for {1}").format(base_window_title, program_name)
+        base_window_title: str = self.loc.templates.window_title(launcher.VERSION)
+        window_title: str = self.loc.templates.window_title_waiting(base_window_title, program_name)
         self.gui.set_window_title(window_title)
 
     def disconnect_client(self, program_name: str):
-        self.log.debug("Disconnecting RPC client")
+        self.log.debug(f"Disconnecting RPC client ({program_name} isn't running)")
         self.client_connected = False
+        self.rpc_client.disconnect()
 
-        try:
-            self.rpc_client.disconnect()
-        except Exception as client_connect_error:
-            if program_name == 'Discord' and str(client_connect_error) in ("Can't send data to Discord via IPC.", "Can't connect to Discord Client."):
-                self.log.error("RPC client disconnect failed, ignoring cause Discord is closed", reportable=False)
-
-    # sends RPC data, connecting to Discord initially if need be
-    @utils.timeout(2.0)
+    # queues RPC data to be sent from the IPC client's own thread, which also takes care of connecting to Discord (with backoff while it's starting up). never blocks
     def send_rpc_activity(self):
-        try:
-            if not self.client_connected:
-                # connects to Discord
-                self.log.debug("Connecting to Discord IPC...")
-                self.rpc_client = ipc.DiscordIPC(utils.get_api_key('discord2'))
-                self.rpc_client.connect()
-                self.log.debug("Connection successful")
-                self.game_state.update_rpc = True
-
-            self.rpc_client.update_activity(self.activity)
-            self.log.info(f"Sent over RPC: {self.activity}")
-            client_state: tuple = (self.rpc_client.client_id, self.rpc_client.connected, self.rpc_client.ipc_path, self.rpc_client.pid, self.rpc_client.platform, self.rpc_client.socket)
-            self.log.debug(f"Client state: {client_state}")
-            self.client_connected = True
-        except Exception as client_connect_error:
-            if str(client_connect_error) in ("Can't send data to Discord via IPC.", "Can't connect to Discord Client."):
-                # often happens when Discord is in the middle of starting up
-                self.handle_rpc_error(str(client_connect_error))
-            else:
-                raise
+        self.rpc_client.update_activity(self.activity)
+        self.log.info("Queued for RPC: {}", self.activity)
+        self.log.debug("Client state: {}", self.rpc_client)
+
+    # the IPC client connects on its own thread, so this only sees how its most recent attempt went. there's no need to send again after an error, since it resends once it reconnects
+    def check_rpc_client(self):
+        self.client_connected = self.rpc_client.connected
+        error_text: Optional[str] = self.rpc_client.last_error
+
+        if error_text:
+            self.rpc_failed = True  # the GUI shows this once the loop's done
+
+            if error_text != self.last_rpc_error:
+                self.handle_rpc_error(error_text)
+
+        self.last_rpc_error = error_text
 
-    # seperate handler because it may be called by the timeout
+    # only once per different error, instead of every loop while Discord isn't there
     def handle_rpc_error(self, error_text: str):
-        self.log.error(error_text)
-        self.gui.set_bottom_text('discord', True)
-        self.game_state.update_rpc = True
+        self.log.error(f"RPC client error: {error_text}", reportable=False)
 
     # do stuff that was previously in init.py, but only after one main loop so that the GUI is ready
     def init_operations(self):
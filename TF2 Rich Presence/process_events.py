@@ -0,0 +1,228 @@
+# Copyright (C) 2018-2025 Kataiser & https://github.com/Kataiser/tf2-rich-presence/contributors
+# https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
+# cython: language_level=3
+
+import errno
+import os
+import select
+import socket
+import struct
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+import logger
+
+
+class ProcessEvent(NamedTuple):
+    kind: str  # 'start' or 'exit'
+    pid: int
+    name: str
+
+
+# doesn't get told about anything, so the main loop's regular process scanning is all there is. what other sources fall back to
+class ProcessEventSource:
+    backend: str = 'polling'
+    detects_starts: bool = False  # whether the main loop can stop polling for programs that aren't running
+    detects_exits: bool = False
+
+    def __init__(self, log: logger.Log):
+        self.log: logger.Log = log
+        self.names: Set[str] = set()
+        self.pids: Dict[int, str] = {}
+
+    def __repr__(self) -> str:
+        return f"process_events.{self.__class__.__name__} (names={sorted(self.names)}, pids={self.pids})"
+
+    # which process names to report starting
+    def watch_names(self, names: Iterable[str]):
+        self.names = set(names)
+
+    # which processes (PID: name) to report exiting, replacing the previous ones
+    def watch_pids(self, pids: Dict[int, str]):
+        self.pids = dict(pids)
+
+    # everything that's happened since last time, without blocking
+    def read_events(self) -> List[ProcessEvent]:
+        return []
+
+    # a file descriptor that becomes readable when there are events, or None if there never will be
+    def fileno(self) -> Optional[int]:
+        return None
+
+    def close(self):
+        self.pids = {}
+
+
+# Linux 5.3+, reports watched processes exiting via a pidfd for each, all waited on with one epoll. doesn't need any special permissions
+class PidfdEventSource(ProcessEventSource):
+    backend: str = 'pidfd'
+    detects_exits: bool = True
+
+    def __init__(self, log: logger.Log):
+        super().__init__(log)
+        self.epoll: select.epoll = select.epoll()
+        self.pidfds: Dict[int, int] = {}  # pidfd: PID
+
+    def watch_pids(self, pids: Dict[int, str]):
+        for pidfd, pid in list(self.pidfds.items()):
+            if pids.get(pid) != self.pids.get(pid):
+                self.unwatch_pidfd(pidfd)
+
+        super().watch_pids(pids)
+
+        for pid in pids:
+            if pid not in self.pidfds.values():
+                try:
+                    pidfd: int = os.pidfd_open(pid)
+                except ProcessLookupError:
+                    continue  # already exited, next scan will notice
+
+                self.epoll.register(pidfd, select.EPOLLIN)
+                self.pidfds[pidfd] = pid
+
+    def unwatch_pidfd(self, pidfd: int):
+        self.epoll.unregister(pidfd)
+        os.close(pidfd)
+        del self.pidfds[pidfd]
+
+    def read_events(self) -> List[ProcessEvent]:
+        events: List[ProcessEvent] = []
+
+        for ready_fd, _ in self.epoll.poll(0):
+            if ready_fd in self.pidfds:
+                pid: int = self.pidfds[ready_fd]
+                events.append(ProcessEvent('exit', pid, self.pids.pop(pid, '')))
+                self.unwatch_pidfd(ready_fd)
+            else:
+                events.extend(self.read_other_events(ready_fd))
+
+        return events
+
+    def read_other_events(self, ready_fd: int) -> List[ProcessEvent]:
+        return []
+
+    def fileno(self) -> Optional[int]:
+        return self.epoll.fileno()
+
+    def close(self):
+        for pidfd in list(self.pidfds):
+            self.unwatch_pidfd(pidfd)
+
+        super().close()
+        self.epoll.close()
+
+
+# also subscribes to the kernel's proc connector over netlink, which reports every exec on the system, so that programs starting are noticed immediately
+# only works with CAP_NET_ADMIN (so basically as root), otherwise create_event_source() falls back to just pidfd
+class ProcConnectorEventSource(PidfdEventSource):
+    backend: str = 'proc connector'
+    detects_starts: bool = True
+
+    NETLINK_CONNECTOR: int = 11
+    CN_IDX_PROC: int = 1
+    CN_VAL_PROC: int = 1
+    NLMSG_DONE: int = 3
+    PROC_CN_MCAST_LISTEN: int = 1
+    PROC_CN_MCAST_IGNORE: int = 2
+    PROC_EVENT_EXEC: int = 0x2
+    PROC_EVENT_COMM: int = 0x200
+    NLMSG_HEADER: struct.Struct = struct.Struct('=IHHII')  # struct nlmsghdr {u32 len; u16 type; u16 flags; u32 seq; u32 pid;}
+    CN_MSG_HEADER: struct.Struct = struct.Struct('=IIIIHH')  # struct cn_msg {u32 idx; u32 val; u32 seq; u32 ack; u16 len; u16 flags;}
+    PROC_EVENT_HEADER: struct.Struct = struct.Struct('=IIQII')  # struct proc_event {u32 what; u32 cpu; u64 timestamp_ns; then for exec and comm: u32 pid; u32 tgid;}
+
+    def __init__(self, log: logger.Log):
+        super().__init__(log)
+        self.netlink: Optional[socket.socket] = None
+
+        try:
+            self.netlink = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, self.NETLINK_CONNECTOR)  # in here so that the epoll from super() gets closed if this fails
+            self.netlink.bind((os.getpid(), self.CN_IDX_PROC))
+            self.send_mcast_op(self.PROC_CN_MCAST_LISTEN)
+        except OSError:
+            self.close()
+            raise
+
+        self.netlink.setblocking(False)
+        self.epoll.register(self.netlink.fileno(), select.EPOLLIN)
+
+    def send_mcast_op(self, op: int):
+        op_bytes: bytes = struct.pack('=I', op)
+        cn_msg: bytes = self.CN_MSG_HEADER.pack(self.CN_IDX_PROC, self.CN_VAL_PROC, 0, 0, len(op_bytes), 0) + op_bytes
+        self.netlink.send(self.NLMSG_HEADER.pack(self.NLMSG_HEADER.size + len(cn_msg), self.NLMSG_DONE, 0, 0, os.getpid()) + cn_msg)
+
+    def read_other_events(self, ready_fd: int) -> List[ProcessEvent]:
+        events: List[ProcessEvent] = []
+        event_offset: int = self.NLMSG_HEADER.size + self.CN_MSG_HEADER.size
+
+        while True:
+            try:
+                message: bytes = self.netlink.recv(4096)
+            except BlockingIOError:
+                break
+            except OSError as error:
+                if error.errno != errno.ENOBUFS:
+                    raise
+
+                # the kernel dropped events because they came in faster than this read them, so who knows what happened
+                self.log.error("Proc connector overran, rescanning processes", reportable=False)
+                events.append(ProcessEvent('start', 0, ''))
+                continue
+
+            if len(message) < event_offset + self.PROC_EVENT_HEADER.size:
+                continue
+
+            what, _, _, _, tgid = self.PROC_EVENT_HEADER.unpack_from(message, event_offset)
+
+            if what in (self.PROC_EVENT_EXEC, self.PROC_EVENT_COMM):
+                name: Optional[str] = self.process_name(tgid)
+
+                if name in self.names:
+                    events.append(ProcessEvent('start', tgid, name))
+
+        return events
+
+    @staticmethod
+    def process_name(pid: int) -> Optional[str]:
+        try:
+            with open(f'/proc/{pid}/comm', 'rb') as comm_file:
+                return comm_file.read().rstrip(b'\n').decode('UTF8', errors='replace')
+        except OSError:
+            return None
+
+    def close(self):
+        if self.netlink:
+            try:
+                self.send_mcast_op(self.PROC_CN_MCAST_IGNORE)
+            except OSError:
+                pass
+
+            self.netlink.close()
+
+        super().close()
+
+
+# picks the best backend that works here. for a normal (unprivileged) user on Linux that's pidfd, meaning that only programs exiting are event-driven, and waiting
+# for TF2 (or Steam, or Discord) to start is still done by polling. starts are only reported with the proc connector, which needs CAP_NET_ADMIN
+def create_event_source(log: logger.Log) -> ProcessEventSource:
+    event_source: Optional[ProcessEventSource] = None
+
+    if sys.platform.startswith('linux'):
+        try:
+            event_source = ProcConnectorEventSource(log)
+        except OSError as error:
+            log.debug(f"Couldn't subscribe to the proc connector ({error}), using pidfd")
+
+        if not event_source:
+            try:
+                event_source = PidfdEventSource(log)
+            except (OSError, AttributeError) as error:
+                log.debug(f"Couldn't use pidfd ({error}), polling for processes")
+
+    if not event_source:
+        event_source = ProcessEventSource(log)
+
+    if not event_source.detects_starts:
+        exits_text: str = "exits are event-driven" if event_source.detects_exits else "so are exits"
+        log.info(f"Process start events aren't available (using {event_source.backend}), so programs starting are found by polling ({exits_text})")
+
+    return event_source
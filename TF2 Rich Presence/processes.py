@@ -2,19 +2,110 @@
 # https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
 # cython: language_level=3
 
-import copy
+import ctypes
 import functools
 import os
+import select
 import subprocess
+import sys
 import time
 import traceback
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
 import psutil
 
 import configs
 import logger
 
+if sys.platform == 'win32':
+    from ctypes import wintypes
+
+
+class ProgramInfo(NamedTuple):
+    running: bool = False
+    pid: Optional[int] = None
+    path: Optional[str] = None  # TF2 and Steam only
+    time: Optional[int] = None  # TF2 only
+
+
+NOT_RUNNING: ProgramInfo = ProgramInfo()
+
+
+# what a scan found. if nothing changed, scan() returns the previous snapshot object itself, so "is" is enough to tell
+class ProcessSnapshot(NamedTuple):
+    tf2: ProgramInfo = NOT_RUNNING
+    steam: ProgramInfo = NOT_RUNNING
+    discord: ProgramInfo = NOT_RUNNING
+
+
+# one of the programs, looked up once and then only checked on. the handle (a pidfd on Linux, a process handle on Windows) stays tied to that exact process,
+# so a recycled PID can't be mistaken for it, and everything else about it can be cached for as long as it's alive
+class TrackedProcess:
+    SYNCHRONIZE: int = 0x00100000
+    WAIT_TIMEOUT: int = 0x102
+
+    def __init__(self, pid: int, get_cwd: bool = False):
+        self.pid: int = pid
+        self.handle: Optional[int] = self.open_handle(pid)  # before reading anything, so that it's all from the process the handle is for
+        self.psutil_process: psutil.Process = psutil.Process(pid)
+
+        try:
+            with self.psutil_process.oneshot():
+                self.name: str = self.psutil_process.name()
+                self.cmdline: List[str] = self.psutil_process.cmdline()
+                self.create_time: float = self.psutil_process.create_time()
+                self.cwd: Optional[str] = self.psutil_process.cwd() if get_cwd else None
+        except Exception:
+            self.close()
+            raise
+
+    def __repr__(self) -> str:
+        return f"processes.TrackedProcess ({self.name}, pid={self.pid}, handle={self.handle})"
+
+    @classmethod
+    def open_handle(cls, pid: int) -> Optional[int]:
+        if sys.platform.startswith('linux'):
+            try:
+                return os.pidfd_open(pid)
+            except ProcessLookupError:
+                raise psutil.NoSuchProcess(pid)
+            except (OSError, AttributeError):
+                return None  # kernel older than 5.3
+        elif os.name == 'nt':
+            return kernel32().OpenProcess(cls.SYNCHRONIZE, False, pid) or None
+        else:
+            return None
+
+    def alive(self) -> bool:
+        if self.handle is None:
+            return self.psutil_process.is_running()  # also compares create time, just slower
+        elif os.name == 'nt':
+            return kernel32().WaitForSingleObject(self.handle, 0) == self.WAIT_TIMEOUT
+        else:
+            return not select.select([self.handle], [], [], 0)[0]  # a pidfd becomes readable once the process exits
+
+    def close(self):
+        if self.handle is not None:
+            if os.name == 'nt':
+                kernel32().CloseHandle(self.handle)
+            else:
+                os.close(self.handle)
+
+            self.handle = None
+
+
+# ctypes assumes C ints for anything undeclared, which truncates HANDLEs on 64-bit Windows. its own WinDLL so that these prototypes don't leak into ctypes.windll
+@functools.cache
+def kernel32() -> ctypes.CDLL:
+    library: ctypes.CDLL = ctypes.WinDLL('kernel32', use_last_error=True)
+    library.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+    library.OpenProcess.restype = wintypes.HANDLE
+    library.WaitForSingleObject.argtypes = (wintypes.HANDLE, wintypes.DWORD)
+    library.WaitForSingleObject.restype = wintypes.DWORD
+    library.CloseHandle.argtypes = (wintypes.HANDLE,)
+    library.CloseHandle.restype = wintypes.BOOL
+    return library
+
 
 class ProcessScanner:
     def __init__(self, log: logger.Log):
@@ -26,33 +117,38 @@ class ProcessScanner:
         self.executables: Dict[str, list] = {'posix': ['hl2_linux', 'steam', 'Discord'],
                                              'nt': ['tf_win64.exe', 'steam.exe', 'discord'],
                                              'order': ['TF2', 'Steam', 'Discord']}
-        self.process_data: Dict[str, dict] = {'TF2': {'running': False, 'pid': None, 'path': None, 'time': None},
-                                              'Steam': {'running': False, 'pid': None, 'path': None},
-                                              'Discord': {'running': False, 'pid': None}}
-        self.p_data_default: Dict[str, dict] = copy.deepcopy(self.process_data)
-        self.p_data_last: Dict[str, dict] = copy.deepcopy(self.process_data)
+        self.pids: Dict[str, Optional[int]] = {'TF2': None, 'Steam': None, 'Discord': None}  # the only part of scanning that's kept between scans
+        self.snapshot: ProcessSnapshot = ProcessSnapshot()
+        self.use_proc: bool = sys.platform.startswith('linux') and os.path.isdir('/proc')
+        self.proc_identities: Dict[int, Tuple[int, str]] = {}  # PID: (start time, name), so a PID's name is only decoded again if it's a different process now
+        self.proc_reads: int = 0
+        self.proc_names_read: int = 0
+        self.tracked: Dict[str, TrackedProcess] = {}  # program: process
 
     def __repr__(self):
-        return f"processes.ProcessScanner (all cached={self.all_pids_cached}, tf2={self.process_data['TF2']}, discord={self.process_data['Discord']}, steam={self.process_data['Steam']})"
+        return f"processes.ProcessScanner (all cached={self.all_pids_cached}, {self.snapshot})"
 
     # scan all running processes to look for TF2, Steam, and Discord
-    def scan(self) -> Dict[str, Dict[str, Union[bool, str, int, None]]]:
+    def scan(self) -> ProcessSnapshot:
+        previous_snapshot: ProcessSnapshot = self.snapshot
+
         # TODO: use sys.platform everywhere instead of os.name (if possible)
         if os.name == 'nt':
             self.scan_windows()
+        elif self.use_proc:
+            self.scan_linux()
         else:
             self.scan_posix()
 
-        if self.process_data == self.p_data_last:
-            self.log.debug(f"Process scanning got same results (used tasklist: {self.used_tasklist})")
+        if self.snapshot is previous_snapshot:
+            self.log.debug("Process scanning got same results (used tasklist: {})", self.used_tasklist)
         else:
-            self.log.debug(f"Process scanning (used tasklist: {self.used_tasklist}) results: {self.process_data}")
+            self.log.debug("Process scanning (used tasklist: {}) results: {}", self.used_tasklist, self.snapshot)
 
-            if not self.process_data['TF2']['running']:
+            if not self.snapshot.tf2.running:
                 self.tf2_without_condebug = False
 
-        self.p_data_last = copy.deepcopy(self.process_data)
-        return self.process_data
+        return self.snapshot
 
     # basically psutil.process_iter(attrs=['pid', 'cmdline', 'create_time']) but WAY faster (and also highly specialized)
     def scan_windows(self):
@@ -65,56 +161,129 @@ class ProcessScanner:
             if len(self.parsed_tasklist) == 3:
                 self.all_pids_cached = True
 
-            self.process_data['TF2']['pid'] = self.parsed_tasklist['tf_win64.exe'] if 'tf_win64.exe' in self.parsed_tasklist else None
-            self.process_data['Steam']['pid'] = self.parsed_tasklist['steam.exe'] if 'steam.exe' in self.parsed_tasklist else None
-            self.process_data['Discord']['pid'] = self.parsed_tasklist['discord'] if 'discord' in self.parsed_tasklist else None
+            self.pids['TF2'] = self.parsed_tasklist.get('tf_win64.exe')
+            self.pids['Steam'] = self.parsed_tasklist.get('steam.exe')
+            self.pids['Discord'] = self.parsed_tasklist.get('discord')
 
             self.get_all_extended_info()
         else:
             # all the PIDs are known, so don't use tasklist, saves 0.2 - 0.3 seconds :)
             self.get_all_extended_info()
 
-    # for Linux and MacOS (I think)
+    # for MacOS (I think), Linux uses scan_linux()
     def scan_posix(self):
-        for proc in psutil.process_iter():
-            try:
-                details = proc.as_dict(attrs=['pid', 'name', 'cwd'])
-                for pos, name in enumerate(self.executables[os.name]):
-                    if self.process_data[self.executables['order'][pos]]['pid'] is not None:
+        missing: Dict[str, str] = self.missing_programs()
+
+        if missing:
+            for proc in psutil.process_iter(['pid', 'name']):
+                if proc.info['name'] in missing:
+                    self.pids[missing.pop(proc.info['name'])] = proc.info['pid']
+
+                    if not missing:
+                        break
+
+        self.get_all_extended_info()
+
+    # reads /proc directly, and only what's needed: nothing at all if every program's PID is already known, otherwise just enough of each process's stat to
+    # tell whether it's the same process (by PID and start time) as last scan, plus the names of ones that aren't
+    def scan_linux(self):
+        missing: Dict[str, str] = self.missing_programs()
+
+        if missing:
+            live_pids: set = set()
+
+            with os.scandir('/proc') as proc_dir:
+                for entry in proc_dir:
+                    if not entry.name.isdigit():
                         continue
 
-                    if name == details['name']:
-                        self.process_data[self.executables['order'][pos]]['pid'] = details['pid']
-            except psutil.NoSuchProcess:
-                pass
+                    pid: int = int(entry.name)
+                    live_pids.add(pid)
+                    name: Optional[str] = self.read_proc_name(pid)
+
+                    if name in missing:
+                        self.pids[missing.pop(name)] = pid
+
+                        if not missing:
+                            break  # the rest of the cache can be pruned next time
+                else:
+                    # only prune after seeing every PID
+                    self.proc_identities = {pid: self.proc_identities[pid] for pid in live_pids if pid in self.proc_identities}
 
         self.get_all_extended_info()
 
-    # get only the needed info (exe path and process start time) for each, and then apply it to self.p_data
+    # gets a process's start time from /proc/<pid>/stat, and its name too (which is in there as well, so no need for /proc/<pid>/comm) if it isn't cached for that start time
+    def read_proc_name(self, pid: int) -> Optional[str]:
+        try:
+            with open(f'/proc/{pid}/stat', 'rb') as stat_file:
+                stat: bytes = stat_file.read()
+        except OSError:
+            return None  # exited since listing /proc
+
+        self.proc_reads += 1
+        name_end: int = stat.rfind(b')')
+        start_time: int = int(stat[name_end + 2:].split(maxsplit=20)[19])  # field 22, counting from the one after the name as field 3
+        cached: Optional[Tuple[int, str]] = self.proc_identities.get(pid)
+
+        if cached and cached[0] == start_time:
+            return cached[1]
+
+        self.proc_names_read += 1
+        name: str = stat[stat.find(b'(') + 1:name_end].decode('UTF8', errors='replace')
+
+        if cached:
+            self.log.debug(f"PID {pid} has been recycled from {cached[1]} to {name}")
+
+        self.proc_identities[pid] = (start_time, name)
+        return name
+
+    # PID: name, for programs that are running
+    def running_pids(self) -> Dict[int, str]:
+        return {program.pid: name for name, program in zip(self.executables[os.name], self.snapshot) if program.running}
+
+    # name: program, for programs without a known PID
+    def missing_programs(self) -> Dict[str, str]:
+        return {name: program for name, program in zip(self.executables['posix'], self.executables['order']) if self.pids[program] is None}
+
+    # get only the needed info (exe path and process start time) for each, and then make a new snapshot from it (if anything changed)
     def get_all_extended_info(self):
         tf2_data: Dict[str, Union[str, bool, int, None]] = self.get_process_info('TF2', ('path', 'time'), True)
         steam_data: Dict[str, Union[str, bool, int, None]] = self.get_process_info('Steam', ('path', 'cwd'))
         discord_data: Dict[str, Union[str, bool, int, None]] = self.get_process_info('Discord', ())
+        programs: List[ProgramInfo] = []
 
-        # ugly
-        self.process_data['TF2']['running'], self.process_data['TF2']['path'], self.process_data['TF2']['time'] = tf2_data['running'], tf2_data['path'], tf2_data['time']
-        self.process_data['Steam']['running'], self.process_data['Steam']['path'] = steam_data['running'], steam_data['path']
-        self.process_data['Discord']['running'] = discord_data['running']
+        for program, data in zip(self.executables['order'], (tf2_data, steam_data, discord_data)):
+            if data['running']:
+                programs.append(ProgramInfo(True, self.pids[program], data['path'], data['time']))
+            else:
+                self.pids[program] = None
+                programs.append(NOT_RUNNING)
 
-        if not self.process_data['TF2']['running']:
-            self.process_data['TF2'] = copy.deepcopy(self.p_data_default['TF2'])
-        if not self.process_data['Steam']['running']:
-            self.process_data['Steam'] = copy.deepcopy(self.p_data_default['Steam'])
-        if not self.process_data['Discord']['running']:
-            self.process_data['Discord'] = copy.deepcopy(self.p_data_default['Discord'])
+        new_snapshot: ProcessSnapshot = ProcessSnapshot(*programs)
+
+        if new_snapshot != self.snapshot:
+            self.snapshot = new_snapshot
 
     # a mess of logic that gives process info from a process name (not exe name) or PID
+    # programs stay tracked for as long as they're running, so after the first time this is just a liveness check on their handle
     def get_process_info(self, process: Union[str, int], return_data: Tuple[str, ...], validate_condebug: bool = False) -> Dict[str, Union[str, bool, int, None]]:
         p_info: Dict[str, Union[str, bool, None, int]] = {'running': False, 'path': None, 'time': None}
         p_info_nones: Dict[str, Union[str, bool, None, int]] = {'running': False, 'path': None, 'time': None}
+        tracked: Optional[TrackedProcess] = None
+        succeeded: bool = False
 
         if isinstance(process, str):
-            pid: int = self.process_data[process]['pid']
+            pid: int = self.pids[process]
+            tracked = self.tracked.get(process)
+
+            if tracked and tracked.pid != pid:
+                self.untrack(process)
+                tracked = None
+            elif tracked and not tracked.alive():
+                self.log.debug(f"Cached PID {pid} ({process}) is no longer running")
+                self.untrack(process)
+                self.all_pids_cached = False
+                return p_info_nones
 
             if pid is None:
                 self.all_pids_cached = False
@@ -123,28 +292,28 @@ class ProcessScanner:
             pid = process
 
         try:
-            process: psutil.Process = psutil.Process(pid=pid)
-            running: bool = [name for name in self.executables[os.name] if name in process.name().lower()] != []
+            if not tracked:
+                tracked = TrackedProcess(pid, os.name == 'posix' and 'cwd' in return_data)  # Steam's cwd is only used on posix
+
+                if isinstance(process, str):
+                    self.tracked[process] = tracked
+
+            running: bool = [name for name in self.executables[os.name] if name.lower() in tracked.name.lower()] != []
             p_info['running'] = running
 
             if not running:
-                self.log.error(f"PID {pid} ({process}) has been recycled as {process.name()}")
+                self.log.error(f"PID {pid} ({process}) has been recycled as {tracked.name}")
                 self.all_pids_cached = False
                 return p_info_nones
 
             if 'path' in return_data:
-                if os.name == 'posix':
-                    if 'cwd' in return_data:
-                        p_info['path'] = os.path.dirname(process.cwd()) + '/Steam'
-                    else:
-                        cmdline: List[str] = process.cmdline()
-                        p_info['path'] = os.path.dirname(cmdline[0])
+                if os.name == 'posix' and 'cwd' in return_data:
+                    p_info['path'] = os.path.dirname(tracked.cwd) + '/Steam'
                 else:
-                    cmdline = process.cmdline()
-                    p_info['path'] = os.path.dirname(cmdline[0])
+                    p_info['path'] = os.path.dirname(tracked.cmdline[0])
 
-                if validate_condebug and '-condebug' not in cmdline:
-                    self.log.debug(f"TF2 is running without -condebug in cmdline: {cmdline}")
+                if validate_condebug and '-condebug' not in tracked.cmdline:
+                    self.log.debug(f"TF2 is running without -condebug in cmdline: {tracked.cmdline}")
                     self.tf2_without_condebug = True
 
                 if not p_info['path']:
@@ -152,26 +321,32 @@ class ProcessScanner:
                     return p_info_nones
 
             if 'time' in return_data:
-                p_info['time'] = int(process.create_time())  # int instead of round to prevent future times
+                p_info['time'] = int(tracked.create_time)  # int instead of round to prevent future times
 
                 if not p_info['time']:
                     self.all_pids_cached = False
                     return p_info_nones
 
+            succeeded = True
             return p_info
         except psutil.NoSuchProcess:
             self.log.debug(f"Cached PID {pid} ({process}) is no longer running")
             self.all_pids_cached = False
             return p_info_nones
         except Exception:
-            formatted_exception: str = traceback.format_exc()
+            self.log.error(f"psutil error for {process}: {traceback.format_exc()}")
+            return p_info_nones
+        finally:
+            # only keep tracking programs that everything could be gotten for, so that anything else is tried again next time
+            if tracked and not (succeeded and isinstance(process, str)):
+                if isinstance(process, str):
+                    del self.tracked[process]
 
-            try:
-                self.log.error(f"psutil error for {process}: {formatted_exception}")
-            except NameError:
-                self.log.error(f"psutil error: {formatted_exception}")
+                tracked.close()
 
-            return p_info_nones
+    def untrack(self, process: str):
+        if process in self.tracked:
+            self.tracked.pop(process).close()
 
     # https://docs.microsoft.com/en-us/windows-server/administration/windows-commands/tasklist
     def parse_tasklist(self):
@@ -202,16 +377,10 @@ class ProcessScanner:
                     except ValueError:
                         self.log.error(f"Couldn't parse PID from process {process}")
 
-        self.process_data['TF2']['running'] = 'tf_win64.exe' in self.parsed_tasklist
-        self.process_data['Steam']['running'] = 'steam.exe' in self.parsed_tasklist
-        self.process_data['Discord']['running'] = 'discord' in self.parsed_tasklist
-
         # don't detect gmod (or any other program named tf_win64.exe)
-        if self.process_data['TF2']['running']:
-            if not self.tf_win64_exe_is_tf2(self.parsed_tasklist['tf_win64.exe']):
-                self.log.debug(f"Found running non-TF2 tf_win64.exe with PID {self.parsed_tasklist['tf_win64.exe']}")
-                self.process_data['TF2'] = copy.deepcopy(self.p_data_default['TF2'])
-                del self.parsed_tasklist['tf_win64.exe']
+        if 'tf_win64.exe' in self.parsed_tasklist and not self.tf_win64_exe_is_tf2(self.parsed_tasklist['tf_win64.exe']):
+            self.log.debug(f"Found running non-TF2 tf_win64.exe with PID {self.parsed_tasklist['tf_win64.exe']}")
+            del self.parsed_tasklist['tf_win64.exe']
 
     # makes sure a process's path is a TF2 install, not some other game
     @functools.cache
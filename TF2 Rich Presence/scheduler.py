@@ -0,0 +1,134 @@
+# Copyright (C) 2018-2025 Kataiser & https://github.com/Kataiser/tf2-rich-presence/contributors
+# https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
+# cython: language_level=3
+
+import time
+import tkinter as tk
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import file_watch
+import logger
+
+
+# runs timed jobs (and file change callbacks) from inside Tk's event loop, so that the program is fully asleep between them instead of waking up constantly
+class Scheduler:
+    def __init__(self, log: logger.Log, root: tk.Misc):
+        self.log: logger.Log = log
+        self.root: tk.Misc = root
+        self.jobs: Dict[str, Tuple[str, float]] = {}  # name: (Tk after ID, deadline)
+        self.error: Optional[BaseException] = None
+        self.watched_filenos: Dict[str, int] = {}  # name: file descriptor given to Tk
+        self.wakeups: int = 0
+        self.wakeups_minute: int = 0
+        self.wakeups_minute_start: float = time.perf_counter()
+
+    def __repr__(self) -> str:
+        return f"scheduler.Scheduler ({len(self.jobs)} jobs, {self.wakeups} wakeups)"
+
+    # run callback(*args) after delay seconds, replacing the job with the same name if there is one
+    def schedule(self, name: str, delay: float, callback: Callable, *args: Any):
+        self.cancel(name)
+
+        try:
+            after_id: str = self.root.after(round(delay * 1000), self.run_job, name, callback, args)
+        except tk.TclError:
+            self.log.error(f"Couldn't schedule {name} (GUI probably closing)", reportable=False)
+        else:
+            self.jobs[name] = (after_id, time.perf_counter() + delay)
+
+    def cancel(self, name: str):
+        if name in self.jobs:
+            try:
+                self.root.after_cancel(self.jobs[name][0])
+            except tk.TclError:
+                pass
+
+            del self.jobs[name]
+
+    def is_scheduled(self, name: str) -> bool:
+        return name in self.jobs
+
+    # seconds until a job runs, or None if it isn't scheduled
+    def time_until(self, name: str) -> Optional[float]:
+        return max(self.jobs[name][1] - time.perf_counter(), 0.0) if name in self.jobs else None
+
+    def run_job(self, name: str, callback: Callable, args: tuple):
+        self.jobs.pop(name, None)
+        self.count_wakeup()
+        self.run_callback(callback, args)
+
+    # everything Tk calls goes through here
+    def run_callback(self, callback: Callable, args: tuple = ()):
+        try:
+            callback(*args)
+        except BaseException as error:
+            # Tk would just print this and carry on, so instead stop and let run() raise it
+            self.error = error
+            self.stop()
+
+    # calls callback whenever fileno becomes readable, replacing whatever was being watched with the same name (or stopping, with None). Tk can only do this on Unix
+    # returns whether it's being watched. call this again whenever the file descriptor might have changed, it's cheap if nothing needs to be done
+    def watch_fileno(self, name: str, fileno: Optional[int], callback: Callable) -> bool:
+        if fileno != self.watched_filenos.get(name):
+            if name in self.watched_filenos:
+                self.root.tk.deletefilehandler(self.watched_filenos.pop(name))
+
+            if fileno is not None:
+                try:
+                    self.root.tk.createfilehandler(fileno, tk.READABLE, lambda *_: self.fileno_event(callback))
+                except AttributeError:
+                    pass  # no createfilehandler on Windows
+                else:
+                    self.watched_filenos[name] = fileno
+
+        return name in self.watched_filenos
+
+    def fileno_event(self, callback: Callable):
+        self.count_wakeup()
+        self.run_callback(callback)
+
+    # calls callback whenever the watcher's file changes. inotify's file descriptor is handed directly to Tk, anything else is polled
+    def watch_file(self, watcher: file_watch.PollingFileWatcher, callback: Callable):
+        if self.watch_fileno('file', watcher.fileno(), lambda: self.file_event(watcher, callback)):
+            return
+
+        if watcher.path and not self.is_scheduled('file_poll'):
+            self.schedule('file_poll', watcher.poll_interval, self.poll_file, watcher, callback)
+
+    def file_event(self, watcher: file_watch.PollingFileWatcher, callback: Callable):
+        if watcher.changed():
+            callback()
+
+    # keeps polling for as long as there's a path to poll
+    def poll_file(self, watcher: file_watch.PollingFileWatcher, callback: Callable):
+        if not watcher.path:
+            return
+
+        if watcher.changed():
+            callback()
+
+        self.schedule('file_poll', watcher.poll_interval, self.poll_file, watcher, callback)
+
+    def count_wakeup(self):
+        self.wakeups += 1
+        self.wakeups_minute += 1
+        minute_elapsed: float = time.perf_counter() - self.wakeups_minute_start
+
+        if minute_elapsed >= 60:
+            self.log.debug(f"Scheduler woke up {self.wakeups_minute} times in the last {round(minute_elapsed)} seconds")
+            self.wakeups_minute = 0
+            self.wakeups_minute_start = time.perf_counter()
+
+    # blocks until stop() is called or the GUI is closed. if a job raised an exception, it's raised here
+    def run(self):
+        self.error = None
+        self.root.mainloop()
+
+        if self.error:
+            raise self.error
+
+    def stop(self):
+        try:
+            self.root.quit()
+        except tk.TclError:
+            pass
@@ -0,0 +1,104 @@
+# Copyright (C) 2018-2025 Kataiser & https://github.com/Kataiser/tf2-rich-presence/contributors
+# https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
+# cython: language_level=3
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import struct
+from typing import BinaryIO, Collection, Iterator, List, NamedTuple, Optional
+
+import ujson
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# a session log is this, followed by records that are each a little-endian u32 length and then that many bytes of:
+# f64 unix time, u8 level (index into LEVELS), u8 event type length, the event type (ASCII), and the rest is the fields as a JSON object
+MAGIC: bytes = b'TF2RPSL\x01'
+EXTENSION: str = '.slog'
+LEVELS: tuple = ('Debug', 'Info', 'Error', 'Critical')
+RECORD_LENGTH: struct.Struct = struct.Struct('<I')
+RECORD_HEADER: struct.Struct = struct.Struct('<dBB')
+
+
+class Record(NamedTuple):
+    time: float
+    level: str
+    event: str
+    fields: dict
+
+
+# turns one record into bytes, length prefix included
+def encode_record(timestamp: float, level: str, event: str, fields: dict) -> bytes:
+    event_bytes: bytes = event.encode('ASCII')
+    payload: bytes = RECORD_HEADER.pack(timestamp, LEVELS.index(level), len(event_bytes)) + event_bytes + ujson.dumps(fields, ensure_ascii=False, default=str).encode('UTF8')
+    return RECORD_LENGTH.pack(len(payload)) + payload
+
+
+# opens a session log for reading, whether or not it's been compressed (and with what)
+def open_session_log(path: str) -> BinaryIO:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    elif path.endswith('.xz'):
+        return lzma.open(path, 'rb')
+    elif path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    elif path.endswith('.zst'):
+        if not zstandard:
+            raise ValueError(f"Can't read {path} without the zstandard package")
+
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))  # buffered so that reads aren't short
+    else:
+        return open(path, 'rb')
+
+
+def is_session_log(filename: str) -> bool:
+    return filename.endswith(EXTENSION) or any(filename.endswith(f'{EXTENSION}{suffix}') for suffix in ('.gz', '.xz', '.bz2', '.zst'))
+
+
+# streams records out of a session log, one at a time. filtering by event type and level happens before the fields are decoded, so skipped records are cheap
+# a record cut off at the end (say, from a crash mid-write) is ignored
+def read_records(path: str, events: Optional[Collection[str]] = None, levels: Optional[Collection[str]] = None) -> Iterator[Record]:
+    with open_session_log(path) as log_file:
+        if log_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} isn't a session log")
+
+        event_filter: Optional[set] = {event.encode('ASCII') for event in events} if events else None
+        level_filter: Optional[set] = {LEVELS.index(level) for level in levels} if levels else None
+
+        while True:
+            length_bytes: bytes = log_file.read(RECORD_LENGTH.size)
+
+            if len(length_bytes) < RECORD_LENGTH.size:
+                return
+
+            payload_length: int = RECORD_LENGTH.unpack(length_bytes)[0]
+            payload: bytes = log_file.read(payload_length)
+
+            if len(payload) < payload_length:
+                return
+
+            timestamp, level_index, event_length = RECORD_HEADER.unpack_from(payload)
+            event_end: int = RECORD_HEADER.size + event_length
+            event: bytes = payload[RECORD_HEADER.size:event_end]
+
+            if (event_filter is None or event in event_filter) and (level_filter is None or level_index in level_filter):
+                yield Record(timestamp, LEVELS[level_index], event.decode('ASCII'), ujson.loads(payload[event_end:]))
+
+
+# every session log in some files and/or folders, oldest first
+def find_session_logs(paths: List[str]) -> List[str]:
+    found: List[str] = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(os.path.join(path, filename) for filename in os.listdir(path) if is_session_log(filename))
+        else:
+            found.append(path)
+
+    return sorted(found, key=os.path.getmtime)
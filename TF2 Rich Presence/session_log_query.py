@@ -0,0 +1,148 @@
+# Copyright (C) 2018-2025 Kataiser & https://github.com/Kataiser/tf2-rich-presence/contributors
+# https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
+
+import argparse
+import array
+import collections
+import datetime
+import math
+from typing import Collection, Dict, Iterator, List, Optional, Tuple
+
+import ujson
+
+import session_log
+
+
+# digs through session logs (made with --structured-log), compressed or not, any number at once. e.g.:
+#   python session_log_query.py show logs --event loop --where tf2_running=true
+#   python session_log_query.py count logs --by level
+#   python session_log_query.py loop-times logs --per-file
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Filter, count, and time records in TF2 Rich Presence session logs")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    show_parser = subparsers.add_parser('show', help="Print matching records")
+    show_parser.add_argument('--limit', type=int, default=0, help="Stop after this many records")
+    count_parser = subparsers.add_parser('count', help="Count matching records, grouped by something")
+    count_parser.add_argument('--by', default='event', help="'event', 'level', 'file', or a field name (default: event)")
+    loop_times_parser = subparsers.add_parser('loop-times', help="Percentiles of main loop timings")
+    loop_times_parser.add_argument('--field', default='loop_time', help="loop_time, work_time, or apply_time (default: loop_time)")
+    loop_times_parser.add_argument('--per-file', action='store_true', help="Also show percentiles for each log")
+
+    for subparser in (show_parser, count_parser, loop_times_parser):
+        subparser.add_argument('paths', nargs='+', help="Session logs and/or folders containing them")
+        subparser.add_argument('--event', action='append', help="Only this event type (can be used multiple times)")
+        subparser.add_argument('--level', action='append', choices=session_log.LEVELS, help="Only this level (can be used multiple times)")
+        subparser.add_argument('--where', action='append', default=[], help="Only records with field=value, compared as JSON if possible")
+        subparser.add_argument('--contains', help="Only records with this text anywhere in their fields")
+
+    parsed: argparse.Namespace = parser.parse_args(args)
+    log_paths: List[str] = session_log.find_session_logs(parsed.paths)
+
+    if parsed.command == 'show':
+        show(log_paths, parsed)
+    elif parsed.command == 'count':
+        count(log_paths, parsed)
+    else:
+        loop_times(log_paths, parsed)
+
+
+def show(log_paths: List[str], parsed: argparse.Namespace):
+    shown: int = 0
+
+    for _, record in matching_records(log_paths, parsed.event, parsed.level, parsed.where, parsed.contains):
+        print(format_record(record))
+        shown += 1
+
+        if shown == parsed.limit:
+            break
+
+
+def count(log_paths: List[str], parsed: argparse.Namespace):
+    counts: collections.Counter = collections.Counter()
+
+    for log_path, record in matching_records(log_paths, parsed.event, parsed.level, parsed.where, parsed.contains):
+        if parsed.by == 'event':
+            counts[record.event] += 1
+        elif parsed.by == 'level':
+            counts[record.level] += 1
+        elif parsed.by == 'file':
+            counts[log_path] += 1
+        else:
+            counts[str(record.fields.get(parsed.by))] += 1
+
+    for key, key_count in counts.most_common():
+        print(f"{key_count:>10}  {key}")
+
+    print(f"{sum(counts.values()):>10}  total, in {len(log_paths)} log(s)")
+
+
+def loop_times(log_paths: List[str], parsed: argparse.Namespace):
+    all_times: array.array = array.array('d')  # 8 bytes per loop, so even thousands of logs are fine
+    file_times: Dict[str, array.array] = {}
+
+    for log_path, record in matching_records(log_paths, parsed.event or ['loop'], parsed.level, parsed.where, parsed.contains):
+        loop_time: Optional[float] = record.fields.get(parsed.field)
+
+        if loop_time is not None:
+            all_times.append(loop_time)
+
+            if parsed.per_file:
+                file_times.setdefault(log_path, array.array('d')).append(loop_time)
+
+    for log_path, times in file_times.items():
+        print(f"{log_path}: {format_percentiles(times)}")
+
+    print(f"All {len(log_paths)} log(s): {format_percentiles(all_times)}")
+
+
+# every record that passes all the filters, along with which log it's from
+def matching_records(log_paths: List[str], events: Optional[Collection[str]], levels: Optional[Collection[str]], where: List[str],
+                     contains: Optional[str]) -> Iterator[Tuple[str, session_log.Record]]:
+    field_filters: List[Tuple[str, object]] = [parse_where(condition) for condition in where]
+
+    for log_path in log_paths:
+        try:
+            for record in session_log.read_records(log_path, events, levels):
+                if all(record.fields.get(field) == value for field, value in field_filters) and (not contains or contains in str(record.fields)):
+                    yield log_path, record
+        except (OSError, EOFError, ValueError) as error:
+            print(f"Couldn't read {log_path}: {error}")
+
+
+# "tf2_running=true" -> ('tf2_running', True), "map=pl_upward" -> ('map', 'pl_upward')
+def parse_where(condition: str) -> Tuple[str, object]:
+    field, _, value = condition.partition('=')
+
+    try:
+        return field, ujson.loads(value)
+    except ValueError:
+        return field, value
+
+
+def format_record(record: session_log.Record) -> str:
+    record_time: str = datetime.datetime.fromtimestamp(record.time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+    if record.event == 'log':
+        return f"[{record_time}] {record.level.upper()}: {record.fields.get('message')}"
+    else:
+        return f"[{record_time}] {record.level.upper()} {record.event}: {record.fields}"
+
+
+# nearest-rank percentiles
+def percentiles(values: array.array, wanted: Tuple[float, ...] = (50, 90, 99)) -> Dict[float, float]:
+    sorted_values: List[float] = sorted(values)
+    return {percentile: sorted_values[max(math.ceil(percentile / 100 * len(sorted_values)) - 1, 0)] for percentile in wanted}
+
+
+def format_percentiles(values: array.array) -> str:
+    if not values:
+        return "no loops"
+
+    loop_percentiles: Dict[float, float] = percentiles(values)
+    percentiles_text: str = ', '.join(f"p{percentile} {round(loop_percentiles[percentile], 3)}" for percentile in loop_percentiles)
+    return f"{len(values)} loops, mean {round(sum(values) / len(values), 3)}, {percentiles_text}, max {round(max(values), 3)}"
+
+
+if __name__ == '__main__':
+    main()
@@ -2,72 +2,229 @@
 # https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
 # cython: language_level=3
 
-import functools
+import contextlib
+import dataclasses
 import json
-import winreg
-from typing import Optional, Union
+import os
+import sys
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
 
 import ujson
 
-import logger
+if sys.platform == 'win32':
+    import winreg
 
 
-# access a setting from any file, with a string that is the same as the variable name (cached, so settings changes won't be rechecked right away)
-# TODO: access settings as a class with type hinted members
-@functools.cache
+# every setting, with its type and default
+@dataclasses.dataclass
+class Settings:
+    sentry_level: str = 'All errors'
+    wait_time: int = 1
+    wait_time_slow: int = 5
+    check_updates: bool = True
+    request_timeout: int = 10
+    hide_queued_gamemode: bool = False
+    log_level: str = 'Debug'
+    language: str = 'English'
+    top_line: str = 'Player count'
+    bottom_line: str = 'Server name'
+    gui_scale: int = 100
+    drawing_gamemodes: bool = False
+    preserve_window_pos: bool = True
+
+
+# settings are saved as JSON in a single string value of HKCU\Software\TF2 Rich Presence
+# could do this as a file in AppData\Roaming\TF2 Rich Presence, but it would likely be slower for no benefit AFAIK
+class RegistryBackend:
+    def __repr__(self) -> str:
+        return r"settings.RegistryBackend (HKCU\Software\TF2 Rich Presence)"
+
+    # None means that the key hasn't been initialized
+    def read(self) -> Optional[dict]:
+        reg_key: winreg.HKEYType = winreg.CreateKey(winreg.HKEY_CURRENT_USER, r'Software\TF2 Rich Presence')
+
+        try:
+            return ujson.loads(winreg.QueryValue(reg_key, 'Settings'))
+        except FileNotFoundError:
+            return None
+        finally:
+            reg_key.Close()
+
+    def write(self, settings_data: dict):
+        reg_key: winreg.HKEYType = winreg.CreateKey(winreg.HKEY_CURRENT_USER, r'Software\TF2 Rich Presence')
+        winreg.SetValue(reg_key, 'Settings', winreg.REG_SZ, json.dumps(settings_data, separators=(',', ':')))
+        reg_key.Close()
+
+
+# for everything that isn't Windows, a settings.json in $XDG_CONFIG_HOME/TF2 Rich Presence (usually ~/.config)
+class JSONFileBackend:
+    def __init__(self, path: Optional[str] = None):
+        if not path:
+            config_home: str = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+            path = os.path.join(config_home, 'TF2 Rich Presence', 'settings.json')
+
+        self.path: str = path
+
+    def __repr__(self) -> str:
+        return f"settings.JSONFileBackend ({self.path})"
+
+    # None means that the file hasn't been created, or is too broken to use. a broken file is moved to settings.json.bad first, since defaults get written over it
+    def read(self) -> Optional[dict]:
+        try:
+            with open(self.path, 'r', encoding='UTF8') as settings_file:
+                return ujson.load(settings_file)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            os.replace(self.path, f'{self.path}.bad')
+            return None
+
+    # written to a temporary file first and then renamed over the old one, so a crash mid-write can't leave a half-written file behind
+    def write(self, settings_data: dict):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path: str = f'{self.path}.tmp'
+
+        with open(temp_path, 'w', encoding='UTF8') as settings_file:
+            json.dump(settings_data, settings_file, indent=4, ensure_ascii=False)
+            settings_file.flush()
+            os.fsync(settings_file.fileno())
+
+        os.replace(temp_path, self.path)
+
+
+# loads settings from the backend once and serves them from memory after that. changes are written back all at once (per batch) and announced to subscribers
+class SettingsStore:
+    def __init__(self, backend: Union[RegistryBackend, JSONFileBackend]):
+        self.backend: Union[RegistryBackend, JSONFileBackend] = backend
+        self.data: Optional[dict] = None
+        self.values: Settings = Settings()  # typed view of data, rebuilt on every change
+        self.subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self.batch_depth: int = 0
+        self.batch_changed: Dict[str, Any] = {}
+        self.reads: int = 0
+        self.writes: int = 0
+
+    def __repr__(self) -> str:
+        return f"settings.SettingsStore ({self.backend}, {self.reads} reads, {self.writes} writes, {len(self.subscribers)} subscribers)"
+
+    def load(self) -> dict:
+        if self.data is None:
+            self.reads += 1
+            backend_data: Optional[dict] = self.backend.read()
+
+            if backend_data is None:
+                # assume no saved settings means default settings. might not be true but whatever
+                self.data = defaults()
+                self.write()
+            else:
+                self.data = backend_data
+
+            self.values = typed_settings(self.data)
+
+        return self.data
+
+    def get(self, setting: str) -> Union[str, int, bool]:
+        return self.load()[setting]
+
+    # a copy of every setting, including unknown ones
+    def get_all(self) -> dict:
+        return dict(self.load())
+
+    # changes some settings, or with replace=True, all of them (removing any not in new_settings)
+    def update(self, new_settings: dict, replace: bool = False):
+        current: dict = self.load()
+        changed: Dict[str, Any] = {setting: new_settings[setting] for setting in new_settings if setting not in current or current[setting] != new_settings[setting]}
+
+        if replace:
+            changed.update({setting: None for setting in current if setting not in new_settings})
+            self.data = dict(new_settings)
+        else:
+            current.update(new_settings)
+
+        if not changed:
+            return
+
+        self.values = typed_settings(self.data)
+
+        with self.batch():
+            self.batch_changed.update(changed)
+
+    # saves (and notifies subscribers) once, after everything in the with block is done
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        self.batch_depth += 1
+
+        try:
+            yield
+        finally:
+            self.batch_depth -= 1
+
+            if self.batch_depth == 0 and self.batch_changed:
+                changed: Dict[str, Any] = self.batch_changed
+                self.batch_changed = {}
+                self.write()
+
+                for subscriber in self.subscribers:
+                    subscriber(changed)
+
+    def write(self):
+        self.writes += 1
+        self.backend.write(self.data)
+
+    # callback gets a dict of the changed settings and their new values (None if removed)
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        self.subscribers.append(callback)
+
+    # reads the backend again (which can be a different one now), and tells subscribers about anything that's different
+    def reload(self):
+        old_data: Optional[dict] = self.data
+        self.data = None
+
+        if old_data is not None:
+            new_data: dict = self.load()
+            changed: Dict[str, Any] = {setting: new_data.get(setting) for setting in {**old_data, **new_data} if old_data.get(setting) != new_data.get(setting)}
+
+            if changed:
+                for subscriber in self.subscribers:
+                    subscriber(changed)
+
+
+# access a setting from any file, with a string that is the same as the variable name
 def get(setting: str) -> Union[str, int, bool]:
     try:
-        return access_registry()[setting]
+        return store.get(setting)
     except KeyError:
         return get_setting_default(setting)
 
 
-# either reads the settings key and returns it as a dict, or if a dict is provided, saves it
-# note that settings are saved as JSON in a single string key
-# could do this as a file in AppData\Roaming\TF2 Rich Presence, but it would likely be slower for no benefit AFAIK
-def access_registry(save: Optional[dict] = None) -> Optional[dict]:
-    reg_key: winreg.HKEYType = winreg.CreateKey(winreg.HKEY_CURRENT_USER, r'Software\TF2 Rich Presence')
+# typed access to every setting, e.g. settings.current().log_level
+def current() -> Settings:
+    store.load()
+    return store.values
 
-    try:
-        reg_key_data: dict = ujson.loads(winreg.QueryValue(reg_key, 'Settings'))
-    except FileNotFoundError:  # means that the key hasn't been initialized
-        # assume no key means default settings. might not be true but whatever
-        default_settings: dict = defaults()
-        winreg.SetValue(reg_key, 'Settings', winreg.REG_SZ, json.dumps(default_settings, separators=(',', ':')))
-        reg_key_data: dict = default_settings
 
+# either returns all settings as a dict, or if a dict is provided, saves it as all the settings
+# (still called this even though it's only actually the registry on Windows)
+def access_registry(save: Optional[dict] = None) -> Optional[dict]:
     if save:
-        winreg.SetValue(reg_key, 'Settings', winreg.REG_SZ, json.dumps(save, separators=(',', ':')))
-        reg_key.Close()
-        get.cache_clear()
-        logger.Log.log_level_allowed.cache_clear()
+        store.update(save, replace=True)
     else:
-        reg_key.Close()
-        return reg_key_data
+        return store.get_all()
 
 
 # changes a single setting
 def change(setting: str, value: Union[str, int, bool, float]):
-    current_settings = access_registry()
-    current_settings[setting] = value
-    access_registry(save=current_settings)
+    store.update({setting: value})
+
+
+# get told (with a dict of what changed) whenever settings are saved
+def subscribe(callback: Callable[[Dict[str, Any]], None]):
+    store.subscribe(callback)
 
 
 # either gets a settings default, or if return_dict, returns all defaults as a dict
 def get_setting_default(setting: str = '', return_all: bool = False) -> Union[str, int, bool, dict]:
-    default_settings = {'sentry_level': 'All errors',
-                        'wait_time': 1,
-                        'wait_time_slow': 5,
-                        'check_updates': True,
-                        'request_timeout': 10,
-                        'hide_queued_gamemode': False,
-                        'log_level': 'Debug',
-                        'language': 'English',
-                        'top_line': 'Player count',
-                        'bottom_line': 'Server name',
-                        'gui_scale': 100,
-                        'drawing_gamemodes': False,
-                        'preserve_window_pos': True}
+    default_settings: dict = dataclasses.asdict(Settings())
 
     if return_all:
         return default_settings
@@ -80,6 +237,11 @@ def defaults() -> dict:
     return get_setting_default(return_all=True)
 
 
+# missing settings get defaults, unknown ones are ignored
+def typed_settings(settings_data: dict) -> Settings:
+    return Settings(**{field.name: settings_data[field.name] for field in dataclasses.fields(Settings) if field.name in settings_data})
+
+
 # find settings that are different between two settings dicts
 def compare_settings(before: dict, after: dict) -> dict:
     return {k: after[k] for k in before if before[k] != after[k]}
@@ -88,29 +250,32 @@ def compare_settings(before: dict, after: dict) -> dict:
 # fixes settings that are missing or deprecated
 def fix_settings(log):
     default: dict = defaults()
-    current: dict = access_registry()
+    current_settings: dict = store.get_all()
     added: dict = {}
     removed: dict = {}
-    made_fixes: bool = False
 
     for default_setting in default:
-        if default_setting not in current:
-            current[default_setting] = default[default_setting]
+        if default_setting not in current_settings:
+            current_settings[default_setting] = default[default_setting]
             added[default_setting] = default[default_setting]
-            made_fixes = True
 
-    for current_setting in list(current):
+    for current_setting in list(current_settings):
         if current_setting not in default:
-            removed[current_setting] = current[current_setting]
-            del current[current_setting]
-            made_fixes = True
-
-        access_registry(save=current)
+            removed[current_setting] = current_settings[current_setting]
+            del current_settings[current_setting]
 
-    if made_fixes:
+    if added or removed:
+        store.update(current_settings, replace=True)  # saved once, not once per setting
         log.error(f"Fixed settings: added {added}, removed {removed}")
 
 
+def default_backend() -> Union[RegistryBackend, JSONFileBackend]:
+    return RegistryBackend() if sys.platform == 'win32' else JSONFileBackend()
+
+
+store: SettingsStore = SettingsStore(default_backend())
+
+
 if __name__ == '__main__':
     for setting in defaults():
         print(f"{setting}: {get(setting)}")
@@ -1,23 +1,34 @@
 # Copyright (C) 2018-2025 Kataiser & https://github.com/Kataiser/tf2-rich-presence/contributors
 # https://github.com/Kataiser/tf2-rich-presence/blob/master/LICENSE
 
+import asyncio
+import datetime
 import gc
-import io
+import gzip
+import lzma
 import os
 import random
 import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
 import time
 import tkinter as tk
 import traceback
+import types
 import unittest
 
 import psutil
 import requests
+import vdf
 from PIL import Image
-from discoIPC import ipc
 
 import configs
 import console_log
+import discord_ipc
+import file_watch
 import game_state
 import gamemodes
 import gui
@@ -25,7 +36,10 @@ import launcher
 import localization
 import logger
 import main
+import process_events
 import processes
+import scheduler
+import session_log
 import settings
 import settings_gui
 import updater
@@ -142,6 +156,85 @@ class TestTF2RichPresence(unittest.TestCase):
 
         app.gui.master.destroy()
 
+    def test_console_log_tailer(self):
+        with open('test_resources\\console_vip.log', 'r', errors='replace', encoding='UTF8') as consolelog_file:
+            lines_text_mode = consolelog_file.read().splitlines(keepends=True)
+            file_size = consolelog_file.tell()
+
+        for chunk_size in (7, 4096, 65536):
+            tailer = console_log.ConsoleLogTailer('test_resources\\console_vip.log', chunk_size=chunk_size)
+            self.assertEqual(list(tailer.lines()), lines_text_mode)
+            self.assertEqual(tailer.position, file_size)
+            self.assertEqual(tailer.lines_read, len(lines_text_mode))
+
+        # stop partway through, then resume from the saved position
+        tailer = console_log.ConsoleLogTailer('test_resources\\console_vip.log', chunk_size=100)
+        tailer_lines = tailer.lines()
+        for _ in range(100):
+            next(tailer_lines)
+
+        self.assertEqual(list(console_log.ConsoleLogTailer('test_resources\\console_vip.log', tailer.position).lines()), lines_text_mode[100:])
+
+    def test_console_log_triggered_lines(self):
+        self.assertEqual(console_log.triggered_lines("a\nMap: itemtest\nb\n[PartyClient] Leaving queue\nc"), ["Map: itemtest\n", "[PartyClient] Leaving queue\n"])
+        self.assertEqual(console_log.triggered_lines("Lobby destroyed Map: Lobby destroyed\nplayers : 0 humans"), ["Lobby destroyed Map: Lobby destroyed\n", "players : 0 humans"])
+        self.assertEqual(console_log.triggered_lines("nothing\nto see here\n"), [])
+
+        for block in console_log.ConsoleLogTailer('test_resources\\console_valve_server.log', chunk_size=4096).blocks():
+            lines_with_triggers = [line for line in block.splitlines(keepends=True) if [trigger for trigger in console_log.line_triggers if trigger in line]]
+            self.assertEqual(console_log.triggered_lines(block), lines_with_triggers)
+
+    def test_console_log_session_start(self):
+        self.assertEqual(console_log.ConsoleLogTailer('test_resources\\console_hosting_2.log').find_session_start({'not Kataiser'}, True),
+                         (268052, '[PartyClient] Leaving queue for match group 12v12 Casual Match\n'))
+        self.assertEqual(console_log.ConsoleLogTailer('test_resources\\console_chat.log').find_session_start({'not Kataiser'}, True),
+                         (3268691, '[PartyClient] Leaving queue for match group 12v12 Casual Match\n'))
+        self.assertEqual(console_log.ConsoleLogTailer('test_resources\\console_vip.log').find_session_start({'not Kataiser'}, True), (0, None))
+        self.assertEqual(console_log.ConsoleLogTailer('test_resources\\console_empty.log').find_session_start({'not Kataiser'}, True), (0, None))
+
+        # queueing carries across sessions, however far back, but not across launches of TF2 (which is also where looking for it stops)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            consolelog_path = os.path.join(temp_dir, 'console.log')
+            sessions = "Map: pl_upward\nLobby destroyed\nMap: ctf_2fort\nLobby destroyed\n"
+
+            with open(consolelog_path, 'w') as consolelog_file:
+                consolelog_file.write("[PartyClient] Entering queue for match group 12v12 Casual Match\n" + "filler\n" * 100000 + sessions)
+
+            session_start = os.stat(consolelog_path).st_size - len("Lobby destroyed\n")
+            tailer = console_log.ConsoleLogTailer(consolelog_path)
+            self.assertEqual(tailer.find_session_start({'not Kataiser'}, True), (session_start, "[PartyClient] Entering queue for match group 12v12 Casual Match\n"))
+            self.assertIsNone(tailer.queue_search_stopped_at)
+
+            with open(consolelog_path, 'w') as consolelog_file:
+                consolelog_file.write("[PartyClient] Entering queue for match group 12v12 Casual Match\n" + "filler\n" * 100000)
+                consolelog_file.write("Steam config directory: C:\\Steam\\steamapps\\common\\Team Fortress 2\\platform\\config\n" + "filler\n" * 10000 + sessions)
+
+            launched_tailer = console_log.ConsoleLogTailer(consolelog_path, chunk_size=4096)
+            self.assertEqual(launched_tailer.find_session_start({'not Kataiser'}, True), (os.stat(consolelog_path).st_size - len("Lobby destroyed\n"), None))
+            self.assertEqual(launched_tailer.queue_search_stopped_at, len("[PartyClient] Entering queue for match group 12v12 Casual Match\n" + "filler\n" * 100000))
+            self.assertLess(launched_tailer.bytes_read, 100000)
+
+    def test_console_log_state_machine(self):
+        with open('test_resources\\console_hosting_2.log', 'r', errors='replace', encoding='UTF8') as consolelog_file:
+            lines = consolelog_file.read().splitlines(keepends=True)
+
+        state_machine_all = console_log.ConsoleLogStateMachine(self.log, {'not Kataiser'})
+        state_machine_all.feed_many(lines)
+
+        # feeding the same lines in pieces, with snapshots in between, needs to end up at the same place
+        state_machine_split = console_log.ConsoleLogStateMachine(self.log, {'not Kataiser'})
+        for split_start in range(0, len(lines), 1000):
+            state_machine_split.feed_many(lines[split_start:split_start + 1000])
+            state_machine_split.snapshot()
+
+        self.assertEqual(state_machine_all.snapshot(), state_machine_split.snapshot())
+        self.assertEqual(state_machine_all.snapshot(), console_log.ConsoleLogParsed(False, 'pl_aquarius', 'Scout', 'Not queued', True, 'Team Fortress', 1, 24))
+        self.assertEqual(state_machine_all.persistence(), state_machine_split.persistence())
+
+        state_machine_all.feed('Disconnect: #TF_Idle_kicked\n')
+        self.assertEqual(state_machine_all.snapshot(), console_log.ConsoleLogParsed())
+        self.assertEqual(state_machine_all.menus_message_used, 'Disconnect: #TF_Idle_kicked\n')
+
     def test_non_ascii_in_usernames(self):
         self.assertFalse(console_log.non_ascii_in_usernames({'Hyde', 'Chocolate Thunder89', 'Sleepy'}))
         self.assertTrue(console_log.non_ascii_in_usernames({'Hyde', 'Chocolate Thunder89', '✿Sleepy✿'}))
@@ -153,11 +246,76 @@ class TestTF2RichPresence(unittest.TestCase):
         self.assertEqual(configs.steam_config_file(app, 'test_resources\\', True), None)
         app.gui.master.destroy()
 
+    def test_localconfig_extraction(self):
+        with open(os.path.join('test_resources', 'userdata', '160315024', 'config', 'localconfig.vdf'), 'rb') as localconfig_file:
+            localconfig_read = localconfig_file.read()
+
+        parsed = vdf.loads(localconfig_read.decode('UTF8'))['UserLocalConfigStore']
+        extracted = configs.extract_localconfig(localconfig_read, 123)
+        self.assertEqual(extracted, configs.LocalConfig(123, parsed['friends']['PersonaName'], True, int(parsed['Software']['Valve']['Steam']['Apps']['440']['LastPlayed']),
+                                                        parsed['Software']['Valve']['Steam']['Apps']['440']['LaunchOptions'], True))
+        self.assertEqual(configs.extract_localconfig(b'"UserLocalConfigStore" { "apps" { "440" { "LaunchOptions" "-condebug" } } }', 0), configs.LocalConfig(0, mentions_condebug=True))
+        self.assertEqual(configs.extract_localconfig(b'\xef\xbb\xbf"userlocalconfigstore"\n{\n\t"Friends" { "1" { "PersonaName" "someone else" } "personaname" "Kata\\"iser" }\n'
+                                                     b'\t"software" { "valve" { "steam" { "apps" { "440" { "lastplayed" "5" } "730" { "launchoptions" "{-condebug}" } } } } }\n'
+                                                     b'\t"Software" { "Valve" { "Steam" { "Apps" { "440" { "LaunchOptions" "-novid" } } } } }\n}\n', 0),
+                         configs.LocalConfig(0, 'Kata"iser', True, 5, '-novid', True))
+
+        for broken in (b'"UserLocalConfigStore" {', b'"UserLocalConfigStore" { "friends" { "a" "b }', b'}'):
+            with self.assertRaises(SyntaxError):
+                configs.extract_localconfig(broken, 0)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            localconfig_path = os.path.join(temp_dir, 'localconfig.vdf')
+            shutil.copy(os.path.join('test_resources', 'userdata', '160315024', 'config', 'localconfig.vdf'), localconfig_path)
+            cache = configs.LocalConfigCache(persist=False)
+            self.assertEqual(cache.read(self.log, localconfig_path)[1:], extracted[1:])
+            self.assertEqual(cache.read(self.log, localconfig_path)[1:], extracted[1:])
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            with open(localconfig_path, 'wb') as localconfig_file:
+                localconfig_file.write(localconfig_read.replace(b'Kataiser', b'Kataiser2'))
+
+            self.assertEqual(cache.read(self.log, localconfig_path).persona_name, 'Kataiser2')
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            os.remove(localconfig_path)
+
+            with self.assertRaises(FileNotFoundError):
+                cache.read(self.log, localconfig_path)
+
+            self.assertEqual(cache.entries, {})
+
     def test_find_tf2_exe(self):
         app = main.TF2RichPresense(self.log, set_process_priority=False)
         self.assertEqual(app.find_tf2_exe('test_resources\\very real steam'), r'test_resources\very real steam 2\steamapps\common\Team Fortress 2\tf_win64.exe')
         app.gui.master.destroy()
 
+    def test_tf2_install_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            steam_path = os.path.join(temp_dir, 'steam')
+            library_path = os.path.join(temp_dir, 'library')
+            shutil.copytree(os.path.join('test_resources', 'very real steam 2'), library_path)
+            os.makedirs(os.path.join(steam_path, 'steamapps'))
+
+            with open(os.path.join(steam_path, 'steamapps', 'libraryfolders.vdf'), 'w') as libraryfolders_vdf:
+                vdf.dump({'libraryfolders': {'0': {'path': steam_path}, '1': {'path': library_path}}}, libraryfolders_vdf)
+
+            fake_app = types.SimpleNamespace(log=self.log, tf2_install_cache=configs.TF2InstallCache(persist=False))
+            tf2_exe_path = os.path.join(library_path, 'steamapps', 'common', 'Team Fortress 2', 'tf_win64.exe')
+            self.assertEqual(configs.find_tf2_exe(fake_app, steam_path), tf2_exe_path)
+            self.assertEqual(fake_app.tf2_install_cache.lookup(self.log, steam_path), tf2_exe_path)
+            self.assertIsNone(fake_app.tf2_install_cache.lookup(self.log, library_path))
+
+            appid_path = os.path.join(os.path.dirname(tf2_exe_path), 'steam_appid.txt')
+            os.utime(appid_path, ns=(0, os.stat(appid_path).st_mtime_ns + 1_000_000_000))
+            self.assertIsNone(fake_app.tf2_install_cache.lookup(self.log, steam_path))
+            self.assertEqual(fake_app.tf2_install_cache.entries, {})
+            self.assertEqual(configs.find_tf2_exe(fake_app, steam_path), tf2_exe_path)
+
+            with open(os.path.join(steam_path, 'steamapps', 'libraryfolders.vdf'), 'a') as libraryfolders_vdf:
+                libraryfolders_vdf.write('\n')
+
+            self.assertIsNone(fake_app.tf2_install_cache.lookup(self.log, steam_path))
+
     def test_class_config_files(self):
         cfg_path = 'test_resources\\tf\\cfg'
         demo_path = f'{cfg_path}\\demoman.cfg'
@@ -178,11 +336,30 @@ class TestTF2RichPresence(unittest.TestCase):
         shutil.rmtree(cfg_path)
 
     def test_get_steam_username(self):
-        if processes.ProcessScanner(self.log).scan()['Steam']['running']:
+        if processes.ProcessScanner(self.log).scan().steam.running:
             self.assertNotEqual(configs.get_steam_username(), '')
         else:
             self.skipTest("Steam isn't running, assuming it's not installed")
 
+    def test_registry_username_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            registry_path = os.path.join(temp_dir, 'registry.vdf')
+            cache = configs.RegistryUsernameCache()
+            self.assertIsNone(cache.lookup(registry_path))
+
+            with open(registry_path, 'w') as registry_file:
+                registry_file.write('"Registry"\n{\n"HKCU"\n{\n"Software"\n{\n"Valve"\n{\n"Steam"\n{\n"LastGameNameUsed" "Kataiser"\n}\n}\n}\n}\n}\n')
+
+            self.assertEqual(cache.lookup(registry_path), 'Kataiser')
+            self.assertEqual(cache.lookup(registry_path), 'Kataiser')
+            self.assertEqual(cache.parses, 1)
+
+            with open(registry_path, 'w') as registry_file:
+                registry_file.write('"Registry"\n{\n"HKCU"\n{\n"Software"\n{\n"Valve"\n{\n"Steam"\n{\n"LastGameNameUsed" "Someone else"\n}\n}\n}\n}\n}\n')
+
+            self.assertEqual(cache.lookup(registry_path), 'Someone else')
+            self.assertEqual(cache.parses, 2)
+
     def test_cleanup_server_name(self):
         self.assertEqual(console_log.cleanup_server_name("Valve Matchmaking Server (Virginia srcds3155-iad2 #4)"), ("Valve Matchmaking Server (Virginia)", True))
         self.assertEqual(console_log.cleanup_server_name("Valve Matchmaking Server (LA srcds1153-lax2 #35)"), ("Valve Matchmaking Server (LA)", True))
@@ -211,6 +388,7 @@ class TestTF2RichPresence(unittest.TestCase):
         self.assertEqual(gamemodes.get_map_gamemode(self.log, 'ytsb8eitybw'), ('ytsb8eitybw', 'unknown', 'Unknown gamemode', True))
 
     def test_logger(self):
+        self.log.flush()
         self.log.log_file.close()
         try:
             os.remove(self.log.filename)
@@ -233,6 +411,7 @@ class TestTF2RichPresence(unittest.TestCase):
         self.log.debug("Gone. Reduced to atoms.")
         settings.change('log_level', 'Off')
         self.assertFalse(self.log.enabled())
+        self.log.flush()
         self.log.log_file.close()
 
         with open(self.log.filename, 'r', encoding='UTF8') as current_log_file:
@@ -246,6 +425,98 @@ class TestTF2RichPresence(unittest.TestCase):
 
         os.remove(self.log.filename)
 
+    def test_log_writer(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_path = os.path.join(temp_dir, 'test.log')
+            errors_path = os.path.join(temp_dir, 'test.errors.log')
+            writer = logger.LogWriter(flush_interval=60, flush_size=100)
+
+            with open(log_path, 'a', encoding='UTF8') as log_file:
+                writer.write(log_file, "line 1\n")
+                writer.write(errors_path, "error 1\n")
+                time.sleep(0.1)
+                self.assertEqual(os.path.getsize(log_path), 0)
+                self.assertFalse(os.path.isfile(errors_path))
+
+                writer.flush()
+                self.assertEqual((writer.lines_written, writer.batches_written), (2, 2))
+
+                for line_num in range(20):
+                    writer.write(log_file, f"line {line_num + 2}\n")
+
+                self.assertTrue(wait_until(lambda: writer.lines_written > 2))
+                self.assertLess(writer.lines_written, 22)
+                writer.flush()
+
+            with open(log_path, 'r', encoding='UTF8') as log_file:
+                self.assertEqual(log_file.read(), ''.join(f"line {line_num}\n" for line_num in range(1, 22)))
+
+            with open(errors_path, 'r', encoding='UTF8') as errors_file:
+                self.assertEqual(errors_file.read(), "error 1\n")
+
+            quick_writer = logger.LogWriter(flush_interval=0.05)
+            quick_writer.write(errors_path, "error 2\n")
+            self.assertTrue(wait_until(lambda: quick_writer.lines_written == 1))
+
+        self.assertEqual(logger.formatted_time(0), datetime.datetime.fromtimestamp(0).strftime('%c')[4:-5])
+        self.assertEqual(logger.deferred_message("{} and {}", (1, {'a': 2})), "1 and {'a': 2}")
+        self.assertEqual(logger.deferred_message(lambda: f"{1 + 1}", ()), "2")
+        self.assertEqual(logger.deferred_message("{not formatted}", ()), "{not formatted}")
+
+    def test_breadcrumb_buffer(self):
+        breadcrumbs = logger.BreadcrumbBuffer(depth=3, sample_every={'DEBUG': 2, 'ERROR': 1})
+
+        for line_num in range(6):
+            breadcrumbs.add(1700000000 + line_num, 'DEBUG', f"Debug {line_num}")
+
+        breadcrumbs.add(1700000010, 'INFO', "Not kept")
+        breadcrumbs.add(1700000020, 'ERROR', "E" * 1000)
+        self.assertEqual(repr(breadcrumbs), "logger.BreadcrumbBuffer (3/3 records, sample_every={'DEBUG': 2, 'ERROR': 1})")
+
+        sentry_breadcrumb = {'type': 'default', 'level': 'fatal', 'message': "From Sentry", 'timestamp': datetime.datetime.fromtimestamp(1700000004.5, datetime.timezone.utc)}
+        event = breadcrumbs.add_to_event({'breadcrumbs': {'values': [sentry_breadcrumb]}}, {})
+        self.assertEqual([(breadcrumb['level'], breadcrumb['message'][:10]) for breadcrumb in event['breadcrumbs']['values']],
+                         [('debug', "Debug 3"), ('fatal', "From Sentr"), ('debug', "Debug 5"), ('error', "E" * 10)])
+        self.assertEqual(len(event['breadcrumbs']['values'][-1]['message']), 512)
+        self.assertEqual(logger.BreadcrumbBuffer().add_to_event({'message': "Nothing logged"}, {}), {'message': "Nothing logged"})
+        self.assertEqual((logger.breadcrumbs.records.maxlen, logger.breadcrumbs.sample_every), (logger.BREADCRUMB_DEPTH, logger.BREADCRUMB_SAMPLE_EVERY))
+
+    def test_session_log(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log = logger.Log(os.path.join(temp_dir, 'test.log'), structured=True)
+            log.to_stderr = False
+            log.debug("Loop {}", 1)
+            log.event('loop', iteration=1, loop_time=0.25, tf2_running=True)
+            log.event('loop', iteration=2, loop_time=0.5, tf2_running=False)
+            log.error("Something ünusual", reportable=False)
+            log.flush()
+            log.log_file.close()
+            log.structured_file.close()
+            structured_path = os.path.join(temp_dir, 'test.slog')
+            self.assertEqual(log.structured_filename, structured_path)
+
+            records = list(session_log.read_records(structured_path))
+            self.assertEqual([(record.level, record.event) for record in records],
+                             [('Debug', 'session_start'), ('Debug', 'log'), ('Debug', 'log'), ('Debug', 'loop'), ('Debug', 'loop'), ('Error', 'log')])
+            self.assertEqual(records[2].fields, {'message': "Loop 1"})
+            self.assertEqual(records[-1].fields, {'message': "Something ünusual"})
+            self.assertEqual([record.fields for record in session_log.read_records(structured_path, events=['loop'])],
+                             [{'iteration': 1, 'loop_time': 0.25, 'tf2_running': True}, {'iteration': 2, 'loop_time': 0.5, 'tf2_running': False}])
+            self.assertEqual(len(list(session_log.read_records(structured_path, levels=['Error']))), 1)
+
+            # compressed, and cut off partway through the last record
+            with open(structured_path, 'rb') as structured_file:
+                structured_data = structured_file.read()
+
+            with gzip.open(f'{structured_path}.gz', 'wb') as compressed_file:
+                compressed_file.write(structured_data[:-3])
+
+            self.assertEqual(list(session_log.read_records(f'{structured_path}.gz')), records[:-1])
+            self.assertEqual(session_log.find_session_logs([temp_dir]), [structured_path, f'{structured_path}.gz'])
+
+            with self.assertRaises(ValueError):
+                list(session_log.read_records(os.path.join(temp_dir, 'test.log')))
+
     def test_log_cleanup(self):
         old_dir = os.getcwd()
         os.chdir(os.path.abspath('test_resources'))
@@ -265,12 +536,66 @@ class TestTF2RichPresence(unittest.TestCase):
 
         self.log.cleanup(4)
         self.assertEqual(os.listdir('logs'), ['0f784a27.log.gz', '267d4853.log.gz', '46b087ff.log.gz', '6cbf1447.log.gz'])
-        self.log.cleanup(2)
-        self.assertEqual(os.listdir('logs'), ['46b087ff.log.gz', '6cbf1447.log.gz'])
+        self.log.cleanup(2)  # the compressed logs keep their modified times, so these are still the newest
+        self.assertEqual(os.listdir('logs'), ['0f784a27.log.gz', '267d4853.log.gz'])
         shutil.rmtree('logs')
 
         os.chdir(old_dir)
 
+    def test_log_cleanup_compression(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_contents = {}
+
+            for log_num in range(6):
+                log_path = os.path.join(temp_dir, f'{log_num}.log')
+                log_contents[f'{log_num}.log'] = ''.join(f"[{log_num}] DEBUG: line {line_num} {random.random()}\n" for line_num in range(5000)).encode('UTF8')
+
+                with open(log_path, 'wb') as log_file:
+                    log_file.write(log_contents[f'{log_num}.log'])
+
+                modified_time = time.time() - 10 + log_num
+                os.utime(log_path, times=(modified_time, modified_time))
+
+            with open(os.path.join(temp_dir, 'test.errors.log'), 'w') as errors_file:
+                errors_file.write("not touched")
+
+            self.log.logs_path = temp_dir
+            self.log.filename = os.path.join(temp_dir, '5.log')  # the current log, which doesn't get compressed
+            self.log.cleanup(5, compression='xz')
+            self.assertEqual(sorted(os.listdir(temp_dir)), ['1.log.xz', '2.log.xz', '3.log.xz', '4.log.xz', '5.log', 'test.errors.log'])
+
+            with lzma.open(os.path.join(temp_dir, '3.log.xz'), 'rb') as compressed_log:
+                self.assertEqual(compressed_log.read(), log_contents['3.log'])
+
+            compressed_size = os.stat(os.path.join(temp_dir, '4.log.xz')).st_size
+            self.log.cleanup(5, max_bytes=compressed_size * 3.5)
+            self.assertEqual(sorted(os.listdir(temp_dir)), ['2.log.xz', '3.log.xz', '4.log.xz', '5.log', 'test.errors.log'])
+            self.log.cleanup(2, max_bytes=compressed_size * 3.5)
+            self.assertEqual(sorted(os.listdir(temp_dir)), ['4.log.xz', '5.log', 'test.errors.log'])
+
+            self.assertEqual(logger.best_compression(), 'zst' if logger.zstandard else 'gz')
+
+            with logger.open_compressed(os.path.join(temp_dir, 'test.gz'), 'gz') as compressed_file:
+                compressed_file.write(b"test")
+
+            with gzip.open(os.path.join(temp_dir, 'test.gz'), 'rb') as compressed_file:
+                self.assertEqual(compressed_file.read(), b"test")
+
+            # failing partway through leaves the original alone and nothing half-written next to it
+            def failing_copystat(*args):
+                raise OSError("copystat failed")
+
+            real_copystat = logger.shutil.copystat
+            logger.shutil.copystat = failing_copystat
+
+            try:
+                with self.assertRaises(OSError):
+                    self.log.compress_log(self.log.filename, 'gz')
+            finally:
+                logger.shutil.copystat = real_copystat
+
+            self.assertEqual(sorted(os.listdir(temp_dir)), ['4.log.xz', '5.log', 'test.errors.log', 'test.gz'])
+
     def test_update_checker(self):
         update_checker = updater.UpdateChecker(self.log)
         update_checker.initiate_update_check(False)
@@ -342,21 +667,173 @@ class TestTF2RichPresence(unittest.TestCase):
         settings.fix_settings(self.log)
         self.assertEqual(settings.access_registry(), settings.defaults())
 
+    def test_settings_store(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            settings_path = os.path.join(temp_dir, 'TF2 Rich Presence', 'settings.json')
+            store = settings.SettingsStore(settings.JSONFileBackend(settings_path))
+            self.assertEqual(store.get_all(), settings.defaults())
+            self.assertEqual(store.get('wait_time'), 1)
+            self.assertEqual((store.reads, store.writes), (1, 1))
+            self.assertTrue(os.path.isfile(settings_path))
+            self.assertFalse(os.path.isfile(f'{settings_path}.tmp'))
+
+            changes = []
+            store.subscribe(changes.append)
+            store.update({'wait_time': 2})
+            store.update({'wait_time': 2})
+            self.assertEqual(store.values.wait_time, 2)
+            self.assertEqual(changes, [{'wait_time': 2}])
+
+            with store.batch():
+                store.update({'log_level': 'Error'})
+                store.update({'gui_scale': 150})
+                self.assertEqual(store.writes, 2)
+
+            self.assertEqual((store.reads, store.writes), (1, 3))
+            self.assertEqual(changes[-1], {'log_level': 'Error', 'gui_scale': 150})
+
+            reloaded_store = settings.SettingsStore(settings.JSONFileBackend(settings_path))
+            self.assertEqual(reloaded_store.get_all(), store.get_all())
+            self.assertEqual(reloaded_store.values, settings.Settings(wait_time=2, log_level='Error', gui_scale=150))
+
+            with open(settings_path, 'w') as settings_file:
+                settings_file.write('{"broken')
+
+            self.assertIsNone(settings.JSONFileBackend(settings_path).read())
+            self.assertFalse(os.path.isfile(settings_path))
+
+            with open(f'{settings_path}.bad', 'r') as bad_file:
+                self.assertEqual(bad_file.read(), '{"broken')
+
+            settings_file_replaced = settings.SettingsStore(settings.JSONFileBackend(settings_path))
+            self.assertEqual(settings_file_replaced.get_all(), settings.defaults())
+            self.assertTrue(os.path.isfile(settings_path))
+
+            broken = settings.defaults()
+            del broken['wait_time']
+            broken['fake'] = True
+            old_backend = settings.store.backend
+            settings.store.backend = settings.JSONFileBackend(os.path.join(temp_dir, 'settings.json'))
+            settings.store.backend.write(broken)
+            settings.store.reload()
+            writes_before = settings.store.writes
+
+            try:
+                settings.fix_settings(self.log)
+                self.assertEqual(settings.access_registry(), settings.defaults())
+                self.assertEqual(settings.current(), settings.Settings())
+                self.assertEqual(settings.store.writes, writes_before + 1)
+            finally:
+                settings.store.backend = old_backend
+                settings.store.reload()
+
+    def test_key_value_db(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'DB.sqlite')
+            json_path = os.path.join(temp_dir, 'DB.json')
+
+            with open(json_path, 'w') as db_json:
+                db_json.write('{"error_hashes": [1, 2], "available_version": "v2.0"}')
+
+            db = utils.KeyValueDB(db_path, import_path=json_path)
+            db_data = db.read()
+            self.assertEqual(db_data['error_hashes'], [1, 2])
+            self.assertEqual(db_data['available_version'], 'v2.0')
+            self.assertEqual(db_data['gui_position'], [0, 0])
+
+            db_data['error_hashes'].append(3)
+            self.assertEqual(db.read()['error_hashes'], [1, 2])
+            db.write(db_data)
+            db.write(db.read())
+            self.assertEqual((db.reads, db.writes), (1, 1))
+            self.assertEqual(db.read()['error_hashes'], [1, 2, 3])
+
+            other_db = utils.KeyValueDB(db_path)
+            self.assertEqual(other_db.read()['error_hashes'], [1, 2, 3])
+            other_db.write({'has_asked_language': True})
+            self.assertTrue(db.read()['has_asked_language'])
+            self.assertEqual(db.reads, 2)
+
+            # batched writes are only saved (once) at the end, but can be read before then
+            writes = db.writes
+            with db.batch():
+                db.write({'gui_position': [1, 2]})
+                with db.batch():
+                    db.write({'available_version': 'v3.0'})
+
+                self.assertEqual(db.read()['gui_position'], [1, 2])
+                self.assertEqual(other_db.read()['gui_position'], [0, 0])
+                self.assertEqual(db.writes, writes)
+
+                other_thread = threading.Thread(target=db.write, args=({'has_asked_language': False},))  # other threads aren't part of it
+                other_thread.start()
+                other_thread.join()
+                self.assertEqual(db.writes, writes + 1)
+
+            self.assertEqual(db.writes, writes + 2)
+            self.assertEqual((other_db.read()['gui_position'], other_db.read()['available_version']), ([1, 2], 'v3.0'))
+            other_db.close()
+            db.close()
+
+            with open(db_path, 'wb') as db_file:
+                db_file.write(b'not a database' * 1000)
+
+            os.remove(json_path)
+            broken_db = utils.KeyValueDB(db_path, import_path=json_path)
+            self.assertEqual(broken_db.read(), utils.db_defaults)
+            broken_db.write({'gui_position': [10, 20]})
+            broken_db.close()
+
+            # another process holding a lock isn't corruption, so nothing gets deleted
+            locking_connection = sqlite3.connect(db_path, isolation_level=None)
+            locking_connection.execute('PRAGMA journal_mode=DELETE')
+            locking_connection.execute('BEGIN EXCLUSIVE')
+            locked_db = utils.KeyValueDB(db_path, timeout=0.1)
+
+            with self.assertRaises(sqlite3.OperationalError):
+                locked_db.read()
+
+            locking_connection.rollback()
+            locking_connection.close()
+            self.assertEqual(locked_db.read()['gui_position'], [10, 20])
+            locked_db.close()
+
+    def test_reported_hashes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db = utils.KeyValueDB(os.path.join(temp_dir, 'DB.sqlite'))
+            db.write({'tb_hashes': ['123', '456']})  # the old format
+            reported = utils.ReportedHashes('tb_hashes', db=db, max_entries=3)
+            self.assertFalse(reported.add(123))
+            self.assertTrue(reported.add(789))
+            self.assertFalse(reported.add(789))
+            self.assertEqual(sorted(utils.ReportedHashes.decode(db.read()['tb_hashes'])), [123, 456, 789])
+
+            # from another process, sort of
+            other_reported = utils.ReportedHashes('tb_hashes', db=utils.KeyValueDB(os.path.join(temp_dir, 'DB.sqlite')))
+            self.assertFalse(other_reported.add(456))
+            self.assertTrue(other_reported.add(1000))
+            self.assertFalse(reported.add(1000))
+            other_reported.db.close()
+
+            # only the newest max_entries are kept, and old ones expire
+            db.write({'tb_hashes': utils.ReportedHashes.encode({1: int(time.time()) - 100, 2: int(time.time()) - 10, 3: int(time.time()) - 1, 4: int(time.time())})})
+            expiring = utils.ReportedHashes('tb_hashes', db=db, max_age=50, max_entries=3)
+            self.assertTrue(expiring.add(1))
+            self.assertFalse(expiring.add(3))
+            self.assertEqual(sorted(utils.ReportedHashes.decode(db.read()['tb_hashes'])), [1, 3, 4])
+
+            db.write({'tb_hashes': 'not base64 at all'})
+            self.assertTrue(utils.ReportedHashes('tb_hashes', db=db).add(5))
+            db.close()
+
+        self.assertEqual(repr(utils.reported_hashes('error_hashes')), f"utils.ReportedHashes (error_hashes, {len(utils.reported_hashes('error_hashes').reported)} reported)")
+        self.assertEqual(utils.ReportedHashes.decode(''), {})
+
     def test_get_api_key(self):
         self.assertEqual(len(utils.get_api_key('discord')), 18)
         self.assertEqual(len(utils.get_api_key('discord2')), 18)
         self.assertEqual(len(utils.get_api_key('sentry')), 91)
 
-    def test_timeout(self):
-        start_time = time.perf_counter()
-
-        with self.assertRaises(KeyboardInterrupt):
-            slow_func(5)
-
-        elapsed = time.perf_counter() - start_time
-        self.assertGreaterEqual(elapsed, 0.5)
-        self.assertLess(elapsed, 5)
-
     def test_load_maps_db(self):
         maps_db = gamemodes.load_maps_db()
         self.assertEqual(len(maps_db), 235)
@@ -369,28 +846,104 @@ class TestTF2RichPresence(unittest.TestCase):
 
             self.assertEqual(len(set(map_data)), 3)
 
-    def test_discoipc(self):
-        # this test fails if Discord isn't running
-        test_process_scanner = processes.ProcessScanner(self.log)
-        if not test_process_scanner.scan()['Discord']['running']:
-            self.skipTest("Discord needs to be running")
-
-        activity = {'details': "Testing TF2 Rich Presence",
-                    'timestamps': {'start': int(time.time())},
-                    'assets': {'small_image': 'tf2_icon_small', 'small_text': 'Team Fortress 2', 'large_image': 'main_menu',
-                               'large_text': 'In menus'},
-                    'state': "(Probably don't actually have the game open)"}
-
-        client = ipc.DiscordIPC('429389143756374017')
-        time.sleep(0.1)  # this fix works? seriously?
-        client.connect()
-        client.update_activity(activity)
-        client_state = (client.client_id, client.connected, client.ipc_path, isinstance(client.pid, int), client.platform, isinstance(client.socket, io.BufferedRandom), client.socket.name)
-        self.assertEqual(client_state, ('429389143756374017', True, '\\\\?\\pipe\\discord-ipc-0', True, 'windows', True, '\\\\?\\pipe\\discord-ipc-0'))
+    def test_discord_ipc(self):
+        if os.name == 'nt':
+            ipc_path = f'\\\\?\\pipe\\tf2rp-test-{random.randint(10000, 99999)}'
+        else:
+            ipc_path = os.path.join(tempfile.gettempdir(), f'tf2rp-test-{random.randint(10000, 99999)}')
+
+        client = discord_ipc.DiscordIPCClient(self.log, '429389143756374017', paths=[ipc_path], min_backoff=0.05, max_backoff=0.2, min_interval=0)
+        server = FakeDiscordIPCServer(ipc_path)
+
+        # Discord isn't "running" yet, so the client backs off and only keeps the newest activity
+        for activity_num in range(3):
+            client.update_activity({'details': f"Activity {activity_num}"})
+
+        self.assertTrue(wait_until(lambda: client.connect_failures >= 2))
+        self.assertFalse(client.connected)
+        self.assertTrue(client.last_error.startswith("Can't connect to Discord"))
+        self.assertEqual(server.activities, [])
+
+        server.start()
+        self.assertTrue(wait_until(lambda: client.acknowledged == 1))
+        self.assertEqual(server.activities, [{'details': "Activity 2"}])
+        self.assertEqual((client.connected, client.ipc_path, client.last_error, client.sent, client.publisher.coalesced), (True, ipc_path, None, 1, 2))
+        self.assertEqual(server.pids, {os.getpid()})
+
+        # several updates at once don't wait on each other's responses
+        for activity_num in range(3, 6):
+            client.update_activity({'details': f"Activity {activity_num}"})
+
+        self.assertTrue(wait_until(lambda: server.activities[-1] == {'details': "Activity 5"}))
+
+        # Discord restarting, which should get a reconnect and the current activity again
+        server.drop_connections()
+        self.assertTrue(wait_until(lambda: server.handshakes == 2 and server.activities[-1] == {'details': "Activity 5"} and client.connected))
 
         client.disconnect()
-        client_state = (client.client_id, client.connected, client.ipc_path, isinstance(client.pid, int), client.platform, client.socket)
-        self.assertEqual(client_state, ('429389143756374017', False, '\\\\?\\pipe\\discord-ipc-0', True, 'windows', None))
+        self.assertTrue(wait_until(lambda: server.closes == 1 and not client.connected))
+        self.assertEqual(server.handshakes, 2)
+
+        client.close()
+        server.stop()
+        self.assertFalse(client.thread)
+
+    def test_check_rpc_client(self):
+        handled_errors = []
+        fake_rpc_client = types.SimpleNamespace(connected=False, last_error="Can't connect to Discord (FileNotFoundError)")
+        fake_app = types.SimpleNamespace(rpc_client=fake_rpc_client, client_connected=True, rpc_failed=False, last_rpc_error=None, handle_rpc_error=handled_errors.append)
+
+        # while Discord isn't there, the error shows every loop but is only handled once
+        for _ in range(3):
+            fake_app.rpc_failed = False
+            main.TF2RichPresense.check_rpc_client(fake_app)
+            self.assertTrue(fake_app.rpc_failed)
+
+        self.assertFalse(fake_app.client_connected)
+        self.assertEqual(handled_errors, ["Can't connect to Discord (FileNotFoundError)"])
+
+        fake_rpc_client.connected, fake_rpc_client.last_error = True, None
+        fake_app.rpc_failed = False
+        main.TF2RichPresense.check_rpc_client(fake_app)
+        self.assertEqual((fake_app.client_connected, fake_app.rpc_failed, fake_app.last_rpc_error), (True, False, None))
+
+        fake_rpc_client.connected, fake_rpc_client.last_error = False, "Lost connection to Discord (ConnectionResetError)"
+        main.TF2RichPresense.check_rpc_client(fake_app)
+        self.assertEqual(len(handled_errors), 2)
+
+    def test_activity_publisher(self):
+        publisher = discord_ipc.ActivityPublisher(min_interval=0.2)
+        self.assertIsNone(publisher.wait_time())
+
+        # the first one goes out immediately
+        activity = {'details': "In menus", 'state': "Not queued", 'timestamps': {'start': 0}}
+        self.assertTrue(publisher.offer(activity))
+        self.assertEqual(publisher.wait_time(), 0)
+        self.assertEqual(publisher.take(), activity)
+
+        # identical, even if it's a different dict
+        self.assertFalse(publisher.offer({'details': "In menus", 'state': "Not queued", 'timestamps': {'start': 0}}))
+        self.assertIsNone(publisher.wait_time())
+
+        # changes during the interval replace each other and wait for it to end
+        activity['timestamps']['start'] = 1
+        self.assertTrue(publisher.offer(activity))
+        self.assertTrue(publisher.offer({'details': "In menus", 'state': "Queued for Casual", 'timestamps': {'start': 1}}))
+        self.assertFalse(publisher.offer({'details': "In menus", 'state': "Queued for Casual", 'timestamps': {'start': 1}}))
+        self.assertGreater(publisher.wait_time(), 0.1)
+        time.sleep(0.2)
+        self.assertEqual(publisher.wait_time(), 0)
+        self.assertEqual(publisher.take(), {'details': "In menus", 'state': "Queued for Casual", 'timestamps': {'start': 1}})
+        self.assertEqual((publisher.published, publisher.dropped, publisher.coalesced), (2, 2, 1))
+
+        # changing back to what was last sent cancels what's pending
+        self.assertTrue(publisher.offer(activity))
+        self.assertFalse(publisher.offer({'details': "In menus", 'state': "Queued for Casual", 'timestamps': {'start': 1}}))
+        self.assertIsNone(publisher.wait_time())
+
+        publisher.resend()
+        self.assertEqual(publisher.wait_time(), 0)
+        self.assertEqual(repr(publisher), 'discord_ipc.ActivityPublisher (2 published, 2 dropped, 2 coalesced)')
 
     def test_process_scanning(self):
         process_scanner = processes.ProcessScanner(self.log)
@@ -407,6 +960,185 @@ class TestTF2RichPresence(unittest.TestCase):
 
         self.assertFalse(process_scanner.tf_win64_exe_is_tf2(os.getpid()))
 
+    def test_process_tracking(self):
+        process_scanner = processes.ProcessScanner(self.log)
+        process_scanner.executables[os.name][0] = 'python'
+        python_process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+        process_scanner.pids['TF2'] = python_process.pid
+
+        try:
+            p_info = process_scanner.get_process_info('TF2', ('path', 'time'))
+            tracked = process_scanner.tracked['TF2']
+            self.assertEqual((p_info['running'], p_info['path']), (True, os.path.dirname(tracked.cmdline[0])))
+            self.assertEqual(p_info['time'], int(psutil.Process(python_process.pid).create_time()))
+            self.assertTrue(tracked.alive())
+
+            # nothing's looked up again while it's still running
+            self.assertEqual(process_scanner.get_process_info('TF2', ('path', 'time')), p_info)
+            self.assertIs(process_scanner.tracked['TF2'], tracked)
+
+            # and if nothing changed, neither does the snapshot object
+            process_scanner.get_all_extended_info()
+            snapshot = process_scanner.snapshot
+            self.assertEqual(snapshot, processes.ProcessSnapshot(processes.ProgramInfo(True, python_process.pid, p_info['path'], p_info['time'])))
+            process_scanner.get_all_extended_info()
+            self.assertIs(process_scanner.snapshot, snapshot)
+        finally:
+            python_process.kill()
+            python_process.wait()
+
+        self.assertFalse(tracked.alive())
+        self.assertEqual(process_scanner.get_process_info('TF2', ('path', 'time')), {'running': False, 'path': None, 'time': None})
+        self.assertEqual(process_scanner.tracked, {})
+        process_scanner.get_all_extended_info()
+        self.assertEqual(process_scanner.snapshot, processes.ProcessSnapshot())
+        self.assertIsNone(process_scanner.pids['TF2'])
+
+    def test_linux_process_scanning(self):
+        process_scanner = processes.ProcessScanner(self.log)
+        if not process_scanner.use_proc:
+            self.skipTest("Needs Linux's /proc")
+
+        sleep_process = subprocess.Popen(['sleep', '30'])
+        process_scanner.executables['posix'] = ['sleep', 'not_a_program_1', 'not_a_program_2']
+        process_scanner.get_all_extended_info = lambda: None  # only testing finding PIDs here
+
+        try:
+            process_scanner.scan_linux()
+            first_names_read = process_scanner.proc_names_read
+            self.assertEqual(process_scanner.pids['TF2'], sleep_process.pid)
+            self.assertEqual(process_scanner.proc_identities[sleep_process.pid][1], 'sleep')
+            self.assertGreater(first_names_read, 1)
+
+            # already seen processes only have their start times checked
+            process_scanner.pids['TF2'] = None
+            process_scanner.scan_linux()
+            self.assertEqual(process_scanner.pids['TF2'], sleep_process.pid)
+            self.assertLess(process_scanner.proc_names_read - first_names_read, first_names_read)
+
+            # and nothing is read when every PID is known
+            process_scanner.pids['Steam'] = process_scanner.pids['Discord'] = os.getpid()
+            proc_reads = process_scanner.proc_reads
+            process_scanner.scan_linux()
+            self.assertEqual(process_scanner.proc_reads, proc_reads)
+        finally:
+            sleep_process.kill()
+            sleep_process.wait()
+
+        # the cached name is used for the same PID and start time, but not for a different process with the same PID
+        own_start_time = process_scanner.proc_identities[os.getpid()][0]
+        process_scanner.proc_identities[os.getpid()] = (own_start_time, 'sleep')
+        process_scanner.pids['TF2'] = None
+        process_scanner.scan_linux()
+        self.assertEqual(process_scanner.pids['TF2'], os.getpid())
+
+        process_scanner.proc_identities[os.getpid()] = (own_start_time - 1, 'sleep')
+        process_scanner.pids['TF2'] = None
+        process_scanner.scan_linux()
+        self.assertIsNone(process_scanner.pids['TF2'])
+        self.assertNotEqual(process_scanner.proc_identities[os.getpid()][1], 'sleep')
+
+    def test_process_events(self):
+        event_source = process_events.create_event_source(self.log)
+        if not event_source.detects_exits:
+            self.skipTest(f"Process events aren't supported here (backend is {event_source.backend})")
+
+        event_source.watch_names(['sleep'])
+        sleep_process = subprocess.Popen(['sleep', '30'])
+
+        if event_source.detects_starts:
+            self.assertTrue(wait_until(lambda: process_events.ProcessEvent('start', sleep_process.pid, 'sleep') in event_source.read_events()))
+
+        event_source.watch_pids({sleep_process.pid: 'sleep'})
+        self.assertEqual(event_source.read_events(), [])
+        sleep_process.kill()
+        sleep_process.wait()
+        self.assertTrue(wait_until(lambda: process_events.ProcessEvent('exit', sleep_process.pid, 'sleep') in event_source.read_events()))
+        self.assertEqual(event_source.pids, {})
+        event_source.close()
+
+        # falling back from the proc connector doesn't leave its epoll open
+        if sys.platform.startswith('linux'):
+            def unsupported_socket(*args):
+                raise OSError(93, "Protocol not supported")  # EPROTONOSUPPORT
+
+            real_socket = process_events.socket.socket
+            process_events.socket.socket = unsupported_socket
+            open_fds = len(os.listdir('/proc/self/fd'))
+
+            connector_error = None
+
+            try:
+                process_events.ProcConnectorEventSource(self.log)
+            except OSError as error:
+                connector_error = error  # keeps the half-made event source alive through its traceback, so garbage collection can't be what closes it
+            finally:
+                process_events.socket.socket = real_socket
+
+            self.assertIsNotNone(connector_error)
+            self.assertEqual(len(os.listdir('/proc/self/fd')), open_fds)
+
+    def test_file_watch(self):
+        watched_path = 'test_resources\\watched.log'
+        if os.path.isfile(watched_path):
+            os.remove(watched_path)
+
+        watcher = file_watch.create_watcher(self.log)
+        self.assertFalse(watcher.changed())
+        watcher.watch(watched_path)
+        self.assertFalse(watcher.changed())
+
+        with open(watched_path, 'w') as watched_file:
+            watched_file.write("Map: itemtest\n")
+
+        self.assertTrue(watcher.changed())
+        self.assertFalse(watcher.changed())
+        watcher.watch(None)
+
+        with open(watched_path, 'a') as watched_file:
+            watched_file.write("Lobby destroyed\n")
+
+        self.assertFalse(watcher.changed())
+        watcher.close()
+        os.remove(watched_path)
+
+    def test_scheduler(self):
+        root = tk.Tk()
+        job_scheduler = scheduler.Scheduler(self.log, root)
+        job_runs = []
+
+        job_scheduler.schedule('b', 0.02, job_runs.append, 'b')
+        job_scheduler.schedule('a', 0.01, job_runs.append, 'a')
+        job_scheduler.schedule('c', 0.01, job_runs.append, 'c')
+        job_scheduler.cancel('c')
+        job_scheduler.schedule('stop', 0.05, job_scheduler.stop)
+        self.assertTrue(job_scheduler.is_scheduled('a'))
+        self.assertLessEqual(job_scheduler.time_until('b'), 0.02)
+        job_scheduler.run()
+        self.assertEqual(job_runs, ['a', 'b'])
+        self.assertEqual(job_scheduler.wakeups, 3)
+        self.assertFalse(job_scheduler.is_scheduled('a'))
+        self.assertIsNone(job_scheduler.time_until('a'))
+
+        job_scheduler.schedule('crash', 0, lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            job_scheduler.run()
+
+        # same for file handlers, which Tk would otherwise also swallow
+        read_fd, write_fd = os.pipe()
+        if job_scheduler.watch_fileno('pipe', read_fd, lambda: 1 / 0):
+            os.write(write_fd, b'x')
+            job_scheduler.schedule('stop', 1, job_scheduler.stop)
+
+            with self.assertRaises(ZeroDivisionError):
+                job_scheduler.run()
+
+            job_scheduler.watch_fileno('pipe', None, lambda: None)
+
+        os.close(read_fd)
+        os.close(write_fd)
+        root.destroy()
+
     def test_settings_gui(self):
         root = tk.Toplevel()
         settings_gui_test = settings_gui.GUI(root, self.log)
@@ -478,10 +1210,68 @@ class TestTF2RichPresence(unittest.TestCase):
         db['missing_localization'] = []
         utils.access_db(write=db)
 
+    def test_localization_catalog(self):
+        meta_keys = ('name_localized', 'code', 'credits', 'notes')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            catalog_path = os.path.join(temp_dir, 'catalog.bin')
+            catalog_data = localization.compile_catalog(catalog_path)
+            catalog = localization.LocalizationCatalog(catalog_path)
+            self.assertEqual(repr(catalog), f"localization.LocalizationCatalog ({catalog_path}, 12 languages, 0 loaded)")
+
+            for language, language_data in localization.read_localization_files().items():
+                self.assertEqual(catalog.name_localized(language), language_data['name_localized'])
+                self.assertEqual(catalog.code(language), language_data['code'])
+                self.assertEqual(catalog.meta(language), {key: language_data[key] for key in meta_keys})
+
+                for key, line in language_data.items():
+                    if key not in meta_keys:
+                        self.assertEqual(catalog.lookup(language, int(key)), line)
+
+            self.assertIsNone(catalog.lookup('German', int(localization.hash_text("This text isn't in the localization files"))))
+            self.assertEqual(catalog.sections.keys(), localization.read_localization_files().keys())
+            catalog.data.close()
+
+            in_memory_catalog = localization.LocalizationCatalog(data=catalog_data)
+            self.assertEqual(in_memory_catalog.lookup('French', int(localization.hash_text("In menus"))), localization.Localizer(language='French', persist_missing=False).text("In menus"))
+
+            with self.assertRaises(ValueError):
+                localization.LocalizationCatalog(data=b'not a catalog')
+
+    def test_localization_templates(self):
+        english_lines = set(localization.access_localization_data()['English'].values())
+
+        for name, english_text in localization.TEMPLATES.items():
+            self.assertIn(english_text, english_lines, name)
+
+        localizer = localization.Localizer(persist_missing=False)
+        french_localizer = localization.Localizer(language='French', persist_missing=False)
+        templates = localizer.templates
+        self.assertEqual(repr(templates), f"localization.TemplateRegistry (English, {len(localization.TEMPLATES)} templates)")
+        self.assertEqual(repr(templates.player_count), "localization.Template ('Players: {0}/{1}' -> 'Players: {0}/{1}')")
+        self.assertEqual(templates.player_count(6, 24), "Players: 6/24")
+        self.assertEqual(templates.in_menus.text, "In menus")
+        self.assertEqual(french_localizer.templates.map_line('Upward'), french_localizer.text("Map: {0}").format('Upward'))
+
+        settings.change('language', 'German')
+        self.assertIs(localizer.templates.player_count, templates.player_count)
+        self.assertEqual(localizer.language, 'German')
+        self.assertEqual(templates.player_count(6, 6), "Spieler: 6/6")
+        self.assertEqual(templates.resolved(), {english_text: localizer.text(english_text) for english_text in localization.TEMPLATES.values()})
+        self.assertEqual(french_localizer.language, 'French')  # only follows the setting when no language was given
+
+        settings.change('language', 'English')
+        self.assertEqual(templates.player_count(6, 6), "Players: 6/6")
+        self.assertEqual(localization.Localizer(appending=True, persist_missing=False).templates.in_menus.text, "In menus")
+
     def test_main_simple(self):
         settings.change('wait_time_slow', 1)
         app = main.TF2RichPresense(self.log)
         self.assertEqual(repr(app), 'main.TF2RichPresense (state=init)')
+        self.assertEqual(app.loop_inputs(), main.LoopInputs(False, False))
+        app.gui.tf2_launch_cmd = ('tf_win64.exe', '-novid')
+        self.assertEqual(app.loop_inputs(), main.LoopInputs(True, False))
+        app.gui.tf2_launch_cmd = None
         self.assertEqual(fix_activity_dict(app.game_state.activity()),
                          {'details': 'In menus',
                           'state': 'Not queued',
@@ -572,6 +1362,8 @@ class TestTF2RichPresence(unittest.TestCase):
                                      'small_image': 'demoman',
                                      'small_text': 'Demoman'}})
         self.assertFalse(game_state_test.update_rpc)
+        self.assertEqual(game_state_test.snapshot(), game_state.GameStateSnapshot(False, 'koth_highpass', 'Demoman', 'Not queued', 'koth', False, 'Map: Highpass (hosting)', '',
+                                                                                  'Team Fortress'))
 
         settings.change('bottom_line', 'Class')
         game_state_test.set_bulk(console_log.ConsoleLogParsed(False, 'koth_highpass', 'Demoman', 'Not queued', True, 'Team Fortress'))
@@ -648,7 +1440,8 @@ class TestTF2RichPresence(unittest.TestCase):
                                      'large_text': 'Badlands (Arena) - TF2 Rich Presence {tf2rpvnum}',
                                      'small_image': 'engineer',
                                      'small_text': 'Engineer'}})
-        self.assertTrue(game_state_test.update_rpc)
+        self.assertFalse(game_state_test.update_rpc)
+        self.assertTrue(game_state_test.activity_shows_map_time)
 
     def test_gui(self):
         gui_test = gui.GUI(self.log)
@@ -853,15 +1646,85 @@ def fix_activity_dict(activity):
     return activity
 
 
-@utils.timeout(0.5)
-def slow_func(limit):
-    start_time = time.perf_counter()
+def wait_until(condition, timeout=5.0):
+    timeout_time = time.perf_counter() + timeout
 
-    while True:
-        time.sleep(0.2)
+    while time.perf_counter() < timeout_time:
+        if condition():
+            return True
+
+        time.sleep(0.01)
+
+    return False
+
+
+# pretends to be just enough of Discord's IPC server to accept handshakes and activities
+class FakeDiscordIPCServer:
+    def __init__(self, path):
+        self.path = path
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.servers = []
+        self.writers = set()
+        self.handshakes = 0
+        self.closes = 0
+        self.activities = []
+        self.pids = set()
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.serve(), self.loop).result(5)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.close_all)
+        self.thread.join(5)
 
-        if time.perf_counter() - start_time > limit:
-            break
+        if os.name != 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def drop_connections(self):
+        self.loop.call_soon_threadsafe(lambda: [writer.close() for writer in self.writers])
+
+    def close_all(self):
+        for server in self.servers:
+            server.close()
+
+        for writer in self.writers:
+            writer.close()
+
+        self.loop.stop()
+
+    async def serve(self):
+        if os.name == 'nt':
+            def protocol_factory():
+                return asyncio.StreamReaderProtocol(asyncio.StreamReader(), self.handle_client)
+
+            self.servers = await self.loop.start_serving_pipe(protocol_factory, self.path)
+        else:
+            self.servers = [await asyncio.start_unix_server(self.handle_client, self.path)]
+
+    async def handle_client(self, reader, writer):
+        self.writers.add(writer)
+
+        try:
+            while True:
+                opcode, payload = await discord_ipc.read_message(reader)
+
+                if opcode == discord_ipc.HANDSHAKE:
+                    self.handshakes += 1
+                    writer.write(discord_ipc.encode(discord_ipc.FRAME, {'cmd': 'DISPATCH', 'evt': 'READY', 'data': {'v': 1}}))
+                elif opcode == discord_ipc.FRAME:
+                    self.activities.append(payload['args']['activity'])
+                    self.pids.add(payload['args']['pid'])
+                    writer.write(discord_ipc.encode(discord_ipc.FRAME, {'cmd': payload['cmd'], 'data': payload['args']['activity'], 'evt': None, 'nonce': payload['nonce']}))
+                elif opcode == discord_ipc.CLOSE:
+                    self.closes += 1
+                    break
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
 
 
 if __name__ == '__main__':
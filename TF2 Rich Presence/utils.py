@@ -3,51 +3,261 @@
 # cython: language_level=3
 
 # note: don't import anything outside of the standard library, in order to avoid unreportable crashes when running the launcher
-import _thread
+import base64
+import contextlib
+import copy
 import functools
 import gzip
 import json
 import os
+import sqlite3
+import struct
 import threading
-from typing import Any, Callable, Dict, Optional, Union
+import time
+from typing import Dict, Iterator, Optional, Union
 
 
-# read from or write to DB.json (intentionally uncached)
-def access_db(write: dict = None, pass_permission_error: bool = True) -> Optional[Dict[str, Union[bool, list, str]]]:
-    db_path: str = db_json_path()
-    default_db: dict = {'tb_hashes': [],
-                        'error_hashes': [],
-                        'has_asked_language': False,
-                        'missing_localization': [],
-                        'available_version': '',
-                        'gui_position': [0, 0]}
-
-    if not os.path.isfile(db_path):
-        open(db_path, 'w').close()
-
+# read from or write to the DB (either the whole thing, or just the keys that are in write). force saves every key in write right away, even unchanged ones
+def access_db(write: dict = None, pass_permission_error: bool = True, force: bool = False) -> Optional[Dict[str, Union[bool, list, str]]]:
     if write:
         try:
-            with open(db_path, 'w', encoding='UTF8') as db_json:
-                db_data: dict = write
-                db_json.truncate(0)
-                json.dump(db_data, db_json, indent=4, ensure_ascii=False)
-        except UnicodeEncodeError:
-            pass
+            get_db().write(write, force=force)
         except PermissionError:
             if not pass_permission_error:
                 raise
-        except OSError as error:
-            if str(error) == 'No space left on device':
+        except sqlite3.OperationalError as error:
+            if 'disk is full' in str(error):
                 pass
             else:
                 raise
     else:
+        return get_db().read()
+
+
+# small persistent key-value store (each value being JSON) in DB.sqlite, with everything cached in memory. in WAL mode, so writes are atomic and don't rewrite anything else
+# replaces DB.json, which gets imported the first time
+class KeyValueDB:
+    def __init__(self, path: str, import_path: Optional[str] = None, timeout: float = 5):
+        self.path: str = path
+        self.import_path: Optional[str] = import_path
+        self.timeout: float = timeout  # how long to wait for another connection's lock
+        self.lock: threading.RLock = threading.RLock()
+        self.connection: Optional[sqlite3.Connection] = None
+        self.cache: Dict[str, Union[bool, list, str, dict]] = {}
+        self.cache_json: Dict[str, str] = {}  # as saved, for finding what's actually changed
+        self.data_version: Optional[int] = None
+        self.batches: threading.local = threading.local()  # per thread, so that a batch on the worker thread doesn't hold up writes from the GUI's
+        self.reads: int = 0
+        self.writes: int = 0
+
+    def __repr__(self) -> str:
+        return f"utils.KeyValueDB ({self.path}, {len(self.cache)} keys, {self.reads} reads, {self.writes} writes)"
+
+    def connect(self) -> sqlite3.Connection:
+        if not self.connection:
+            try:
+                self.connection = self.open()
+            except sqlite3.OperationalError:
+                raise  # locked, can't be opened, disk errors, etc. which don't mean that what's saved is bad
+            except sqlite3.DatabaseError:
+                # corrupted somehow, so start over
+                for broken_path in (self.path, f'{self.path}-wal', f'{self.path}-shm'):
+                    if os.path.isfile(broken_path):
+                        os.remove(broken_path)
+
+                self.connection = self.open()
+
+        return self.connection
+
+    def open(self) -> sqlite3.Connection:
+        connection: sqlite3.Connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            is_new: bool = connection.execute('SELECT COUNT(*) FROM kv').fetchone()[0] == 0
+        except sqlite3.DatabaseError:
+            connection.close()
+            raise
+
+        if is_new and self.import_path and os.path.isfile(self.import_path):
+            try:
+                with open(self.import_path, 'r', encoding='UTF8') as db_json:
+                    imported: dict = json.load(db_json)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                imported = {}
+
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.executemany('INSERT OR REPLACE INTO kv VALUES (?, ?)', [(key, json.dumps(value, ensure_ascii=False)) for key, value in imported.items()])
+
+        return connection
+
+    # only reloads from disk if another connection (probably another process) has written since last time
+    def refresh(self):
+        connection: sqlite3.Connection = self.connect()
+        data_version: int = connection.execute('PRAGMA data_version').fetchone()[0]
+
+        if data_version != self.data_version:
+            self.reads += 1
+            self.cache_json = dict(connection.execute('SELECT key, value FROM kv').fetchall())
+            self.cache = {key: json.loads(value) for key, value in self.cache_json.items()}
+            self.data_version = data_version
+
+    def read(self) -> Dict[str, Union[bool, list, str, dict]]:
+        with self.lock:
+            self.refresh()
+            db_data: dict = copy.deepcopy(db_defaults)
+            db_data.update(copy.deepcopy(self.cache))
+            db_data.update({key: json.loads(value_json) for key, value_json in getattr(self.batches, 'pending', {}).items()})  # in case refreshing dropped them from the cache
+            return db_data
+
+    # all the changed keys are saved in one transaction (or if in a batch on this thread, along with the rest of the batch). force means to save them right away, even if
+    # they haven't changed
+    def write(self, db_data: dict, force: bool = False):
+        with self.lock:
+            self.refresh()
+            changed: Dict[str, str] = {}
+
+            for key, value in db_data.items():
+                value_json: str = json.dumps(value, ensure_ascii=False)
+
+                if force or self.cache_json.get(key) != value_json:
+                    changed[key] = value_json
+
+            if not changed:
+                return
+
+            if getattr(self.batches, 'depth', 0) and not force:
+                self.batches.pending.update(changed)
+            else:
+                self.commit(changed)
+
+            self.cache_json.update(changed)
+            self.cache.update({key: json.loads(value_json) for key, value_json in changed.items()})
+
+    def commit(self, changed: Dict[str, str]):
+        try:
+            with self.connection:
+                self.connection.execute('BEGIN IMMEDIATE')
+                self.connection.executemany('INSERT OR REPLACE INTO kv VALUES (?, ?)', changed.items())
+        except sqlite3.OperationalError as error:
+            if 'readonly' in str(error):
+                raise PermissionError(str(error)) from error
+
+            raise
+
+        self.writes += 1
+
+    # writes from this thread are saved all at once, in one transaction, after everything in the with block is done. same as access_db(), permission errors and a full disk
+    # are ignored when saving them
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        if not getattr(self.batches, 'depth', 0):
+            self.batches.depth = 0
+            self.batches.pending = {}
+
+        self.batches.depth += 1
+
         try:
-            with open(db_path, 'r', encoding='UTF8') as db_json:
-                return json.load(db_json)
-        except json.JSONDecodeError:
-            access_db(write=default_db)
-            return default_db
+            yield
+        finally:
+            self.batches.depth -= 1
+
+            if self.batches.depth == 0 and self.batches.pending:
+                pending: Dict[str, str] = self.batches.pending
+                self.batches.pending = {}
+
+                try:
+                    with self.lock:
+                        self.connect()
+                        self.commit(pending)
+                except PermissionError:
+                    pass
+                except sqlite3.OperationalError as error:
+                    if 'disk is full' not in str(error):
+                        raise
+
+    def close(self):
+        with self.lock:
+            if self.connection:
+                self.connection.close()
+                self.connection = None
+                self.data_version = None
+
+
+# which errors have already been reported (by hash), so that each one is only reported once. a dict in memory, and in the DB as a sorted array of (hash, time reported) pairs packed into base64
+# entries expire after max_age seconds (so errors that come back much later get reported again), and only the newest max_entries are kept, so the DB doesn't grow forever
+class ReportedHashes:
+    ENTRY: struct.Struct = struct.Struct('<II')
+
+    def __init__(self, db_key: str, max_age: int = 90 * 86400, max_entries: int = 1000, db: Optional[KeyValueDB] = None):
+        self.db_key: str = db_key
+        self.db: KeyValueDB = db if db else get_db()
+        self.max_age: int = max_age
+        self.max_entries: int = max_entries
+        self.lock: threading.Lock = threading.Lock()
+        self.reported: Dict[int, int] = {}  # hash: unix time
+
+    def __repr__(self) -> str:
+        return f"utils.ReportedHashes ({self.db_key}, {len(self.reported)} reported)"
+
+    # returns whether it's new (and so should be reported), and remembers it if so
+    def add(self, report_hash: int) -> bool:
+        with self.lock:
+            if report_hash in self.reported:
+                return False
+
+            self.load()  # another process might have reported it
+
+            if report_hash in self.reported:
+                return False
+
+            self.reported[report_hash] = int(time.time())
+            self.save()
+            return True
+
+    def load(self):
+        try:
+            saved: Dict[int, int] = self.decode(self.db.read()[self.db_key])
+        except (sqlite3.Error, OSError, ValueError, struct.error):
+            return  # just in case the DB breaks, at least the ones reported this session are remembered
+
+        now: int = int(time.time())
+        self.reported.update({report_hash: reported_time for report_hash, reported_time in saved.items() if now - reported_time < self.max_age})
+
+    def save(self):
+        if len(self.reported) > self.max_entries:
+            self.reported = dict(sorted(self.reported.items(), key=lambda entry: entry[1])[-self.max_entries:])
+
+        try:
+            self.db.write({self.db_key: self.encode(self.reported)})
+        except (sqlite3.Error, OSError):
+            pass
+
+    @classmethod
+    def encode(cls, reported: Dict[int, int]) -> str:
+        return base64.b64encode(b''.join(cls.ENTRY.pack(report_hash, reported_time) for report_hash, reported_time in sorted(reported.items()))).decode('ASCII')
+
+    # also handles how it used to be saved, as a list of hashes (with no times, so they count as just reported)
+    @classmethod
+    def decode(cls, saved: Union[str, list]) -> Dict[int, int]:
+        if isinstance(saved, list):
+            now: int = int(time.time())
+            return {int(report_hash): now for report_hash in saved}
+
+        return dict(cls.ENTRY.iter_unpack(base64.b64decode(saved)))
+
+
+@functools.cache
+def reported_hashes(db_key: str) -> ReportedHashes:
+    return ReportedHashes(db_key)
+
+
+@functools.cache
+def get_db() -> KeyValueDB:
+    return KeyValueDB(os.path.join(os.path.dirname(db_json_path()), 'DB.sqlite'), import_path=db_json_path())
 
 
 @functools.cache
@@ -58,6 +268,16 @@ def db_json_path() -> str:
         return 'DB.json'
 
 
+db_defaults: Dict[str, Union[bool, list, str, dict]] = {'tb_hashes': '',
+                                                        'error_hashes': '',
+                                                        'has_asked_language': False,
+                                                        'missing_localization': [],
+                                                        'available_version': '',
+                                                        'gui_position': [0, 0],
+                                                        'localconfig_cache': {},
+                                                        'tf2_install_cache': {}}
+
+
 # get an API key
 @functools.cache
 def get_api_key(service: str) -> str:
@@ -66,20 +286,3 @@ def get_api_key(service: str) -> str:
                   b'\x08,1\xb1\xc0\x93\xb8\x8b;\xda\xe3\xdc_c\xbd\x9f\xe7\xf3\x98\xa7\xa96Q*- \xa2#j\xcb=/d\x16\x12\xfb\xa5\x90\xf7si\xe3\xdd\xa3\x19/\x84\x948{\x85/\xd5\xbai\x16B\xbe\xfd' \
                   b'\x90\xd7u\x9bhP\x0c\x18\x9a\x7fE\x18"\x01\xe9\x08\x01\x07\x92\xa0\x91\x84\xdc\xe7\x0b)\x81\xb1\xd4\xa7\x00\x00\x00'
     return json.loads(gzip.decompress(data))[service]
-
-
-# decorator to kill a synchronous function after some time
-def timeout(seconds: float):
-    def outer(func: Callable):
-        def inner(*args, **kwargs):
-            timer: threading.Timer = threading.Timer(seconds, _thread.interrupt_main)
-            timer.start()
-
-            try:
-                result: Any = func(*args, **kwargs)
-            finally:
-                timer.cancel()
-
-            return result
-        return inner
-    return outer